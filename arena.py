@@ -0,0 +1,338 @@
+""" 大人数の乱戦 (アリーナ) モード
+
+好きな広さのマップに数十〜数百人の AI を置き、個人戦 (teams=0) かチーム戦で最後の1チームまで戦わせる。
+エンジンの負荷試験用で、人は操作しない (見るだけ)。
+
+2人用の Match と違うところ:
+  - マスの占有表 (occ) で、いるマスと移動先のマスを押さえる。動き出すときに移動先を予約するので、
+    2人が同じマスへ入ることはない。
+  - 狙う相手は占有表を自分の周りから広げながら探す一番近い敵。探すのは考える番が来たときだけで、
+    全員が全員を調べることはない。
+  - 考える間隔 (think_threshold) の始まりを1人ずつずらしておくので、1フレームに考えるのは一部だけ。
+  - 弾の危険度マップはチームごとに1フレーム1回だけ作って、同じチームで共有する。
+    個人戦では全員で1枚を共有し、撃ったばかりの弾 (FRESH_TICKS 未満) は入れない
+    (自分の弾で自分のマスを危ないと思わないように)。
+  - 撃破されたキャラは演出が終わったら弾ごと消える。
+
+  python arena.py --agents 200 --size 48x27 --teams 4
+  python arena.py --agents 400 --size 64x36 --headless --ticks 2000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pygame as pg
+
+from assets import resolve_font
+from danger import DangerField
+from main_game import (AI, CHIP, FONT_CACHE, FONT_DIR, HIT_COLOR, MAX_CATCHUP_TICKS, MAX_LAG_MS,
+                       SURFACES, TICK_MS, VEC, ArenaLayer, BulletPool, ParticleSystem,
+                       apply_hits, warm_caches)
+from quality import TIERS, QualityGovernor
+from render import RenderQueue
+
+NAMES = ("霊夢", "魔理沙")   # 見た目と弾の種類はこの2人のどちらか
+IMAGES = {"霊夢": "reimu", "魔理沙": "marisa"}
+TEAM_COLORS = ((255, 80, 80), (255, 220, 60), (80, 160, 255), (90, 230, 120),
+               (220, 120, 255), (255, 160, 60), (80, 230, 230), (240, 240, 240))
+# アリーナの AI は AI_PARAMS をこれで上書きする (全員が SP を連発すると弾が増えすぎる)
+ARENA_PARAMS = {"sp_prob": 0.05, "sp_prob_awake": 0.1}
+FRESH_TICKS = 4   # 個人戦の共有の危険度マップに入れるのは、撃ってからこのフレーム数たった弾
+HUD_EVERY = 10    # HUD の文字を描き直す間隔 (フレーム)
+
+
+class ArenaAI(AI):
+  """ アリーナの1人。移動できるマスは占有表で、危険度マップはチームの共有のものを使う """
+  def __init__(self, arena, index, team, name, pos, img_path, hp, params=None):
+    color = pg.Color(TEAM_COLORS[team % len(TEAM_COLORS)])
+    super().__init__(name, pos, img_path, color, hp, arena.bullets,
+                     params={**ARENA_PARAMS, **(params or {})})
+    self.arena = arena
+    self.index = index
+    self.team = team
+    self.target = None
+    self.dest = None   # 動いている間の移動先のマス (占有表で予約している)
+
+  def sense_danger(self):
+    self.danger = self.arena.danger_for(self.team)
+
+  def can_enter(self, pos):
+    return self.arena.free(pos.x, pos.y)
+
+
+class Arena:
+  """ 大人数の試合の進行 (画面には依存しない)
+
+  size はマップの (横, 縦) マス数、teams=0 なら個人戦、2 以上ならその数のチームに分ける
+  (チームは初期配置の左から順に分けるので、味方どうしは近くから始まる)。
+  乱数は seed から作った random.Random だけを使うので、同じ seed なら同じ試合になる。
+  """
+  def __init__(self, agents=100, size=(32, 18), teams=0, seed=None, hp=10, params=None,
+               load_images=False):
+    self.cols, self.rows = map(int, size)
+    if agents > self.cols * self.rows:
+      raise ValueError(f"{self.cols}x{self.rows} のマップに {agents} 人は入りません")
+    self.seed = seed if seed is not None else random.randrange(2 ** 32)
+    self.rng = random.Random(self.seed)
+    self.bullets = BulletPool(size=(self.cols, self.rows))
+    self.occ = np.full((self.rows, self.cols), -1, np.int32)   # マス -> いる (向かっている) キャラの番号
+
+    cells = sorted(self.rng.sample(range(self.cols * self.rows), agents),
+                   key=lambda c: (c % self.cols, c // self.cols))
+    self.agents = []
+    for i, c in enumerate(cells):
+      team = i * teams // agents if teams else i
+      name = NAMES[team % 2] if teams else NAMES[i % 2]
+      img = f"./data/img/{IMAGES[name]}.png" if load_images else None
+      a = ArenaAI(self, i, team, name, (c % self.cols, c // self.cols), img, hp, params)
+      a.rng = self.rng
+      a.wait_timer = self.rng.randrange(a.param("think_threshold"))   # 考える番を散らす
+      self.bullets.register(a)   # owner の番号 = キャラの番号
+      self.occ[c // self.cols, c % self.cols] = i
+      self.agents.append(a)
+    self.team_of = np.array([a.team for a in self.agents], np.int32)
+    self.live = np.ones(agents, bool)   # HP が残っているか
+    self.active = list(self.agents)     # 撃破演出が終わっていないキャラ
+    self.ffa = not teams
+    self.fields = {}   # チーム (個人戦は None) -> (作ったフレーム, DangerField)
+    self.tick = 0
+    self.over = False
+    self.events = []   # このフレームの被弾 (defender, 当たった位置のピクセル座標)
+
+  @property
+  def winner(self):
+    """ 残ったチームの番号 (全滅なら None) """
+    teams = set(self.team_of[self.live].tolist())
+    return teams.pop() if len(teams) == 1 else None
+
+  def teams_alive(self):
+    """ チーム番号 -> 残っている人数 """
+    teams, counts = np.unique(self.team_of[self.live], return_counts=True)
+    return dict(zip(teams.tolist(), counts.tolist()))
+
+  def free(self, x, y):
+    """ マス (x, y) がマップの中で、誰もいない (向かっていない) か """
+    return 0 <= x < self.cols and 0 <= y < self.rows and self.occ[int(y), int(x)] < 0
+
+  def danger_for(self, team):
+    """ team から見た危険度マップ (このフレームでまだ作っていなければ作る) """
+    key = None if self.ffa else team
+    made, field = self.fields.get(key, (None, None))
+    if field is None: field = DangerField(self.cols, self.rows)
+    if made != self.tick:
+      b, n = self.bullets, self.bullets.count
+      if key is None: enemy = b.timer[:n] >= FRESH_TICKS
+      else: enemy = self.team_of[b.owner[:n]] != key
+      field.update(b.pos[:n][enemy], b.direction[:n][enemy], b.speed[:n][enemy],
+                   b.life_time[:n][enemy] - b.timer[:n][enemy])
+      self.fields[key] = (self.tick, field)
+    return field
+
+  def nearest_enemy(self, agent):
+    """ agent に一番近い敵 (いなければ None)
+
+    占有表を agent のマスの周り半径 r (1, 2, 4, ...) の範囲で探し、敵が見つかったら
+    その √2 倍の範囲 (それより近い敵が入りうる範囲) の中から一番近いものを選ぶ。
+    """
+    x, y = int(agent.pos.x), int(agent.pos.y)
+    r = 1
+    while True:
+      found = self._enemies_near(agent, x, y, r)
+      if found is not None:
+        ys, xs, ids = self._enemies_near(agent, x, y, int(math.ceil(r * math.sqrt(2))))
+        return self.agents[ids[np.argmin((xs - x) ** 2 + (ys - y) ** 2)]]
+      if r >= max(self.cols, self.rows): return None
+      r *= 2
+
+  def _enemies_near(self, agent, x, y, r):
+    """ (x, y) から半径 r (チェビシェフ距離) のマスにいる敵の (y, x, 番号)。いなければ None """
+    y0, x0 = max(y - r, 0), max(x - r, 0)
+    window = self.occ[y0:y + r + 1, x0:x + r + 1]
+    ys, xs = np.nonzero(window >= 0)
+    ids = window[ys, xs]
+    enemy = (self.team_of[ids] != agent.team) & self.live[ids]
+    if not enemy.any(): return None
+    return ys[enemy] + y0, xs[enemy] + x0, ids[enemy]
+
+  def step(self):
+    """ 1フレーム進めて、このフレームの被弾イベントを返す """
+    self.events = []
+    self.tick += 1
+    for a in self.active: a.prev_pixel = a.pixel_pos()
+
+    finished = []
+    for a in self.active:
+      if a.is_dying:
+        a.death_timer -= 1
+        if a.death_timer <= 0: finished.append(a)
+        continue
+      # 相手を探し直すのは、考える番が来たときと相手が倒れたときだけ
+      if (a.target is None or a.target.hp <= 0
+          or a.wait_timer + 1 >= a.param("think_threshold")):
+        a.target = self.nearest_enemy(a)
+      if a.target is not None:
+        a.think(a.target)
+        if a.dest is None and a.move_vec.length() > 0:
+          a.dest = a.pos + a.move_vec
+          self.occ[int(a.dest.y), int(a.dest.x)] = a.index   # 動き出したら移動先を予約
+      cell = VEC(a.pos)
+      a.update()
+      if a.dest is not None and a.pos == a.dest:
+        self.occ[int(cell.y), int(cell.x)] = -1   # 着いたら元のマスを空ける
+        a.dest = None
+      if a.invincible_timer > 0: a.invincible_timer -= 1
+    for a in finished: self._remove(a)
+
+    self.bullets.update()
+
+    defenders = [a for a in self.active if not a.is_dying]
+    hits = self.bullets.collide(defenders, self.team_of)
+    apply_hits(self.bullets, defenders, hits, self.events)
+    self.bullets.remove(np.concatenate(hits))
+    for defender, _ in self.events:
+      if defender.hp <= 0: self.live[defender.index] = False
+    if len(self.teams_alive()) <= 1: self.over = True
+    return self.events
+
+  def _remove(self, agent):
+    """ 撃破演出の終わったキャラをマップと弾から消す """
+    self.occ[self.occ == agent.index] = -1
+    self.bullets.clear(agent)
+    self.active.remove(agent)
+
+  def run(self, max_ticks=40 * 60 * 5):
+    while not self.over and self.tick < max_ticks:
+      self.step()
+    return self
+
+  def draw(self, screen, frame, alpha=1.0, tier=TIERS[0], queue=None):
+    """ キャラ (足元にチームの色と HP の帯) と全員の弾をまとめて描く
+
+    queue (RenderQueue) を渡すと、キャラと弾はそこに積むだけにする (帯は screen へすぐ描く)。
+    """
+    for a in self.active:
+      p = a.prev_pixel.lerp(a.pixel_pos(), alpha)
+      w = int((CHIP - 8) * a.hp / a.max_hp)
+      pg.draw.rect(screen, TEAM_COLORS[a.team % len(TEAM_COLORS)], (p.x + 4, p.y + CHIP - 6, w, 4))
+      a.draw(screen, frame, alpha, tier, with_bullets=False, queue=queue)
+    self.bullets.draw(screen, None, alpha, tier, queue)
+
+
+def play(arena, window=(1280, 720), quality="auto"):
+  """ アリーナを画面に表示して進める (ESC か閉じるボタンで終わる)
+
+  マップが窓より大きいときは、描いたマップを窓に合わせて縮小する。
+  更新は main() と同じく 40Hz 固定で、重いときは QualityGovernor が演出を間引く。
+  """
+  pg.display.init()
+  pg.font.init()
+  world_size = (arena.cols * CHIP, arena.rows * CHIP)
+  scale = min(window[0] / world_size[0], window[1] / world_size[1], 1)
+  view = (int(world_size[0] * scale), int(world_size[1] * scale))
+  screen = pg.display.set_mode(view)
+  pg.display.set_caption(f"アリーナ ({len(arena.agents)}人)")
+  world = SURFACES.new(world_size)
+  floor = ArenaLayer(size=(arena.cols, arena.rows))
+  warm_caches()
+  font = pg.font.Font(resolve_font(font_dir=FONT_DIR, cache_path=FONT_CACHE), 20)
+  particles = ParticleSystem()
+  particles.warm(HIT_COLOR)
+  queue = RenderQueue()
+  governor = QualityGovernor(TICK_MS, enabled=quality == "auto")
+  if quality != "auto": governor.level = [t.name for t in TIERS].index(quality)
+  clock = pg.time.Clock()
+
+  lag = 0
+  last_ms = pg.time.get_ticks()
+  step_ms = 0.0
+  hud, hud_age = None, HUD_EVERY
+  running = True
+  while running:
+    frame_start = time.perf_counter()
+    tier = governor.tier
+    for event in pg.event.get():
+      if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+        running = False
+
+    now_ms = pg.time.get_ticks()
+    lag = min(lag + now_ms - last_ms, MAX_LAG_MS)
+    last_ms = now_ms
+    ticks = 0
+    while lag >= TICK_MS and ticks < MAX_CATCHUP_TICKS:
+      lag -= TICK_MS
+      ticks += 1
+      if arena.over: continue
+      t = time.perf_counter()
+      for _, hit_pos in arena.step(): particles.emit(hit_pos, HIT_COLOR, tier.particles)
+      step_ms += ((time.perf_counter() - t) * 1000 - step_ms) * 0.1
+      particles.update()
+
+    floor.draw(world)
+    arena.draw(world, arena.tick // 2, min(lag / TICK_MS, 1.0), tier, queue)
+    particles.draw(world, queue)
+    queue.flush(world)
+    if scale < 1: pg.transform.scale(world, view, screen)
+    else: screen.blit(world, (0, 0))
+
+    alive = arena.teams_alive()
+    if arena.over:
+      winner = arena.winner
+      status = "全滅" if winner is None else f"チーム {winner} WIN"
+    else:
+      status = f"残り {sum(alive.values())}人 / {len(alive)}チーム"
+    # 数値が毎フレーム変わるので TEXT_CACHE には入れず、HUD_EVERY フレームごとに描き直す
+    hud_age += 1
+    if hud_age >= HUD_EVERY:
+      hud_age = 0
+      hud = SURFACES.track(font.render(
+          f"{status}  弾 {len(arena.bullets)}  更新 {step_ms:.1f} ms/tick  fps {clock.get_fps():.0f}"
+          f"  品質 {tier.name}  描画 {queue.calls}回/{queue.drawn}枚", True, 'WHITE'))
+    screen.blit(hud, (8, 8))
+    pg.display.flip()
+    governor.update((time.perf_counter() - frame_start) * 1000)
+    clock.tick()
+  pg.quit()
+
+
+def parse_size(text):
+  cols, _, rows = text.partition("x")
+  return int(cols), int(rows)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--agents", type=int, default=100)
+  parser.add_argument("--size", type=parse_size, default=(32, 18), metavar="COLSxROWS")
+  parser.add_argument("--teams", type=int, default=0, help="チーム数 (0 なら個人戦)")
+  parser.add_argument("--hp", type=int, default=10)
+  parser.add_argument("--seed", type=int)
+  parser.add_argument("--headless", action="store_true", help="画面なしで最速で回して結果を表示する")
+  parser.add_argument("--ticks", type=int, default=40 * 60 * 5, help="--headless で回す最大フレーム数")
+  parser.add_argument("--quality", choices=["auto", *(t.name for t in TIERS)], default="auto")
+  args = parser.parse_args()
+
+  if args.headless: os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+  arena = Arena(args.agents, args.size, args.teams, args.seed, args.hp,
+                load_images=not args.headless)
+  if not args.headless:
+    play(arena, quality=args.quality)
+    return
+  times = []
+  while not arena.over and arena.tick < args.ticks:
+    t = time.perf_counter()
+    arena.step()
+    times.append(time.perf_counter() - t)
+  ms = np.array(times) * 1000
+  result = "未決着" if not arena.over else ("全滅" if arena.winner is None else f"チーム {arena.winner} WIN")
+  print(f"seed={arena.seed} agents={args.agents} size={arena.cols}x{arena.rows} teams={args.teams}"
+        f" ticks={arena.tick} {result} (残り {int(arena.live.sum())}人)")
+  print(f"ms/tick p50 {np.percentile(ms, 50):.2f}  p99 {np.percentile(ms, 99):.2f}"
+        f"  max {ms.max():.2f}  ({arena.tick / max(ms.sum() / 1000, 1e-9):,.0f} ticks/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,183 @@
+""" 画像・フォントのアセット管理
+
+キャラのスプライトシートは1枚につき1回だけ読み込み、切り出して拡大したチップの組を
+同じシートを使うキャラ同士で共有する。画面 (set_mode) ができた後は表示形式に
+convert_alpha() しておくので、blit のたびのピクセル形式変換がなくなる。
+拡大済みのチップは SCALE ごとにディスクへキャッシュし、元画像の更新日時とサイズが
+変わっていなければ次回の起動ではそれを読むだけで済ませる。
+フォントも同梱のものを優先し、システムフォントを探した結果はディスクに覚えておく。
+"""
+import json
+import os
+import sys
+import time
+
+import pygame as pg
+
+CHIP_SRC = (24, 32)   # シート上の1コマの大きさ (px)
+SHEET_COLS = 3        # 1方向あたりのコマ数 (歩きアニメ)
+SHEET_ROWS = 4        # 向きの数 (上・右・下・左)
+CACHE_VERSION = 1
+
+
+class AssetManager:
+  def __init__(self, scale, cache_dir=None):
+    self.scale = scale
+    self.cache_dir = cache_dir
+    self.sheets = {}   # (絶対パス, scale) -> チップの組 [向き][コマ]
+    self.converted = set()   # 表示形式に変換済みの sheets のキー
+    self.stats = {"loaded": 0, "cache_hits": 0, "shared": 0}
+
+  def chip_size(self):
+    return int(CHIP_SRC[0] * self.scale), int(CHIP_SRC[1] * self.scale)
+
+  def chips(self, path):
+    """ path のシートを拡大したチップの組 (読めなければ None) """
+    key = (os.path.abspath(path), self.scale)
+    if key in self.sheets:
+      self.stats["shared"] += 1
+      return self.sheets[key]
+    try:
+      sheet = self._load_cached(path)
+      if sheet is None:
+        sheet = self._scale_sheet(pg.image.load(path))
+        self._save_cached(path, sheet)
+      else:
+        self.stats["cache_hits"] += 1
+    except (pg.error, OSError, ValueError) as e:
+      print(f"画像を読み込めません: {path} ({e})", file=sys.stderr)
+      self.sheets[key] = None
+      return None
+    self.stats["loaded"] += 1
+    self.sheets[key] = self._cut(sheet)
+    if display_ready(): self.convert_all()
+    return self.sheets[key]
+
+  def convert_all(self):
+    """ 画面ができる前に読んだチップを表示形式に変換する (set_mode の後に呼ぶ) """
+    for key, chips in self.sheets.items():
+      if chips and key not in self.converted:
+        self._convert(chips)
+        self.converted.add(key)
+
+  @staticmethod
+  def _convert(chips):
+    # 組のリストはキャラ間で共有しているので、中身を差し替えれば全員に反映される
+    for row in chips:
+      for j, img in enumerate(row):
+        row[j] = img.convert_alpha()
+
+  def _scale_sheet(self, raw):
+    """ 使う範囲 (3 x 4 コマ) を拡大した1枚のシート """
+    cw, ch = CHIP_SRC
+    area = raw.subsurface((0, 0, cw * SHEET_COLS, ch * SHEET_ROWS))
+    w, h = self.chip_size()
+    sheet = pg.Surface((w * SHEET_COLS, h * SHEET_ROWS), pg.SRCALPHA)
+    for i in range(SHEET_ROWS):
+      for j in range(SHEET_COLS):
+        chip = area.subsurface((cw * j, ch * i, cw, ch))
+        sheet.blit(pg.transform.scale(chip, (w, h)), (w * j, h * i))
+    return sheet
+
+  def _cut(self, sheet):
+    w, h = self.chip_size()
+    return [[sheet.subsurface((w * j, h * i, w, h)).copy() for j in range(SHEET_COLS)]
+            for i in range(SHEET_ROWS)]
+
+  # --- ディスクキャッシュ ---
+  def _cache_paths(self, path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(self.cache_dir, f"{name}-x{self.scale}")
+    return base + ".png", base + ".json"
+
+  def _source_info(self, path):
+    st = os.stat(path)
+    return {"version": CACHE_VERSION, "source": os.path.abspath(path),
+            "mtime_ns": st.st_mtime_ns, "size": st.st_size, "scale": self.scale}
+
+  def _load_cached(self, path):
+    if self.cache_dir is None: return None
+    png, meta = self._cache_paths(path)
+    try:
+      with open(meta, encoding="utf-8") as f:
+        if json.load(f) != self._source_info(path): return None
+      sheet = pg.image.load(png)
+    except (OSError, ValueError, pg.error):
+      return None   # キャッシュが無い・壊れている場合は元画像から作り直す
+    w, h = self.chip_size()
+    if sheet.get_size() != (w * SHEET_COLS, h * SHEET_ROWS): return None
+    return sheet
+
+  def _save_cached(self, path, sheet):
+    if self.cache_dir is None: return
+    png, meta = self._cache_paths(path)
+    try:
+      os.makedirs(self.cache_dir, exist_ok=True)
+      pg.image.save(sheet, png)
+      with open(meta, "w", encoding="utf-8") as f:
+        json.dump(self._source_info(path), f)
+    except (OSError, pg.error) as e:   # キャッシュが書けなくてもゲームは続ける
+      print(f"画像キャッシュを書けません: {png} ({e})", file=sys.stderr)
+
+
+def display_ready():
+  return pg.display.get_init() and pg.display.get_surface() is not None
+
+
+# --- フォント ---
+# 日本語を表示できるフォントの候補 (先にあるものを優先)
+FONT_NAMES = ("msgothic", "yugothic", "meiryo", "hiraginosans", "hiraginokakugothicpro",
+              "notosanscjkjp", "notosansjp", "ipagothic", "ipaexgothic", "takaogothic",
+              "vlgothic")
+FONT_EXTS = (".ttf", ".otf", ".ttc")
+FONT_RESCAN_SEC = 7 * 24 * 3600   # 見つからなかった結果を信じる期間
+
+
+def bundled_font(font_dir):
+  """ font_dir に同梱されたフォントファイル (無ければ None) """
+  try:
+    names = sorted(os.listdir(font_dir))
+  except OSError:
+    return None
+  for name in names:
+    if name.lower().endswith(FONT_EXTS):
+      return os.path.join(font_dir, name)
+  return None
+
+
+def resolve_font(names=FONT_NAMES, font_dir=None, cache_path=None, now=None):
+  """ 使うフォントファイルのパス (見つからなければ None = pygame の既定フォント)
+
+  同梱フォント -> ディスクキャッシュ -> システムフォントの検索 の順に探す。
+  システムフォントの一覧作りは遅い (Linux では fc-list を呼ぶ) ので、結果をキャッシュしておく。
+  """
+  path = bundled_font(font_dir) if font_dir else None
+  if path: return path
+
+  now = time.time() if now is None else now
+  key = f"{sys.platform}:{','.join(names)}"
+  cache = {}
+  if cache_path:
+    try:
+      with open(cache_path, encoding="utf-8") as f:
+        cache = json.load(f)
+      hit = cache.get(key)
+      if hit is not None:
+        if hit["path"] and os.path.exists(hit["path"]): return hit["path"]
+        if not hit["path"] and now - hit["checked"] < FONT_RESCAN_SEC: return None
+    except (OSError, ValueError, KeyError, TypeError):
+      cache = {}
+
+  path = None
+  for name in names:
+    path = pg.font.match_font(name)
+    if path: break
+  if cache_path:
+    cache[key] = {"path": path, "checked": now}
+    try:
+      os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+      with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    except OSError as e:
+      print(f"フォントキャッシュを書けません: {cache_path} ({e})", file=sys.stderr)
+  return path
@@ -0,0 +1,60 @@
+""" アリーナ (大人数の乱戦) の1フレームの処理時間のベンチマーク
+
+人数を変えて Arena を回し、1フレームの処理時間の p50 / p99 と1人あたりの時間を表示する。
+マップの広さは人数に合わせて (1人あたりのマス数を一定に) 広げる。
+p99 が1フレームの時間 (TICK_MS) を超えたら失敗する。
+
+  python -m benchmarks.arena --agents 25 50 100 200 400 --ticks 600
+  python -m benchmarks.arena --agents 200 --teams 4
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from arena import Arena
+from main_game import TICK_MS
+
+
+def measure(agents, teams, ticks, cells_per_agent, seed):
+  """ (マップの大きさ, フレームごとの時間の配列, 終了時の弾数) """
+  rows = max(int(math.sqrt(agents * cells_per_agent * 9 / 16)), 4)
+  cols = max(int(agents * cells_per_agent / rows), 4)
+  arena = Arena(agents, (cols, rows), teams, seed, hp=10 ** 6)   # 途中で決着しないように
+  times = np.zeros(ticks)
+  for i in range(ticks):
+    t = time.perf_counter()
+    arena.step()
+    times[i] = time.perf_counter() - t
+  return (cols, rows), times * 1000, len(arena.bullets)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--agents", type=int, nargs="+", default=[25, 50, 100, 200, 400])
+  parser.add_argument("--teams", type=int, default=0)
+  parser.add_argument("--ticks", type=int, default=600)
+  parser.add_argument("--cells", type=float, default=5, help="1人あたりのマス数")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  print(f"{'agents':>6} {'map':>7} {'bullets':>7}  {'p50':>6} {'p99':>6} ms/tick  {'us/agent':>8}")
+  slow = []
+  for n in args.agents:
+    (cols, rows), ms, bullets = measure(n, args.teams, args.ticks, args.cells, args.seed)
+    p50, p99 = np.percentile(ms, (50, 99))
+    print(f"{n:>6} {f'{cols}x{rows}':>7} {bullets:>7}  {p50:>6.2f} {p99:>6.2f}          "
+          f"{ms.mean() / n * 1000:>8.1f}")
+    if p99 > TICK_MS: slow.append(n)
+  if slow:
+    print(f"p99 over {TICK_MS} ms: {slow}", file=sys.stderr)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
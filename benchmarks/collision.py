@@ -0,0 +1,95 @@
+""" 弾とキャラの当たり判定のマイクロベンチマーク
+
+弾1発ごとに pg.Rect を作る従来の判定、キャラごとに全弾を配列演算で調べる判定、
+BulletPool.collide の総当たり (grid=False) と空間ハッシュ (grid=True) で、1回の判定パスに
+かかる時間を比べる。auto は collide が引数なしのときに選ぶほう (BulletPool.use_grid)。
+
+  python -m benchmarks.collision --bullets 1000 10000 --defenders 2 16
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame as pg
+
+from main_game import BT_N, BT_STAR, MAP_SIZE, BulletPool, Char
+
+
+def rect_pass(pool, defenders):
+  """ 旧 main() と同じく、弾ごと・キャラごとに Rect を作って colliderect """
+  left, top, size = pool.rects()
+  out = []
+  for d in defenders:
+    me = pool.register(d)
+    hit = [i for i in range(pool.count)
+           if pool.owner[i] != me and pg.Rect(left[i], top[i], size[i], size[i]).colliderect(d.get_hitbox())]
+    out.append(hit)
+  return out
+
+
+def brute_pass(pool, defenders):
+  """ 全弾 x 全キャラを配列演算で判定 (ブロードフェーズなし) """
+  left, top, size = pool.rects()
+  out = []
+  for d in defenders:
+    box = d.get_hitbox()
+    touch = ((left < box.right) & (box.left < left + size) &
+             (top < box.bottom) & (box.top < top + size) &
+             (pool.owner[:pool.count] != pool.register(d)))
+    out.append(np.flatnonzero(touch))
+  return out
+
+
+def setup(n_bullets, n_defenders, rng):
+  pool = BulletPool()
+  defenders = [Char(f"c{i}", (rng.randrange(int(MAP_SIZE.x)), rng.randrange(int(MAP_SIZE.y))),
+                    None, pg.Color('WHITE'), 10, pool) for i in range(n_defenders)]
+  for _ in range(n_bullets):
+    owner = rng.choice(defenders)
+    pos = (rng.uniform(-1, MAP_SIZE.x + 1), rng.uniform(-1, MAP_SIZE.y + 1))
+    pool.spawn(pos, [(rng.uniform(-1, 1), rng.uniform(-1, 1))], owner, rng.choice((BT_N, BT_STAR)))
+  return pool, defenders
+
+
+def measure(fn, repeat):
+  best = float("inf")
+  for _ in range(repeat):
+    t = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t)
+  return best * 1000
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--bullets", type=int, nargs="+", default=[1000, 10000])
+  parser.add_argument("--defenders", type=int, nargs="+", default=[2, 16])
+  parser.add_argument("--repeat", type=int, default=5)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  rng = random.Random(args.seed)
+  print(f"{'bullets':>8} {'defenders':>9} {'rect ms':>9} {'brute ms':>9} {'pairs ms':>9} "
+        f"{'grid ms':>9}  auto")
+  for n in args.bullets:
+    for k in args.defenders:
+      pool, defenders = setup(n, k, rng)
+      expect = [sorted(h) for h in brute_pass(pool, defenders)]
+      pairs, grid = pool.collide(defenders, grid=False), pool.collide(defenders, grid=True)
+      assert all(np.array_equal(a, b) for a, b in zip(pairs, grid))
+      # 複数人に触れている弾は先の1人にだけ数えるので、和集合で比べる
+      assert sorted(np.concatenate(grid)) == sorted(set(np.concatenate(expect).tolist()))
+      rect_ms = measure(lambda: rect_pass(pool, defenders), 1 if n * k > 50000 else args.repeat)
+      brute_ms = measure(lambda: brute_pass(pool, defenders), args.repeat)
+      pairs_ms = measure(lambda: pool.collide(defenders, grid=False), args.repeat)
+      grid_ms = measure(lambda: pool.collide(defenders, grid=True), args.repeat)
+      auto = "grid" if pool.use_grid(k) else "pairs"
+      print(f"{n:>8} {k:>9} {rect_ms:>9.3f} {brute_ms:>9.3f} {pairs_ms:>9.3f} {grid_ms:>9.3f}  {auto}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,80 @@
+""" 弾の危険度マップ (DangerField) の更新時間のベンチマーク
+
+scenarios の amulets シナリオ (霊夢のお札を常に n 発飛ばしておく) を回しながら、
+魔理沙から見た危険度マップの更新 (BulletPool.incoming + DangerField.update) を毎フレーム計る。
+p95 が1フレームの時間 (TICK_MS) の --budget 割を超えたら失敗する。
+--check では弾 x 時刻 x マスを素直にループする実装と結果が一致するかも確かめる。
+
+  python -m benchmarks.danger --bullets 1000 5000 10000 --budget 0.25
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from benchmarks.scenarios import Amulets
+from main_game import MAP_SIZE, TICK_MS
+
+
+def reference(field, pos, direction, speed, remaining):
+  """ 弾1発ずつ・時刻ごとにマスを調べる素直な実装 (結果の確認用) """
+  eta = np.full((field.rows, field.cols), field.safe, np.int32)
+  for p, d, s, r in zip(pos, direction, speed, remaining):
+    for t in range(min(int(r), field.horizon) + 1):
+      x = math.floor(np.float32(p[0] + field.pad) + np.float32(d[0] * s) * np.float32(t)) - field.pad
+      y = math.floor(np.float32(p[1] + field.pad) + np.float32(d[1] * s) * np.float32(t)) - field.pad
+      if 0 <= x < field.cols and 0 <= y < field.rows:
+        eta[y, x] = min(eta[y, x], t)
+  return eta
+
+
+def measure(n, ticks, check):
+  """ 1フレームあたりの更新時間 (ミリ秒) の中央値・p95 と、1フレーム全体の時間 """
+  sc = Amulets(n)
+  marisa, bullets = sc.match.marisa, sc.match.bullets
+  field = marisa.danger
+  update, total = np.zeros(ticks), np.zeros(ticks)
+  for i in range(ticks):
+    t = time.perf_counter()
+    sc.tick()
+    total[i] = time.perf_counter() - t
+    t = time.perf_counter()
+    incoming = bullets.incoming(marisa)
+    field.update(*incoming)
+    update[i] = time.perf_counter() - t
+    if check and i % 20 == 0:
+      assert (reference(field, *incoming) == field.eta).all(), f"{n} 発 / {i} フレーム目で結果が違う"
+  return {"p50_ms": float(np.median(update)) * 1000,
+          "p95_ms": float(np.percentile(update, 95)) * 1000,
+          "tick_ms": float(np.median(total)) * 1000}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--bullets", type=int, nargs="+", default=[100, 1000, 2000, 5000, 10000])
+  parser.add_argument("--ticks", type=int, default=200)
+  parser.add_argument("--budget", type=float, default=0.25,
+                      help="p95 がフレーム時間のこの割合を超えたら失敗")
+  parser.add_argument("--check", action="store_true", help="素直な実装と結果を比べる (遅い)")
+  args = parser.parse_args()
+
+  print(f"map {int(MAP_SIZE.x)}x{int(MAP_SIZE.y)}, tick {TICK_MS} ms, budget {args.budget:.0%}")
+  over = []
+  for n in args.bullets:
+    r = measure(n, args.ticks, args.check)
+    share = r["p95_ms"] / TICK_MS
+    print(f"{n:>6} bullets: update p50 {r['p50_ms']:6.3f} ms  p95 {r['p95_ms']:6.3f} ms "
+          f"({share:5.1%} of tick)  whole tick {r['tick_ms']:7.3f} ms")
+    if share > args.budget: over.append(n)
+  if over:
+    print(f"budget exceeded at {over} bullets", file=sys.stderr)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
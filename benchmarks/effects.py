@@ -0,0 +1,83 @@
+""" 演出の Surface 確保数のチェック
+
+覚醒した魔理沙との PLAY 画面と OVER 画面を main() と同じ手順で描き、
+ウォームアップ後の1フレームあたりの Surface 確保数 (SurfaceCounter) と描画時間を表示する。
+定常状態で確保が 0 でなければ失敗する。
+
+  python -m benchmarks.effects --frames 200
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame as pg
+
+from main_game import (EFFECTS, HIT_COLOR, SCREEN_H, SCREEN_W, SURFACES, ArenaLayer, Match,
+                       ParticleSystem, TEXT_CACHE, draw_neon_text, warm_caches)
+
+
+def play_frame(screen, world, arena, match, particles, font, frame):
+  match.step(0)
+  for _, hit_pos in match.events: particles.emit(hit_pos, HIT_COLOR, 5)
+  arena.draw(world)
+  for char in (match.reimu, match.marisa): char.draw(world, frame)
+  particles.update()
+  particles.draw(world)
+  screen.blit(world, (0, 0))
+  screen.blit(TEXT_CACHE.render(font, match.reimu.name, pg.Color('RED')), (10, 30))
+  screen.blit(TEXT_CACHE.render(font, match.marisa.name, pg.Color('yellow')), (SCREEN_W - 80, 30))
+
+
+def over_frame(screen, world, arena, match, particles, font, frame):
+  arena.draw(world)
+  for char in (match.reimu, match.marisa): char.draw(world, frame)
+  screen.blit(world, (0, 0))
+  screen.blit(EFFECTS.overlay(screen.get_size(), alpha=150), (0, 0))
+  draw_neon_text(screen, font, f"{match.winner} WIN!", pg.Color('yellow'),
+                 (SCREEN_W // 2, SCREEN_H // 2 - 40))
+  if (frame // 10) % 2 == 0:
+    draw_neon_text(screen, font, "スペースキーでタイトルへ戻る", pg.Color('WHITE'),
+                   (SCREEN_W // 2, SCREEN_H // 2 + 60))
+
+
+def run(name, draw, frames, warmup, *args):
+  for f in range(warmup): draw(*args, f)
+  before = SURFACES.total
+  t = time.perf_counter()
+  for f in range(warmup, warmup + frames): draw(*args, f)
+  elapsed = time.perf_counter() - t
+  allocs = SURFACES.total - before
+  print(f"{name:<5}: {allocs / frames:.2f} surfaces/frame, {elapsed / frames * 1000:.3f} ms/frame")
+  return allocs
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--frames", type=int, default=200)
+  parser.add_argument("--warmup", type=int, default=40)
+  args = parser.parse_args()
+
+  pg.init()
+  screen = pg.display.set_mode((SCREEN_W, SCREEN_H))
+  world = pg.Surface((SCREEN_W, SCREEN_H))
+  font = pg.font.SysFont("msgothic", 25)
+  arena = ArenaLayer()
+  match = Match(seed=0, load_images=False, reimu_ai=True)
+  match.marisa.hp = match.marisa.max_hp // 2   # 覚醒させてオーラを出す
+  particles = ParticleSystem()
+  warm_caches()   # main() と同じく起動時にキャッシュを作る
+  particles.warm(HIT_COLOR)
+
+  allocs = run("PLAY", play_frame, args.frames, args.warmup,
+               screen, world, arena, match, particles, font)
+  allocs += run("OVER", over_frame, args.frames, args.warmup,
+                screen, world, arena, match, particles, font)
+  pg.quit()
+  if allocs:
+    raise SystemExit("定常状態のフレームで Surface が確保されている")
+
+
+if __name__ == "__main__":
+  main()
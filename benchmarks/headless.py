@@ -0,0 +1,45 @@
+""" 画面なしで AI 同士の試合を回すベンチマーク
+
+Match を seed 0.. で順に最後まで進め、1秒あたりのフレーム数と勝敗を表示する。
+同じ seed を2回回して結果が一致するか (決定的か) も確かめる。
+
+  python -m benchmarks.headless --matches 20
+"""
+import argparse
+import collections
+import os
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from main_game import Match
+
+
+def play(seed, max_ticks):
+  m = Match(seed, load_images=False, reimu_ai=True).run(max_ticks)
+  return m.winner, m.tick, m.reimu.hp, m.marisa.hp
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--matches", type=int, default=20)
+  parser.add_argument("--max-ticks", type=int, default=40 * 60 * 5)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  seeds = range(args.seed, args.seed + args.matches)
+  t = time.perf_counter()
+  results = [play(s, args.max_ticks) for s in seeds]
+  elapsed = time.perf_counter() - t
+  ticks = sum(r[1] for r in results)
+
+  assert play(seeds[0], args.max_ticks) == results[0], "同じ seed で結果が変わった"
+  wins = collections.Counter(r[0] for r in results)
+  print(f"{args.matches} matches, {ticks} ticks in {elapsed:.2f} s "
+        f"({ticks / elapsed:,.0f} ticks/s)")
+  for name, n in wins.most_common():
+    print(f"  {name}: {n} wins")
+
+
+if __name__ == "__main__":
+  main()
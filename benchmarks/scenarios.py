@@ -0,0 +1,228 @@
+""" 負荷シナリオのベンチマーク (SDL のダミードライバで実行)
+
+名前付きのシナリオを Char / AI / BulletPool に直接組み立て、決まったフレーム数だけ
+「更新のみ」と「更新 + 描画」を回して1フレームあたりの時間を計る。結果は JSON で出力し、
+保存しておいたベースラインと比べて閾値より遅くなっていれば失敗する。
+
+  python -m benchmarks.scenarios --ticks 400 --out bench.json
+  python -m benchmarks.scenarios --baseline bench.json --threshold 0.2
+  python -m benchmarks.scenarios --only amulets_5000 marisa_stars
+  python -m benchmarks.scenarios --only spell_card --quality minimal   # 品質を落としたときの描画
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame as pg
+
+from main_game import (BT_AMULET, HIT_COLOR, IN_SHOT, MAP_SIZE, PATTERNS, SCREEN_H, SCREEN_W,
+                       TEXT_CACHE, TIERS, VEC, ArenaLayer, Match, ParticleSystem, RenderQueue,
+                       warm_caches)
+
+IDLE = {"think_threshold": 10 ** 9, "think_threshold_awake": 10 ** 9}   # 考えない AI
+AWAKE = {**IDLE, "awaken_hp": 2.0}                                      # 常に覚醒
+TOUGH_HP = 10 ** 6   # 途中で決着しないように
+
+
+class Scenario:
+  """ 1つのシナリオの状態 (Match と、毎フレーム追加で行う処理) """
+  def __init__(self, marisa_params=IDLE, inputs=0, seed=0):
+    self.match = Match(seed, load_images=False, marisa_params=marisa_params)
+    for char in (self.match.reimu, self.match.marisa):
+      char.hp = char.max_hp = TOUGH_HP
+    self.inputs = inputs
+    self.particles = ParticleSystem()
+    self.shake = False
+    self.rng = np.random.default_rng(seed)
+
+  def before(self):
+    """ match.step の前に毎フレーム行う処理 (シナリオごとに上書き) """
+
+  def tick(self):
+    self.before()
+    for _, hit_pos in self.match.step(self.inputs):
+      self.particles.emit(hit_pos, HIT_COLOR, 5)
+    self.particles.update()
+
+
+class ReimuFire(Scenario):
+  """ 霊夢が魔理沙のほうを向いて通常弾を撃ち続ける """
+  def __init__(self):
+    super().__init__(inputs=IN_SHOT)
+    self.match.reimu.dir = 1
+
+
+class MarisaStars(Scenario):
+  """ 覚醒した魔理沙が毎フレーム星弾を撃つ """
+  def __init__(self):
+    super().__init__(marisa_params=AWAKE)
+
+  def before(self):
+    m = self.match
+    m.marisa.cool_time = 0
+    m.marisa.shoot(VEC(-1, 0), m.reimu, "S")
+
+
+class Amulets(Scenario):
+  """ 魔理沙を追うホーミングのお札を常に n 発飛ばしておく """
+  def __init__(self, n):
+    super().__init__()
+    self.n = n
+    self.before()
+
+  def before(self):
+    m = self.match
+    k = self.n - len(m.bullets)
+    if k <= 0: return
+    pos = self.rng.uniform((0, 0), (MAP_SIZE.x, MAP_SIZE.y), (k, 2))
+    d = self.rng.uniform(-1, 1, (k, 2))
+    m.bullets.spawn(pos, d, m.reimu, BT_AMULET, m.marisa)
+
+
+class SpellCard(Scenario):
+  """ 魔理沙がマップ中央からパターン name (数百発の弾幕) を cooldown ごとに撃つ """
+  def __init__(self, name="spell_card"):
+    super().__init__()
+    self.pattern = PATTERNS.get(name)
+    self.match.marisa.pos = VEC(MAP_SIZE.x // 2, MAP_SIZE.y // 2)
+    self.wait = 0
+
+  def before(self):
+    m = self.match
+    if self.wait > 0:
+      self.wait -= 1
+      return
+    m.marisa.fire(self.pattern, VEC(-1, 0), m.reimu)
+    self.wait = self.pattern.cooldown
+
+
+class ParticleStorm(Scenario):
+  """ 画面シェイク中に毎フレーム大量の火花を出す """
+  def __init__(self):
+    super().__init__()
+    self.shake = True
+
+  def before(self):
+    for p in self.rng.uniform((0, 0), (SCREEN_W, SCREEN_H), (40, 2)):
+      self.particles.emit(p, HIT_COLOR, 5)
+
+
+SCENARIOS = {
+    "idle": lambda: Scenario(),
+    "reimu_fire": ReimuFire,
+    "marisa_stars": MarisaStars,
+    "amulets_500": lambda: Amulets(500),
+    "amulets_5000": lambda: Amulets(5000),
+    "particle_storm": ParticleStorm,
+    "spell_card": SpellCard,
+}
+
+
+class Renderer:
+  """ main() の PLAY 画面と同じ手順で描く (tier は品質の段) """
+  def __init__(self, tier=TIERS[0]):
+    self.tier = tier
+    self.screen = pg.display.set_mode((SCREEN_W, SCREEN_H))
+    self.world = pg.Surface((SCREEN_W, SCREEN_H))
+    self.arena = ArenaLayer()
+    self.font = pg.font.SysFont("msgothic", 25)
+    self.rng = random.Random(0)
+    self.queue = RenderQueue()
+    warm_caches()
+
+  def draw(self, sc):
+    m = sc.match
+    frame = m.tick // 2
+    self.arena.draw(self.world)
+    for char in (m.reimu, m.marisa): char.draw(self.world, frame, tier=self.tier, queue=self.queue)
+    sc.particles.draw(self.world, self.queue)
+    self.queue.flush(self.world)
+    shake = sc.shake and self.tier.shake
+    offset = (self.rng.randint(-4, 4), self.rng.randint(-4, 4)) if shake else (0, 0)
+    self.screen.fill((0, 0, 0))
+    self.screen.blit(self.world, offset)
+    pg.draw.rect(self.screen, 'RED', (10, 10, 200, 15))
+    self.screen.blit(TEXT_CACHE.render(self.font, m.reimu.name, 'RED'), (10, 30))
+    self.screen.blit(TEXT_CACHE.render(self.font, m.marisa.name, 'YELLOW'), (SCREEN_W - 80, 30))
+    pg.display.flip()
+
+
+def measure(make, ticks, warmup, renderer=None):
+  """ 1フレームあたりの時間 (ミリ秒) の平均・p95 と、終了時の弾数 """
+  sc = make()
+  for _ in range(warmup):
+    sc.tick()
+    if renderer: renderer.draw(sc)
+  times = np.zeros(ticks)
+  for i in range(ticks):
+    t = time.perf_counter()
+    sc.tick()
+    if renderer: renderer.draw(sc)
+    times[i] = time.perf_counter() - t
+  return {"mean_ms": round(times.mean() * 1000, 4),
+          "p95_ms": round(float(np.percentile(times, 95)) * 1000, 4),
+          "bullets": len(sc.match.bullets), "particles": len(sc.particles)}
+
+
+def compare(results, baseline, threshold):
+  """ ベースラインより threshold (割合) 以上遅くなった項目のリスト """
+  bad = []
+  for name, res in results.items():
+    base = baseline.get(name)
+    if not base: continue
+    for mode in ("sim", "render"):
+      new, old = res[mode]["mean_ms"], base[mode]["mean_ms"]
+      if old > 0 and new > old * (1 + threshold):
+        bad.append(f"{name}/{mode}: {old:.3f} -> {new:.3f} ms (+{new / old - 1:.0%})")
+  return bad
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--only", nargs="+", choices=SCENARIOS, help="回すシナリオ")
+  parser.add_argument("--ticks", type=int, default=400)
+  parser.add_argument("--warmup", type=int, default=40)
+  parser.add_argument("--out", help="結果の JSON を書き出すファイル")
+  parser.add_argument("--baseline", help="比較するベースラインの JSON")
+  parser.add_argument("--threshold", type=float, default=0.2,
+                      help="この割合を超えて遅くなったら失敗 (0.2 = 20%%)")
+  parser.add_argument("--quality", choices=[t.name for t in TIERS], default=TIERS[0].name,
+                      help="描画の品質の段 (main() の QualityGovernor が選ぶもの)")
+  args = parser.parse_args()
+
+  pg.display.init()
+  pg.font.init()
+  renderer = Renderer(next(t for t in TIERS if t.name == args.quality))
+  results = {}
+  for name in args.only or SCENARIOS:
+    make = SCENARIOS[name]
+    results[name] = {"sim": measure(make, args.ticks, args.warmup),
+                     "render": measure(make, args.ticks, args.warmup, renderer)}
+    print(f"{name:<15} sim {results[name]['sim']['mean_ms']:8.3f} ms  "
+          f"sim+render {results[name]['render']['mean_ms']:8.3f} ms  "
+          f"bullets {results[name]['sim']['bullets']}", file=sys.stderr)
+  pg.quit()
+
+  report = {"ticks": args.ticks, "quality": args.quality, "scenarios": results}
+  text = json.dumps(report, indent=2, ensure_ascii=False)
+  if args.out:
+    with open(args.out, "w", encoding="utf-8") as f: f.write(text + "\n")
+  else:
+    print(text)
+
+  if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+      baseline = json.load(f)["scenarios"]
+    bad = compare(results, baseline, args.threshold)
+    for line in bad: print("REGRESSION " + line, file=sys.stderr)
+    if bad: sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
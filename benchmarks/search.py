@@ -0,0 +1,71 @@
+""" 先読み AI (SearchAI) の強さと処理時間のベンチマーク
+
+従来の AI の霊夢を相手に、難易度ごとの魔理沙で試合を回す。難易度ごとに、
+与えた・受けたダメージと勝敗、1フレームの処理時間 (match.step) の p50 / p99 / 最大を表示する。
+--realtime で SearchAI を実時間の持ち時間で考えさせる (ゲーム本体と同じ。結果は毎回少し変わる)。
+p99 が1フレームの時間 (TICK_MS) を超えたら失敗する。
+
+  python -m benchmarks.search --matches 4 --max-ticks 2000 --realtime
+  python -m benchmarks.search --levels classic hard
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from main_game import SEARCH_LEVELS, TICK_MS, Match
+
+
+def play(level, seed, max_ticks, realtime):
+  """ 1試合分の (与えたダメージ, 受けたダメージ, 勝者 (未決着なら None), フレームごとの時間) """
+  m = Match(seed, load_images=False, reimu_ai=True,
+            marisa_level=None if level == "classic" else level, realtime=realtime)
+  times = []
+  while not m.over and m.tick < max_ticks:
+    t = time.perf_counter()
+    m.step()
+    times.append(time.perf_counter() - t)
+  return (m.reimu.max_hp - m.reimu.hp, m.marisa.max_hp - m.marisa.hp,
+          m.winner if m.over else None, times)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--levels", nargs="+", choices=["classic", *SEARCH_LEVELS],
+                      default=["classic", *SEARCH_LEVELS])
+  parser.add_argument("--matches", type=int, default=4)
+  parser.add_argument("--max-ticks", type=int, default=40 * 60)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--realtime", action="store_true",
+                      help="実時間の持ち時間で考える (指定しなければ展開数で考える)")
+  args = parser.parse_args()
+
+  print(f"{'level':<8} {'dealt':>5} {'taken':>5} {'ratio':>5} {'W-L-D':>7}"
+        f"  {'p50':>6} {'p99':>6} {'max':>6} ms/tick")
+  slow = []
+  for level in args.levels:
+    dealt = taken = 0
+    wins = {"魔理沙": 0, "霊夢": 0, None: 0}
+    times = []
+    for seed in range(args.seed, args.seed + args.matches):
+      d, k, winner, t = play(level, seed, args.max_ticks, args.realtime)
+      dealt += d
+      taken += k
+      wins[winner] += 1
+      times += t
+    ms = np.array(times) * 1000
+    p50, p99 = np.percentile(ms, (50, 99))
+    print(f"{level:<8} {dealt:>5} {taken:>5} {dealt / max(taken, 1):>5.2f} "
+          f"{wins['魔理沙']:>2}-{wins['霊夢']}-{wins[None]}  {p50:>6.2f} {p99:>6.2f} {ms.max():>6.2f}")
+    if p99 > TICK_MS: slow.append(level)
+  if slow:
+    print(f"p99 over {TICK_MS} ms: {slow}", file=sys.stderr)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
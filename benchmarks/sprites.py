@@ -0,0 +1,78 @@
+""" 弾スプライト描画のベンチマーク
+
+毎フレーム Surface を作って回転する従来の描画と、回転済みアトラス (SpriteAtlas) からの
+blit を比べ、弾1発あたりの描画時間を表示する。
+
+  python -m benchmarks.sprites --bullets 2000 --steps 64 128
+"""
+import argparse
+import math
+import os
+import random
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame as pg
+
+from main_game import SCREEN_W, SCREEN_H, SpriteAtlas, make_amulet_surf, make_reimu_shot_surf
+
+
+def legacy_draw(screen, key, center, angle):
+  """ 旧 Bullet.draw と同じく、毎回 Surface を作って回転する """
+  if key == "Amulet":
+    surf = pg.Surface((20, 10), pg.SRCALPHA)
+    pg.draw.rect(surf, pg.Color('RED'), (0, 0, 20, 10))
+    pg.draw.rect(surf, pg.Color('WHITE'), (4, 2, 12, 6))
+    pg.draw.rect(surf, pg.Color('PINK'), (5, 3, 10, 8))
+  else:
+    surf = pg.Surface((16, 8), pg.SRCALPHA)
+    pg.draw.rect(surf, pg.Color('RED'), (0, 0, 16, 8))
+    pg.draw.rect(surf, pg.Color('WHITE'), (2, 2, 12, 4))
+  rotated = pg.transform.rotate(surf, angle)
+  screen.blit(rotated, rotated.get_rect(center=center))
+
+
+def measure(draw, screen, bullets, repeat):
+  """ 弾1発あたりの平均時間 (マイクロ秒) """
+  best = math.inf
+  for _ in range(repeat):
+    t = time.perf_counter()
+    for key, center, angle in bullets:
+      draw(screen, key, center, angle)
+    best = min(best, time.perf_counter() - t)
+  return best / len(bullets) * 1e6
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--bullets", type=int, default=2000)
+  parser.add_argument("--steps", type=int, nargs="+", default=[64, 128])
+  parser.add_argument("--repeat", type=int, default=5)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  pg.display.init()
+  screen = pg.display.set_mode((SCREEN_W, SCREEN_H))
+  rng = random.Random(args.seed)
+  bullets = [(rng.choice(("Amulet", "Reimu")),
+              (rng.uniform(0, SCREEN_W), rng.uniform(0, SCREEN_H)),
+              rng.uniform(-180, 180)) for _ in range(args.bullets)]
+
+  legacy = measure(legacy_draw, screen, bullets, args.repeat)
+  print(f"legacy      : {legacy:7.2f} us/bullet")
+  for steps in args.steps:
+    atlas = SpriteAtlas(steps)
+    atlas.register("Amulet", make_amulet_surf)
+    atlas.register("Reimu", make_reimu_shot_surf)
+    t = time.perf_counter()
+    atlas.build()
+    build_ms = (time.perf_counter() - t) * 1000
+    cached = measure(atlas.blit, screen, bullets, args.repeat)
+    print(f"atlas {steps:>4}  : {cached:7.2f} us/bullet "
+          f"(x{legacy / cached:.1f}, build {build_ms:.1f} ms)")
+  pg.quit()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,78 @@
+""" VecMatch (K 試合をまとめて進める環境) の速さと、Match との挙動の比較
+
+霊夢を入力ビットを一様に選ぶボットにして、K 試合を --ticks フレーム回し、
+1秒あたりのフレーム数 (K 試合分の合計) を表示する。
+--check では同じボットで Match を --matches 試合回し、1000フレームあたりの
+霊夢・魔理沙の被ダメージと試合の長さを並べて表示する (乱数が違うので値は近くなるだけで一致はしない)。
+
+  python -m benchmarks.vecenv --k 4096 --ticks 200
+  python -m benchmarks.vecenv --k 256 --ticks 6000 --check --matches 40
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from main_game import Match
+from vecenv import MARISA, REIMU, VecMatch, random_policy
+
+
+def run_vec(k, ticks, seed):
+  """ (1秒あたりのフレーム数, 霊夢の被ダメージ, 魔理沙の被ダメージ, 終わった試合の長さの平均) """
+  env = VecMatch(k, seed=seed)
+  rng = np.random.default_rng(seed + 1)
+  lost = np.zeros(2)
+  lengths = []
+  t = time.perf_counter()
+  for _ in range(ticks):
+    tick = env.tick.copy()
+    _, _, done = env.step(random_policy(rng, k))
+    lost += env.lost.sum(axis=0)
+    lengths += list(tick[done] + 1)
+  elapsed = time.perf_counter() - t
+  return k * ticks / elapsed, lost[REIMU], lost[MARISA], np.mean(lengths) if lengths else 0
+
+
+def run_match(matches, seed, max_ticks):
+  """ 同じボットで Match を回した (霊夢の被ダメージ, 魔理沙の被ダメージ, フレーム数, 試合の長さの平均) """
+  lost = np.zeros(2)
+  ticks = 0
+  lengths = []
+  for s in range(seed, seed + matches):
+    rng = random.Random(s + 1)
+    m = Match(s, load_images=False).run(max_ticks, lambda m: rng.randrange(64))
+    lost += (m.reimu.max_hp - m.reimu.hp, m.marisa.max_hp - m.marisa.hp)
+    ticks += m.tick
+    if m.over: lengths.append(m.tick)
+  return lost[REIMU], lost[MARISA], ticks, np.mean(lengths) if lengths else 0
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--k", type=int, default=1024, help="まとめて進める試合数")
+  parser.add_argument("--ticks", type=int, default=200)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--check", action="store_true", help="Match と被ダメージの割合を比べる")
+  parser.add_argument("--matches", type=int, default=20)
+  parser.add_argument("--max-ticks", type=int, default=40 * 60 * 5)
+  args = parser.parse_args()
+
+  rate, reimu, marisa, length = run_vec(args.k, args.ticks, args.seed)
+  print(f"VecMatch k={args.k}: {rate:,.0f} ticks/s")
+  if not args.check: return
+  total = args.k * args.ticks
+  print(f"{'':<10} {'霊夢 lost/1k':>12} {'魔理沙 lost/1k':>14} {'length':>7}")
+  print(f"{'VecMatch':<10} {reimu * 1000 / total:>12.3f} {marisa * 1000 / total:>14.3f} {length:>7.0f}")
+  t = time.perf_counter()
+  reimu, marisa, ticks, length = run_match(args.matches, args.seed, args.max_ticks)
+  elapsed = time.perf_counter() - t
+  print(f"{'Match':<10} {reimu * 1000 / ticks:>12.3f} {marisa * 1000 / ticks:>14.3f} {length:>7.0f}"
+        f"  ({ticks / elapsed:,.0f} ticks/s)")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,67 @@
+""" 当たり判定のブロードフェーズ (一様グリッドの空間ハッシュ)
+
+弾の中心をマス (CHIP) 単位のセルに振り分けておき、キャラの当たり判定の下にある
+セルの弾だけを詳しく調べる。グリッドは numpy の並べ替え1回で作り直すので毎フレーム構築できる。
+"""
+import numpy as np
+
+
+class SpatialHash:
+  """ cell ピクセル四方のセルを cols x rows 並べたグリッド (外周に margin セルの余白) """
+  def __init__(self, cell, cols, rows, margin=2):
+    self.cell = cell
+    self.margin = margin
+    self.cols = cols + margin * 2
+    self.rows = rows + margin * 2
+    self.order = np.zeros(0, int)
+    self.starts = np.zeros(self.cols * self.rows + 1, int)
+    # セル番号が16bitに収まれば基数ソートが効く
+    self.key_type = np.int16 if self.cols * self.rows < 2 ** 15 else np.int32
+
+  def _cell_xy(self, x, y):
+    # 負の座標も切り捨て前に 0 へ寄せるので、astype の切り捨てで floor と同じになる
+    gx = np.clip(np.multiply(x, 1 / self.cell) + self.margin, 0, self.cols - 1).astype(self.key_type)
+    gy = np.clip(np.multiply(y, 1 / self.cell) + self.margin, 0, self.rows - 1).astype(self.key_type)
+    return gx, gy
+
+  def _span(self, lo, hi, n):
+    """ スカラー座標の範囲 [lo, hi] が掛かるセル番号の範囲 """
+    c0 = min(max(int(lo // self.cell) + self.margin, 0), n - 1)
+    c1 = min(max(int(hi // self.cell) + self.margin, 0), n - 1)
+    return c0, c1
+
+  def build(self, cx, cy):
+    """ 中心座標 (cx, cy) の点をセルごとに並べ替える """
+    gx, gy = self._cell_xy(cx, cy)
+    keys = gy * self.key_type(self.cols) + gx
+    self.order = np.argsort(keys, kind="stable")
+    counts = np.bincount(keys, minlength=self.cols * self.rows)
+    self.starts[0] = 0
+    np.cumsum(counts, out=self.starts[1:])
+    self.table = None   # any_in 用の累積和 (使うときに作る)
+    self.counts = counts
+
+  def any_in(self, left, top, right, bottom, reach=0):
+    """ 矩形の配列それぞれについて、reach だけ広げた範囲のセルに点があるか (bool 配列)
+
+    セルの点の数の2次元累積和を引くので、矩形がいくつあっても配列演算1回で済む。
+    """
+    if self.table is None:
+      self.table = np.zeros((self.rows + 1, self.cols + 1), np.int64)
+      self.table[1:, 1:] = self.counts.reshape(self.rows, self.cols).cumsum(0).cumsum(1)
+    gx0, gy0 = self._cell_xy(np.subtract(left, reach), np.subtract(top, reach))
+    gx1, gy1 = self._cell_xy(np.add(right, reach), np.add(bottom, reach))
+    gx0, gy0, gx1, gy1 = (g.astype(np.intp) for g in (gx0, gy0, gx1, gy1))
+    t = self.table
+    return (t[gy1 + 1, gx1 + 1] - t[gy0, gx1 + 1] - t[gy1 + 1, gx0] + t[gy0, gx0]) > 0
+
+  def candidates(self, left, top, right, bottom, reach=0):
+    """ 矩形を reach だけ広げた範囲のセルに入っている点の番号 (昇順) """
+    gx0, gx1 = self._span(left - reach, right + reach, self.cols)
+    gy0, gy1 = self._span(top - reach, bottom + reach, self.rows)
+    # 1行分のセルはキーが連続しているので、行ごとに1回スライスすれば済む
+    chunks = [self.order[self.starts[gy * self.cols + gx0]:self.starts[gy * self.cols + gx1 + 1]]
+              for gy in range(gy0, gy1 + 1)]
+    cand = np.concatenate(chunks) if chunks else self.order[:0]
+    cand.sort()
+    return cand
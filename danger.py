@@ -0,0 +1,72 @@
+""" 弾の危険度マップ (AI の回避用)
+
+マップの各マスについて「敵の弾があと何フレームで来るか」を予測した表を作る。
+弾ごとに今の向き・速さのまま horizon フレーム先までの位置を時刻ごとに配列でまとめて計算し、
+遠い時刻から順にマスへ書き込む (近い時刻が後から上書きして残る) ので、弾 x マスの Python ループはない。
+AI はこの表を引くだけで、どのマスが安全かを判断できる。
+"""
+import math
+
+import numpy as np
+
+
+class DangerField:
+  """ cols x rows マスの「弾が来るまでのフレーム数」(horizon 以内に来なければ horizon + 1)
+
+  表はマップの周りに余白を付けた1次元配列に書き込む。余白は弾が horizon フレームで
+  飛べる距離より広く取るので、マップの外へ出る弾もはみ出しの判定なしでそのまま書ける。
+  """
+  def __init__(self, cols, rows, horizon=16, block=8):
+    self.cols = cols
+    self.rows = rows
+    self.horizon = horizon
+    self.safe = horizon + 1
+    self.pad = -1
+    self.block = block
+    self.steps = np.arange(horizon + 1, dtype=np.float32)
+    self.eta = np.full((rows, cols), self.safe, np.int32)
+
+  def _layout(self, reach):
+    """ 余白 reach マスの表を用意する (今の表で足りていれば作り直さない) """
+    pad = max(int(math.ceil(reach)) + 1, 4)
+    if pad <= self.pad: return
+    self.pad = pad
+    self.width = self.cols + 2 * pad
+    self.flat = np.full((self.rows + 2 * pad) * self.width, self.safe, np.int32)
+    self.eta = self.flat.reshape(self.rows + 2 * pad, self.width)[pad:-pad, pad:-pad]
+
+  def update(self, pos, direction, speed, remaining):
+    """ 弾の位置 pos (k, 2 / マス単位)・向き・速さ・残り寿命 (フレーム) から表を作り直す """
+    n = len(pos)
+    if n == 0:
+      self.eta.fill(self.safe)
+      return self.eta
+    reach = np.abs(pos).max() + float(speed.max()) * self.horizon
+    self._layout(reach)
+    self.flat.fill(self.safe)
+
+    # 寿命の長い順に並べると、時刻 t に生きている弾は先頭の alive[t] 発になる
+    last = np.minimum(remaining, self.horizon)
+    order = np.argsort(-last, kind="stable")
+    last = last[order]
+    alive = np.searchsorted(-last, -np.arange(self.horizon + 1), side="right")
+    p = (pos[order] + self.pad).astype(np.float32)
+    v = (direction[order] * speed[order, None]).astype(np.float32)
+
+    # block フレーム分ずつ位置をまとめて計算し、遠い時刻の組から書き込む
+    # (余白のおかげで常に正なので、int への切り捨て = floor)
+    for t0 in range(self.horizon + 1 - self.block, -self.block, -self.block):
+      ts = self.steps[max(t0, 0):t0 + self.block]
+      k = alive[int(ts[0])]
+      if k == 0: continue
+      cell = (p[:k] + v[:k] * ts[:, None, None]).astype(np.intp)
+      idx = cell[..., 1] * self.width + cell[..., 0]
+      for j in range(len(ts) - 1, -1, -1):
+        self.flat[idx[j, :alive[int(ts[j])]]] = int(ts[j])
+    return self.eta
+
+  def at(self, x, y):
+    """ マス (x, y) に弾が来るまでのフレーム数 (マップの外は 0 = 入れない) """
+    if 0 <= x < self.cols and 0 <= y < self.rows:
+      return int(self.eta[int(y), int(x)])
+    return 0
@@ -1,8 +1,26 @@
+import time
+PROCESS_START = time.perf_counter()   # 起動時間の計測用 (import より前に取る)
+
 import pygame as pg
+import os
 import random
 import math
+import sys
+import numpy as np
+from collections import OrderedDict
 from enum import Enum
 
+from assets import AssetManager, resolve_font
+from collision import SpatialHash
+from danger import DangerField
+from profiler import NULL_PROFILER, FrameProfiler, ProfilerOverlay, StartupProfiler
+from quality import TIERS, QualityGovernor
+from render import LAYER_AURA, LAYER_BULLETS, LAYER_CHARS, LAYER_PARTICLES, RenderQueue
+from netplay import LossyTransport, RollbackSession, UdpTransport, connect
+from patterns import PatternBook
+from replay import Replay, ReplayWriter
+from search import BeamSearch
+
 # =============================================================================
 # 1. ゲーム設定・定数の定義
 # =============================================================================
@@ -12,6 +30,18 @@ MAP_SIZE = pg.Vector2(16, 9)  # マップのマス数 (横16 x 縦9)
 SCREEN_W = int(CHIP * MAP_SIZE.x)
 SCREEN_H = int(CHIP * MAP_SIZE.y)
 VEC = pg.Vector2             # ベクトル計算用ショートカット
+MOVE_VECS = [VEC(0, -1), VEC(1, 0), VEC(0, 1), VEC(-1, 0)]  # 上・右・下・左
+
+# 1フレーム分の操作を1バイトで表す入力ビット
+IN_UP = 1
+IN_RIGHT = 2
+IN_DOWN = 4
+IN_LEFT = 8
+IN_SHOT = 16   # SPACE: 通常ショット
+IN_SP = 32     # V: スペシャル攻撃
+MOVE_BITS = (IN_UP, IN_RIGHT, IN_DOWN, IN_LEFT)
+BULLET_ANGLE_STEPS = 64      # 弾スプライトを回転済みで用意する角度の分割数
+STAR_ANGLE_STEPS = 36        # 星の回転の分割数 (星は72度で一周するので2度刻み)
 
 # ゲームの状態管理
 class State(Enum):
@@ -24,25 +54,108 @@ class State(Enum):
 # =============================================================================
 # 2. 描画ヘルパー関数
 # =============================================================================
-def draw_neon_text(screen, font, text_str, base_color, center_pos, alpha=255):
-  """ ネオン風テキスト描画 """
-  core_text = font.render(text_str, True, (255, 255, 255))
-  core_text.set_alpha(alpha)
-  core_rect = core_text.get_rect(center=center_pos)
-
-  glow_text = font.render(text_str, True, base_color)
-  glow_text.set_alpha(max(0, min(100, alpha - 50)))
-
-  offset_amount = 3
-  offsets = [(-offset_amount, 0), (offset_amount, 0),
-             (0, -offset_amount), (0, offset_amount)]
-
-  for dx, dy in offsets:
-    screen.blit(glow_text, core_rect.move(dx, dy))
-  screen.blit(core_text, core_rect)
-
-def draw_star(screen, color, center, size, angle=0):
-  """ 星型を描画する関数 """
+# 拡大済みスプライトのディスクキャッシュ置き場
+ASSET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sprites")
+ASSETS = AssetManager(SCALE, ASSET_CACHE_DIR)
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "font")  # 同梱フォント
+FONT_CACHE = os.path.join(os.path.dirname(ASSET_CACHE_DIR), "fonts.json")
+
+class SurfaceCounter:
+  """ ゲーム内で作った Surface の数を数える (毎フレームの確保が無いことの確認用) """
+  def __init__(self):
+    self.total = 0
+
+  def new(self, size, flags=0):
+    self.total += 1
+    return pg.Surface(size, flags)
+
+  def track(self, surf):
+    """ pg.transform や font.render が作った Surface を数えてそのまま返す """
+    self.total += 1
+    return surf
+
+SURFACES = SurfaceCounter()
+
+class TextCache:
+  """ 描画済みテキストの LRU キャッシュ
+
+  キーは (フォント, 文字列, 色, アルファ, 種類)。ネオン文字は光彩4枚と本体を
+  合成済みの1枚 (アルファ乗算済み) として持つので、2回目からは blit 1回で済む。
+  hits / misses でキャッシュの効き具合を確認できる。
+  """
+  def __init__(self, capacity=256):
+    self.capacity = capacity
+    self.surfs = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def _get(self, key, build):
+    surf = self.surfs.get(key)
+    if surf is not None:
+      self.hits += 1
+      self.surfs.move_to_end(key)
+      return surf
+    self.misses += 1
+    surf = build()
+    self.surfs[key] = surf
+    if len(self.surfs) > self.capacity:
+      self.surfs.popitem(last=False)
+    return surf
+
+  def render(self, font, text_str, color):
+    """ font.render(text_str, True, color) のキャッシュ版 """
+    color = tuple(pg.Color(color))
+    return self._get((font, text_str, color, 255, "plain"),
+                     lambda: SURFACES.track(font.render(text_str, True, color)))
+
+  def neon(self, font, text_str, base_color, alpha=255, glow=True):
+    """ ネオン文字を合成した Surface (アルファ乗算済み) と、本体の左上までのずれ
+
+    glow=False なら光彩を重ねず本体だけにする (大きさとずれは同じ)。
+    """
+    base_color = tuple(pg.Color(base_color))
+    return self._get((font, text_str, base_color, alpha, "neon" if glow else "core"),
+                     lambda: self._build_neon(font, text_str, base_color, alpha, glow))
+
+  @staticmethod
+  def _layer(font, text_str, color, alpha):
+    """ アルファ alpha を掛けてアルファ乗算済みにした文字の Surface """
+    surf = SURFACES.track(font.render(text_str, True, color))   # 背景なしのアンチエイリアス描画は SRCALPHA
+    a = pg.surfarray.pixels_alpha(surf)
+    a[:] = (a.astype(np.uint16) * alpha + 127) // 255
+    rgb = pg.surfarray.pixels3d(surf)
+    rgb[:] = (rgb.astype(np.uint16) * a[..., None] + 127) // 255
+    del a, rgb   # ピクセル配列の参照を外して Surface のロックを解く
+    return surf
+
+  def _build_neon(self, font, text_str, base_color, alpha, glow=True):
+    offset = NEON_OFFSET
+    core = self._layer(font, text_str, (255, 255, 255), alpha)
+    w, h = core.get_size()
+    surf = SURFACES.new((w + offset * 2, h + offset * 2), pg.SRCALPHA)
+    if glow:
+      layer = self._layer(font, text_str, base_color, max(0, min(100, alpha - 50)))
+      for dx, dy in ((-offset, 0), (offset, 0), (0, -offset), (0, offset)):
+        surf.blit(layer, (offset + dx, offset + dy), special_flags=pg.BLEND_PREMULTIPLIED)
+    surf.blit(core, (offset, offset), special_flags=pg.BLEND_PREMULTIPLIED)
+    return surf, (w, h)
+
+  def stats(self):
+    return {"entries": len(self.surfs), "hits": self.hits, "misses": self.misses}
+
+NEON_OFFSET = 3   # 光彩をずらす量 (px)
+TEXT_CACHE = TextCache()
+
+def draw_neon_text(screen, font, text_str, base_color, center_pos, alpha=255, glow=True):
+  """ ネオン風テキスト描画 (合成済みの Surface をキャッシュから blit、glow=False で光彩なし) """
+  surf, size = TEXT_CACHE.neon(font, text_str, base_color, alpha, glow)
+  core_rect = pg.Rect((0, 0), size)
+  core_rect.center = center_pos
+  return screen.blit(surf, core_rect.move(-NEON_OFFSET, -NEON_OFFSET),
+                     special_flags=pg.BLEND_PREMULTIPLIED)
+
+def star_points(center, size, angle=0):
+  """ 星型の頂点 (10点) """
   pts = []
   for i in range(10):
     r = size if i % 2 == 0 else size * 0.4
@@ -50,24 +163,408 @@ def draw_star(screen, color, center, size, angle=0):
     x = center[0] + r * math.cos(rad)
     y = center[1] + r * math.sin(rad)
     pts.append((x, y))
-  pg.draw.polygon(screen, color, pts)
+  return pts
+
+class StarCache:
+  """ 星型をラスタライズ済みの回転シートとして持つキャッシュ
+
+  シートは重ねる星の組 ((色, サイズ), ...) ごとに作り、合成済みの1枚として blit する。
+  """
+  def __init__(self, angle_steps=STAR_ANGLE_STEPS):
+    self.angle_steps = angle_steps
+    self.sheets = {}
+
+  def sheet(self, layers):
+    """ layers = ((色, サイズ), ...) の回転シート (無ければ作る) """
+    frames = self.sheets.get(layers)
+    if frames is None:
+      half = max(size for _, size in layers) + 1
+      frames = []
+      for i in range(self.angle_steps):
+        surf = SURFACES.new((half * 2, half * 2), pg.SRCALPHA)
+        for color, size in layers:
+          pg.draw.polygon(surf, color, star_points(
+              (half, half), size, i * 72 / self.angle_steps))
+        frames.append(surf)
+      frames = (frames, half)
+      self.sheets[layers] = frames
+    return frames
+
+  def bucket(self, angle):
+    """ 回転角 (度, スカラー or 配列) をシートの番号に量子化 (星は72度で一周) """
+    return np.rint(np.asarray(angle) % 72 * self.angle_steps / 72).astype(int) % self.angle_steps
+
+  def blit(self, screen, layers, center, angle=0):
+    frames, half = self.sheet(layers)
+    screen.blit(frames[int(self.bucket(angle))], (center[0] - half, center[1] - half))
+
+STAR_CACHE = StarCache()
+# 星弾の見た目 (外側の星 + 内側の白い星)。キーは覚醒状態
+STAR_BULLET_LAYERS = {
+    awake: ((tuple(pg.Color('ORANGE' if awake else 'YELLOW')), 16),
+            (tuple(pg.Color('WHITE')), 8))
+    for awake in (False, True)}
+
+def draw_star(screen, color, center, size, angle=0):
+  """ 星型を描画する関数 (キャッシュ済みの回転シートから blit) """
+  STAR_CACHE.blit(screen, ((tuple(pg.Color(color)), size),), center, angle)
+
+def make_amulet_surf():
+  """ 霊夢SPのお札 (回転前) """
+  surf = SURFACES.new((20, 10), pg.SRCALPHA)
+  pg.draw.rect(surf, pg.Color('RED'), (0, 0, 20, 10))
+  pg.draw.rect(surf, pg.Color('WHITE'), (4, 2, 12, 6))
+  pg.draw.rect(surf, pg.Color('PINK'), (5, 3, 10, 8))
+  return surf
+
+def make_reimu_shot_surf():
+  """ 霊夢の通常弾 (回転前) """
+  surf = SURFACES.new((16, 8), pg.SRCALPHA)
+  pg.draw.rect(surf, pg.Color('RED'), (0, 0, 16, 8))
+  pg.draw.rect(surf, pg.Color('WHITE'), (2, 2, 12, 4))
+  return surf
+
+def make_marisa_shot_surf(awake):
+  """ 魔理沙の通常弾 (回転前)。線の代わりに回転済みスプライトにして、ほかの弾とまとめて描く """
+  surf = SURFACES.new((16, 4), pg.SRCALPHA)
+  surf.fill(pg.Color('MAGENTA' if awake else 'CYAN'))
+  return surf
+
+class SpriteAtlas:
+  """ 弾の見た目を一定角度ごとに回転済みで持っておくキャッシュ
+
+  描画時は角度を量子化して blit するだけなので、毎フレームの Surface 生成や回転が不要になる。
+  """
+  def __init__(self, angle_steps=BULLET_ANGLE_STEPS):
+    self.angle_steps = angle_steps
+    self.builders = {}
+    self.frames = {}
+
+  def register(self, key, builder):
+    """ 見た目を追加する (builder は回転前の Surface を返す関数) """
+    self.builders[key] = builder
+    self.frames.pop(key, None)
+
+  def build(self, key=None):
+    """ 全角度の回転済みスプライトを作る (key 省略時は登録済みすべて) """
+    for k in ([key] if key is not None else self.builders):
+      base = self.builders[k]()
+      frames = []
+      for i in range(self.angle_steps):
+        surf = SURFACES.track(pg.transform.rotate(base, i * 360 / self.angle_steps))
+        frames.append((surf, surf.get_width() / 2, surf.get_height() / 2))
+      self.frames[k] = frames
+
+  def bucket(self, angle):
+    """ 角度 (度, スカラー or 配列) を分割番号に量子化 """
+    return np.rint(np.asarray(angle) * self.angle_steps / 360).astype(int) % self.angle_steps
+
+  def get(self, key, angle):
+    """ (Surface, 中心までのオフセットx, y) を返す """
+    if key not in self.frames: self.build(key)
+    return self.frames[key][int(self.bucket(angle))]
+
+  def blit(self, screen, key, center, angle):
+    surf, ox, oy = self.get(key, angle)
+    screen.blit(surf, (center[0] - ox, center[1] - oy))
+
+BULLET_SPRITES = SpriteAtlas()
+BULLET_SPRITES.register("Amulet", make_amulet_surf)
+BULLET_SPRITES.register("Reimu", make_reimu_shot_surf)
+BULLET_SPRITES.register("Marisa", lambda: make_marisa_shot_surf(False))
+BULLET_SPRITES.register("MarisaAwake", lambda: make_marisa_shot_surf(True))
+
+class ArenaLayer:
+  """ 床 (塗りつぶし + グリッド) を一度だけ描いておくレイヤー
+
+  SCALE / MAP_SIZE (size を渡したときはその (横, 縦) マス数) が変わったときだけ描き直す。
+  """
+  def __init__(self, color=(30, 30, 40), line_color=(50, 50, 60), size=None):
+    self.color = color
+    self.line_color = line_color
+    self.size = size
+    self.key = None
+    self.surf = None
+
+  def get(self):
+    cols, rows = self.size or MAP_SIZE
+    key = (SCALE, CHIP, int(cols), int(rows))
+    if key != self.key:
+      w, h = int(CHIP * cols), int(CHIP * rows)
+      self.surf = SURFACES.new((w, h))
+      self.surf.fill(self.color)
+      for y in range(0, h, CHIP): pg.draw.line(
+          self.surf, self.line_color, (0, y), (w, y))
+      for x in range(0, w, CHIP): pg.draw.line(
+          self.surf, self.line_color, (x, 0), (x, h))
+      self.key = key
+    return self.surf
+
+  def draw(self, screen):
+    screen.blit(self.get(), (0, 0))
+
+class EffectCache:
+  """ 演出用の Surface を使い回すキャッシュ
+
+  覚醒オーラは半径が sin で 25〜35px を行き来するだけなので、色ごとに半径1px刻みの
+  1周分を作っておく。画面を暗くするオーバーレイは解像度ごとに1枚だけ持つ
+  (画像の無いキャラの代わりの四角も大きさ・色ごとに1枚)。
+  """
+  AURA_BASE = 30    # オーラの半径の中心 (px)
+  AURA_SWING = 5    # 半径の振れ幅 (px)
+  AURA_SIZE = 100   # オーラ1枚の大きさ (px)
+
+  def __init__(self):
+    self.auras = {}
+    self.overlays = {}
+    self.blocks = {}
+
+  def aura_frames(self, color):
+    """ color (RGB) のオーラ1周分 (半径の小さい順) """
+    frames = self.auras.get(color)
+    if frames is None:
+      half = self.AURA_SIZE // 2
+      frames = []
+      for r in range(self.AURA_BASE - self.AURA_SWING, self.AURA_BASE + self.AURA_SWING + 1):
+        surf = SURFACES.new((self.AURA_SIZE, self.AURA_SIZE), pg.SRCALPHA)
+        pg.draw.circle(surf, (*color, 100), (half, half), r)
+        frames.append(surf)
+      self.auras[color] = frames
+    return frames
+
+  def aura(self, color, frame):
+    """ アニメ番号 frame のときのオーラ """
+    radius = int(self.AURA_BASE + math.sin(frame * 0.2) * self.AURA_SWING)
+    return self.aura_frames(color)[radius - (self.AURA_BASE - self.AURA_SWING)]
+
+  def block(self, size, color):
+    """ 塗りつぶしただけの板 (画像の無いキャラの代わり。size・色ごとに1枚) """
+    key = (tuple(size), color)
+    surf = self.blocks.get(key)
+    if surf is None:
+      surf = SURFACES.new(size)
+      surf.fill(color)
+      self.blocks[key] = surf
+    return surf
+
+  def overlay(self, size, color=(0, 0, 0), alpha=150):
+    """ 画面全体を暗くする半透明の板 (size・色・濃さごとに1枚) """
+    key = (tuple(size), color, alpha)
+    surf = self.overlays.get(key)
+    if surf is None:
+      surf = SURFACES.new(size)
+      surf.fill(color)
+      surf.set_alpha(alpha)
+      self.overlays[key] = surf
+    return surf
+
+EFFECTS = EffectCache()
+AURA_COLORS = {"魔理沙": (255, 100, 100)}   # キャラごとのオーラの色
+AURA_DEFAULT_COLOR = (255, 200, 200)
+
+class DirtyTiles:
+  """ 画面を CHIP 単位のタイルに分け、書き換えたタイルだけを記録する
+
+  前フレームと今フレームのタイルをまとめて pg.display.update に渡すので、
+  動いた物の跡も消える。 mark_points の half は1タイル以下であること。
+  """
+  def __init__(self, size, tile=CHIP):
+    self.tile = tile
+    self.w, self.h = size
+    self.cols = -(-self.w // tile)
+    self.rows = -(-self.h // tile)
+    self.cur = np.zeros((self.rows, self.cols), bool)
+    self.prev = np.ones((self.rows, self.cols), bool)   # 最初は全面
+
+  def mark_rect(self, rect):
+    r = pg.Rect(rect).clip((0, 0, self.w, self.h))
+    if r.w <= 0 or r.h <= 0: return
+    t = self.tile
+    self.cur[r.top // t:(r.bottom - 1) // t + 1, r.left // t:(r.right - 1) // t + 1] = True
+
+  def mark_points(self, pts, half):
+    """ 中心 pts ((k, 2) のピクセル座標) から half 以内をまとめて記録 """
+    pts = np.asarray(pts)
+    if len(pts) == 0: return
+    t = self.tile
+    x0 = np.clip((pts[:, 0] - half) // t, 0, self.cols - 1).astype(int)
+    x1 = np.clip((pts[:, 0] + half) // t, 0, self.cols - 1).astype(int)
+    y0 = np.clip((pts[:, 1] - half) // t, 0, self.rows - 1).astype(int)
+    y1 = np.clip((pts[:, 1] + half) // t, 0, self.rows - 1).astype(int)
+    for ys in (y0, y1):
+      for xs in (x0, x1):
+        self.cur[ys, xs] = True
+
+  def restore(self, surf, background):
+    """ 前フレームに描いたタイルを背景で塗り戻す """
+    for r in self.rects(self.prev):
+      surf.blit(background, r, r)
+
+  def full_frame(self):
+    """ 全面を描き直したフレーム (次のフレームは全面を塗り戻す) """
+    self.prev[:] = True
+    self.cur[:] = False
+
+  def flush(self):
+    """ 今回画面に送る矩形を返して、フレームを進める """
+    rects = self.rects(self.prev | self.cur)
+    self.prev, self.cur = self.cur, self.prev
+    self.cur[:] = False
+    return rects
+
+  def rects(self, mask):
+    """ タイルのマスクを横方向につないだ矩形のリストにする """
+    t = self.tile
+    out = []
+    for row in range(self.rows):
+      cols = np.flatnonzero(mask[row])
+      if len(cols) == 0: continue
+      breaks = np.flatnonzero(np.diff(cols) > 1)
+      starts = np.concatenate(([cols[0]], cols[breaks + 1]))
+      ends = np.concatenate((cols[breaks], [cols[-1]]))
+      for c0, c1 in zip(starts, ends):
+        out.append(pg.Rect(c0 * t, row * t, (c1 - c0 + 1) * t, t).clip((0, 0, self.w, self.h)))
+    return out
 
 # =============================================================================
 # 3. エフェクト（パーティクル）クラス
 # =============================================================================
+class ParticleSystem:
+  """ 容量固定の配列でパーティクルをまとめて管理する
+
+  発生・移動・描画を配列演算とまとめた blit で行い、フレーム中の確保をしない。
+  容量を超えて発生させたときは古いものから消す。配列は発生順に並んでいる。
+  """
+  def __init__(self, capacity=512, seed=None):
+    self.capacity = capacity
+    self.count = 0
+    self.next_id = 0
+    self.rng = np.random.default_rng(seed)
+    self.pos = np.zeros((capacity, 2))
+    self.vel = np.zeros((capacity, 2))
+    self.life = np.zeros(capacity, np.int32)
+    self.size = np.zeros(capacity)
+    self.color = np.zeros((capacity, 3), np.uint8)
+    self.ids = np.zeros(capacity, np.int64)   # 発生順の通し番号 (Particle からの参照用)
+    self.dots = {}   # (色, 半径) -> 円のスプライト
+
+  def __len__(self):
+    return self.count
+
+  def clear(self):
+    self.count = 0
+
+  def emit(self, pos, color, count=5):
+    """ pos (ピクセル座標) から count 個をまとめて発生させる """
+    count = min(count, self.capacity)
+    over = self.count + count - self.capacity
+    if over > 0: self._drop_oldest(over)
+
+    d = self.rng.uniform(-1, 1, (count, 2))
+    norm = np.hypot(d[:, 0], d[:, 1])
+    norm[norm == 0] = 1
+    s = slice(self.count, self.count + count)
+    self.pos[s] = (pos[0], pos[1])
+    self.vel[s] = d / norm[:, None] * self.rng.uniform(2, 8, (count, 1))
+    self.life[s] = self.rng.integers(10, 26, count)
+    self.size[s] = self.rng.uniform(2, 5, count)
+    self.color[s] = tuple(pg.Color(color))[:3]
+    self.ids[s] = np.arange(self.next_id, self.next_id + count)
+    self.next_id += count
+    self.count += count
+
+  def _drop_oldest(self, k):
+    n = self.count
+    for arr in (self.pos, self.vel, self.life, self.size, self.color, self.ids):
+      arr[:n - k] = arr[k:n]
+    self.count = n - k
+
+  def update(self):
+    """ 全パーティクルを1フレーム進め、寿命の尽きたものを詰める (順序は保つ) """
+    n = self.count
+    if n == 0: return
+    self.pos[:n] += self.vel[:n]
+    self.life[:n] -= 1
+    self.size[:n] *= 0.9
+    alive = self.life[:n] > 0
+    k = int(np.count_nonzero(alive))
+    if k < n:
+      for arr in (self.pos, self.vel, self.life, self.size, self.color, self.ids):
+        arr[:k] = arr[:n][alive]
+      self.count = k
+
+  def warm(self, color, max_radius=5):
+    """ color の円スプライトを先に作っておく """
+    for r in range(1, max_radius + 1): self.dot(tuple(pg.Color(color))[:3], r)
+
+  def dot(self, color, radius):
+    key = (color, radius)
+    surf = self.dots.get(key)
+    if surf is None:
+      surf = SURFACES.new((radius * 2 + 1, radius * 2 + 1), pg.SRCALPHA)
+      pg.draw.circle(surf, color, (radius, radius), radius)
+      self.dots[key] = surf
+    return surf
+
+  def draw(self, screen, queue=None):
+    """ 全パーティクルを1回の blits で描画 (queue (RenderQueue) を渡すとその LAYER_PARTICLES 層に積む) """
+    n = self.count
+    if n == 0: return
+    radius = self.size[:n].astype(int)
+    x = self.pos[:n, 0].astype(int) - radius
+    y = self.pos[:n, 1].astype(int) - radius
+    colors = self.color[:n]
+    dots = [(self.dot(tuple(colors[i]), int(radius[i])), (int(x[i]), int(y[i])))
+            for i in np.flatnonzero(radius > 0)]
+    if queue is not None: queue.extend(LAYER_PARTICLES, dots)
+    else: screen.blits(dots, doreturn=False)
+
+  def index(self, pid):
+    """ 通し番号 pid のパーティクルの位置 (消えていれば -1) """
+    i = int(np.searchsorted(self.ids[:self.count], pid))
+    return i if i < self.count and self.ids[i] == pid else -1
+
+
+PARTICLES = ParticleSystem()   # Particle (互換用) が使う共有のシステム
+
 class Particle:
-  def __init__(self, pos, color):
-    self.pos = VEC(pos)
+  """ 1粒ずつ扱う旧来の API (中身は ParticleSystem の1要素) """
+  def __init__(self, pos, color, system=None):
+    self.system = system if system is not None else PARTICLES
     self.color = color
-    self.vel = VEC(random.uniform(-1, 1), random.uniform(-1, 1)
-                   ).normalize() * random.uniform(2, 8)
-    self.life = random.randint(10, 25)
-    self.size = random.uniform(2, 5)
+    self.id = self.system.next_id
+    self.system.emit(pos, color, 1)
+
+  def _slot(self):
+    return self.system.index(self.id)
+
+  @property
+  def pos(self):
+    i = self._slot()
+    return VEC(*self.system.pos[i]) if i >= 0 else VEC(0, 0)
+
+  @property
+  def vel(self):
+    i = self._slot()
+    return VEC(*self.system.vel[i]) if i >= 0 else VEC(0, 0)
+
+  @property
+  def life(self):
+    i = self._slot()
+    return int(self.system.life[i]) if i >= 0 else 0
+
+  @property
+  def size(self):
+    i = self._slot()
+    return float(self.system.size[i]) if i >= 0 else 0.0
 
   def update(self):
-    self.pos += self.vel
-    self.life -= 1
-    self.size *= 0.9
+    i = self._slot()
+    if i < 0: return
+    ps = self.system
+    ps.pos[i] += ps.vel[i]
+    ps.life[i] -= 1
+    ps.size[i] *= 0.9
 
   def draw(self, screen):
     if self.life > 0:
@@ -75,136 +572,404 @@ class Particle:
                                           int(self.pos.y)), int(self.size))
 
 # =============================================================================
-# 4. 弾クラス (Bullet)
+# 4. 弾プール (BulletPool)
 # =============================================================================
-class Bullet:
-  def __init__(self, pos, direction, owner, btype="N", target=None, is_awakened=False):
-    self.pos = VEC(pos)
-    self.direction = direction.normalize() if direction.length_squared() != 0 else VEC(0, 1)
-    self.owner = owner
-    self.type = btype
-    self.target = target
-    self.timer = 0
-    self.active = True
-    self.is_awakened = is_awakened
-
-    # --- 弾の設定 ---
-    speed_mult = 1.2 if is_awakened else 1.0
-
-    if self.type == "Amulet":   # 霊夢SP
-      self.speed = 0.4
-      self.damage = 1
-      self.life_time = 150
-      self.homing_strength = 0.20
-    elif self.type == "Star":   # 魔理沙SP
-      self.speed = 0.5 * speed_mult
-      self.damage = 1
-      self.life_time = 180
-      self.homing_strength = 0.08 if not is_awakened else 0.15
-    else:                       # 通常弾
-      self.speed = (0.7 if owner == "霊夢" else 0.5) * speed_mult
-      self.damage = 1
-      self.life_time = 100
-      self.homing_strength = 0
+# 弾の種類コード
+BT_N = 0        # 通常弾
+BT_AMULET = 1   # 霊夢SP (お札)
+BT_STAR = 2     # 魔理沙SP (星)
+BULLET_TYPES = {"N": BT_N, "Amulet": BT_AMULET, "Star": BT_STAR}
+
+# SP の撃ち方はパターンファイルに書く (初めて撃つときに読み込む)。
+# ファイルが無くても SP は撃てるように、キャラの SP だけはここにも同じものを持っておく
+PATTERN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "patterns.json")
+DEFAULT_PATTERNS = {
+    "reimu_sp": {"btype": "Amulet", "cooldown": 45,
+                 "emitters": [{"shape": "fan", "count": 5, "step": 20}]},
+    "marisa_sp": {"btype": "Star", "cooldown": 45,
+                  "emitters": [{"shape": "random", "count": 5, "spread": 70, "speed": [0.3, 0.8]}],
+                  "awake": {"emitters": [{"shape": "random", "count": 8, "spread": 70,
+                                          "speed": [0.3, 0.8]}]}},
+}
+PATTERNS = PatternBook(PATTERN_FILE, DEFAULT_PATTERNS)
+SP_PATTERNS = {"霊夢": "reimu_sp", "魔理沙": "marisa_sp"}   # キャラごとの SP のパターン名
+
+def bullet_params(btype, owner_name, is_awakened):
+  """ 弾の種類ごとの (速度, ダメージ, 寿命, ホーミング強度) """
+  speed_mult = 1.2 if is_awakened else 1.0
+
+  if btype == BT_AMULET:    # 霊夢SP
+    return 0.4, 1, 150, 0.20
+  elif btype == BT_STAR:    # 魔理沙SP
+    return 0.5 * speed_mult, 1, 180, 0.08 if not is_awakened else 0.15
+  else:                     # 通常弾
+    return (0.7 if owner_name == "霊夢" else 0.5) * speed_mult, 1, 100, 0
+
+
+class BulletPool:
+  """ 全キャラの弾をNumPy配列 (構造体配列) でまとめて管理するプール
+
+  弾1発ごとのオブジェクトは作らず、更新・ホーミング・当たり判定を配列演算で一括処理する。
+  消えた弾は末尾の生きている弾と入れ替えて詰める (順序は保持しない)。
+  size は弾が飛べるマップの (横, 縦) マス数 (省略時は MAP_SIZE)。
+  """
+  FIELDS = ("pos", "prev_pos", "direction", "speed", "timer", "life_time", "homing_strength",
+            "damage", "btype", "owner", "target", "awake")
+  # 当たり判定で空間ハッシュを使うのは、弾が GRID_MIN_BULLETS 発以上かつ弾数 x キャラ数が
+  # GRID_MIN_PAIRS を超えるときだけ。それより少ないとハッシュを作る分だけ総当たりに負ける
+  # (benchmarks/collision.py で測った境目。2人の対戦はいつも総当たりになる)
+  GRID_MIN_BULLETS = 2000
+  GRID_MIN_PAIRS = 40000
+
+  def __init__(self, capacity=1024, size=None):
+    self.count = 0
+    self.owners = []   # 登録済みキャラ (owner / target の番号 -> Char)
+    self.owner_ids = {}   # Char -> 番号 (キャラが多くても register を定数時間にする)
+    self.size = (MAP_SIZE.x, MAP_SIZE.y) if size is None else tuple(size)
+    self.grid = None   # 当たり判定用の空間ハッシュ (size に合わせて作る)
+    self.grid_key = None
+    self._alloc(capacity)
+
+  def _alloc(self, capacity):
+    self.capacity = capacity
+    self.pos = np.zeros((capacity, 2))
+    self.prev_pos = np.zeros((capacity, 2))   # 前のフレームの位置 (描画の補間用)
+    self.direction = np.zeros((capacity, 2))
+    self.speed = np.zeros(capacity)
+    self.timer = np.zeros(capacity, np.int32)
+    self.life_time = np.zeros(capacity, np.int32)
+    self.homing_strength = np.zeros(capacity)
+    self.damage = np.zeros(capacity, np.int32)
+    self.btype = np.zeros(capacity, np.int8)
+    self.owner = np.zeros(capacity, np.int16)
+    self.target = np.full(capacity, -1, np.int16)
+    self.awake = np.zeros(capacity, bool)
+
+  def _grow(self, need):
+    """ 容量が足りないときだけ倍々に拡張する """
+    capacity = self.capacity
+    while capacity < need: capacity *= 2
+    old = {f: getattr(self, f)[:self.count] for f in self.FIELDS}
+    self._alloc(capacity)
+    for f, arr in old.items():
+      getattr(self, f)[:self.count] = arr
+
+  def __len__(self):
+    return self.count
+
+  def register(self, char):
+    """ キャラを登録して owner / target 用の番号を返す """
+    i = self.owner_ids.get(char)
+    if i is None:
+      i = self.owner_ids[char] = len(self.owners)
+      self.owners.append(char)
+    return i
+
+  def spawn(self, pos, directions, owner, btype, target=None, is_awakened=False, speeds=None,
+            homing=None, life_time=None):
+    """ 同じ発射元・種類の弾をまとめて追加する (directions は (k, 2) の配列)
+
+    speeds / homing / life_time を指定すると弾の種類の既定値の代わりに使う。
+    """
+    d = np.asarray(directions, dtype=float).reshape(-1, 2)
+    k = len(d)
+    if k == 0: return
+    if self.count + k > self.capacity: self._grow(self.count + k)
+
+    length = np.hypot(d[:, 0], d[:, 1])
+    zero = length == 0
+    d[zero] = (0, 1)
+    length[zero] = 1
+    d /= length[:, None]
+
+    speed, damage, default_life, default_homing = bullet_params(btype, owner.name, is_awakened)
+    s = slice(self.count, self.count + k)
+    self.pos[s] = pos
+    self.prev_pos[s] = pos
+    self.direction[s] = d
+    self.speed[s] = speed if speeds is None else speeds
+    self.timer[s] = 0
+    self.life_time[s] = default_life if life_time is None else life_time
+    self.homing_strength[s] = default_homing if homing is None else homing
+    self.damage[s] = damage
+    self.btype[s] = btype
+    self.owner[s] = self.register(owner)
+    self.target[s] = -1 if target is None else self.register(target)
+    self.awake[s] = is_awakened
+    self.count += k
 
   def update(self):
-    if (self.type in ["Amulet", "Star"]) and self.target and self.target.hp > 0:
-      diff = (self.target.pos - self.pos)
-      if diff.length_squared() > 0:
-        desired = diff.normalize()
-        self.direction = self.direction.lerp(
-            desired, self.homing_strength).normalize()
-
-    self.pos += self.direction * self.speed
-    self.timer += 1
-
-    if self.timer > self.life_time:
-      self.active = False
+    """ 全弾を1フレーム進める (撃破演出中のキャラの弾は止めておく) """
+    n = self.count
+    if n == 0: return
+    frozen = np.array([c.is_dying for c in self.owners])
+    live = ~frozen[self.owner[:n]]
+    self.prev_pos[:n] = self.pos[:n]
+
+    # --- ホーミング ---
+    tgt = self.target[:n]
+    target_pos = np.array([(c.pos.x, c.pos.y) for c in self.owners])
+    target_alive = np.array([c.hp > 0 for c in self.owners])
+    homing = live & (tgt >= 0)
+    homing[homing] = target_alive[tgt[homing]]
+    if homing.any():
+      idx = np.flatnonzero(homing)
+      pos = self.pos[idx]
+      d = self.direction[idx]
+      diff = target_pos[tgt[idx]] - pos
+      dist = np.hypot(diff[:, 0], diff[:, 1])
+      ok = dist > 0
+      desired = diff[ok] / dist[ok, None]
+      h = self.homing_strength[idx[ok], None]
+      steer = d[ok] + (desired - d[ok]) * h
+      norm = np.hypot(steer[:, 0], steer[:, 1])
+      norm[norm == 0] = 1
+      d[ok] = steer / norm[:, None]
+      self.direction[idx] = d
+
+    # --- 移動と寿命 ---
+    self.pos[:n][live] += self.direction[:n][live] * self.speed[:n, None][live]
+    self.timer[:n][live] += 1
 
     margin = 2
-    if not (-margin <= self.pos.x <= MAP_SIZE.x + margin and -margin <= self.pos.y <= MAP_SIZE.y + margin):
-      self.active = False
-
-  def draw(self, screen):
-    p = self.pos * CHIP
-
-    if self.type == "Star":
-      color = pg.Color(
-          'ORANGE') if self.is_awakened else pg.Color('YELLOW')
-      draw_star(screen, color, (p.x, p.y), 16, self.timer * 10)
-      draw_star(screen, pg.Color('WHITE'), (p.x, p.y), 8, self.timer * 10)
-
-    elif self.type == "Amulet":
-      angle = math.degrees(
-          math.atan2(-self.direction.y, self.direction.x))
-      amulet_surf = pg.Surface((20, 10), pg.SRCALPHA)
-      pg.draw.rect(amulet_surf, pg.Color('RED'), (0, 0, 20, 10))
-      pg.draw.rect(amulet_surf, pg.Color('WHITE'), (4, 2, 12, 6))
-      pg.draw.rect(amulet_surf, pg.Color('PINK'), (5, 3, 10, 8))
-      rotated_surf = pg.transform.rotate(amulet_surf, angle)
-      rect = rotated_surf.get_rect(center=(p.x, p.y))
-      screen.blit(rotated_surf, rect)
-
+    p = self.pos[:n]
+    dead = live & ((self.timer[:n] > self.life_time[:n]) |
+                   (p[:, 0] < -margin) | (p[:, 0] > self.size[0] + margin) |
+                   (p[:, 1] < -margin) | (p[:, 1] > self.size[1] + margin))
+    self.remove(dead)
+
+  def remove(self, dead):
+    """ 消える弾 (bool マスクまたは番号) を末尾の弾と入れ替えて詰める """
+    n = self.count
+    if not isinstance(dead, np.ndarray) or dead.dtype != bool:
+      mask = np.zeros(n, bool)
+      mask[np.asarray(dead, dtype=int)] = True
+      dead = mask
+    n_dead = int(np.count_nonzero(dead))
+    if n_dead == 0: return
+    k = n - n_dead
+    holes = np.flatnonzero(dead[:k])               # 前半に空いた穴
+    movers = k + np.flatnonzero(~dead[k:])         # 後半に残った生きている弾
+    for f in self.FIELDS:
+      arr = getattr(self, f)
+      arr[holes] = arr[movers]
+    self.count = k
+
+  def snapshot(self):
+    """ 生きている弾の配列のコピー (restore で戻せる) """
+    n = self.count
+    return n, tuple(getattr(self, f)[:n].copy() for f in self.FIELDS)
+
+  def restore(self, snap):
+    n, arrays = snap
+    if n > self.capacity: self._grow(n)
+    for f, arr in zip(self.FIELDS, arrays):
+      getattr(self, f)[:n] = arr
+    self.count = n
+
+  def clear(self, owner=None):
+    """ 弾を全消去 (owner 指定時はそのキャラの弾だけ) """
+    if owner is None:
+      self.count = 0
     else:
-      if self.owner == "霊夢":
-        angle = math.degrees(
-            math.atan2(-self.direction.y, self.direction.x))
-        amulet_surf = pg.Surface((16, 8), pg.SRCALPHA)
-        pg.draw.rect(amulet_surf, pg.Color('RED'), (0, 0, 16, 8))
-        pg.draw.rect(amulet_surf, pg.Color('WHITE'), (2, 2, 12, 4))
-        rotated_surf = pg.transform.rotate(amulet_surf, angle)
-        rect = rotated_surf.get_rect(center=(p.x, p.y))
-        screen.blit(rotated_surf, rect)
-      else:
-        color = pg.Color(
-            'MAGENTA') if self.is_awakened else pg.Color('CYAN')
-        end_pos = p + self.direction * 15
-        pg.draw.line(screen, color, p, end_pos, 4)
-
-  def get_rect(self):
-    p = self.pos * CHIP
-    size = 20 if self.type == "Star" else 12
-    return pg.Rect(p.x - size / 2, p.y - size / 2, size, size)
+      self.remove(self.owner[:self.count] == self.register(owner))
+
+  def rects(self):
+    """ 各弾の当たり判定矩形 (left, top, size) を配列で返す """
+    p = self.pos[:self.count] * CHIP
+    size = np.where(self.btype[:self.count] == BT_STAR, 20, 12)
+    left = np.trunc(p[:, 0] - size / 2)
+    top = np.trunc(p[:, 1] - size / 2)
+    return left, top, size
+
+  def collide(self, defenders, teams=None, grid=None):
+    """ 各 defender に当たった弾の番号をまとめて返す
+
+    自分の弾には当たらない。teams (owner の番号 -> チーム番号の配列) を渡すと味方の弾にも当たらない。
+    複数人に触れている弾は先に並んでいる defender の分になる。
+    弾とキャラが十分多いときだけ空間ハッシュ、それ以外は総当たりで調べる (GRID_MIN_BULLETS)。
+    grid=True / False でどちらかに固定できる (ベンチマーク用)。
+    """
+    n = self.count
+    if n == 0: return [np.zeros(0, int) for _ in defenders]
+    if grid is None: grid = self.use_grid(len(defenders))
+    left, top, size = self.rects()
+    owner = self.owner[:n] if teams is None else teams[self.owner[:n]]
+    boxes = [defender.get_hitbox() for defender in defenders]
+    me = np.array([self.register(defender) for defender in defenders])
+    if teams is not None: me = teams[me]
+    if grid: return self._collide_grid(left, top, size, owner, boxes, me)
+    return self._collide_brute(left, top, size, owner, boxes, me)
+
+  def use_grid(self, defenders):
+    """ defenders 人の判定を空間ハッシュで調べるか """
+    return self.count >= self.GRID_MIN_BULLETS and self.count * defenders > self.GRID_MIN_PAIRS
+
+  def _collide_brute(self, left, top, size, owner, boxes, me):
+    """ 全弾 x 全キャラを (キャラ数, 弾数) の配列で調べる """
+    b = np.array([(r.left, r.top, r.right, r.bottom) for r in boxes])
+    touch = ((left < b[:, 2:3]) & (b[:, 0:1] < left + size) &
+             (top < b[:, 3:4]) & (b[:, 1:2] < top + size) &
+             (owner != me[:, None]))
+    if len(boxes) <= 8:   # 少ないうちは1人ずつ取っていくほうが速い
+      out = []
+      for row in touch:
+        hit = np.flatnonzero(row)
+        out.append(hit)
+        touch[:, hit] = False
+      return out
+    hit = np.flatnonzero(touch.any(axis=0))
+    first = touch[:, hit].argmax(axis=0)   # 弾ごとに先に並んでいるキャラ
+    hit = hit[np.argsort(first, kind="stable")]
+    return np.split(hit, np.cumsum(np.bincount(first, minlength=len(boxes)))[:-1])
+
+  def _collide_grid(self, left, top, size, owner, boxes, me):
+    """ 弾を空間ハッシュに入れて、キャラの下のセルの弾だけを調べる """
+    key = (CHIP, int(self.size[0]), int(self.size[1]))
+    if self.grid_key != key:
+      self.grid = SpatialHash(*key)
+      self.grid_key = key
+    self.grid.build(left + size / 2, top + size / 2)
+    taken = np.zeros(self.count, bool)
+    # キャラが多いときは、近くのセルに弾が1発も無いキャラを先にまとめて除く
+    near = (self.grid.any_in(*np.array([(b.left, b.top, b.right, b.bottom) for b in boxes]).T,
+                             reach=10)
+            if len(boxes) > 8 else np.ones(len(boxes), bool))
+    out = []
+    for box, mine, check in zip(boxes, me, near):
+      if not check:
+        out.append(np.zeros(0, int))
+        continue
+      cand = self.grid.candidates(box.left, box.top, box.right, box.bottom, reach=10)
+      if len(cand) == 0:
+        out.append(cand)
+        continue
+      l, t, s = left[cand], top[cand], size[cand]
+      touch = ((l < box.right) & (box.left < l + s) &
+               (t < box.bottom) & (box.top < t + s) &
+               (owner[cand] != mine) & ~taken[cand])
+      hit = cand[touch]
+      taken[hit] = True
+      out.append(hit)
+    return out
+
+  def incoming(self, defender):
+    """ defender 以外の弾の (位置, 向き, 速さ, 残り寿命) の配列 (DangerField.update 用) """
+    n = self.count
+    enemy = self.owner[:n] != self.register(defender)
+    return (self.pos[:n][enemy], self.direction[:n][enemy], self.speed[:n][enemy],
+            self.life_time[:n][enemy] - self.timer[:n][enemy])
+
+  def hits(self, defender):
+    """ defender 以外の弾のうち、defender の当たり判定に触れている弾の番号 """
+    return self.collide([defender])[0]
+
+  def lerp_pos(self, alpha=1.0):
+    """ 前のフレームと今の位置を alpha で補間した位置 (マス単位) """
+    n = self.count
+    if alpha >= 1: return self.pos[:n]
+    return self.prev_pos[:n] + (self.pos[:n] - self.prev_pos[:n]) * alpha
+
+  def draw(self, screen, owner=None, alpha=1.0, tier=TIERS[0], queue=None):
+    """ 弾を描画 (owner 指定時はそのキャラの弾だけ、alpha は lerp_pos の補間率)
+
+    tier (quality.Tier) で星弾の重ね枚数と回すか (detail) を決める。
+    queue (RenderQueue) を渡すとその LAYER_BULLETS 層に積むだけにし、無ければ1回の blits で描く。
+    """
+    sprites = self.sprites(owner, alpha, tier)
+    if queue is not None: queue.extend(LAYER_BULLETS, sprites)
+    elif sprites: screen.blits(sprites, doreturn=False)
+
+  def sprites(self, owner=None, alpha=1.0, tier=TIERS[0]):
+    """ 弾ごとの (回転済みスプライト, 左上の位置) のリスト
+
+    通常弾も含めてすべてキャッシュ済みのスプライトなので、まとめて blits できる。
+    """
+    n = self.count
+    idx = np.arange(n) if owner is None else np.flatnonzero(
+        self.owner[:n] == self.register(owner))
+    if len(idx) == 0: return []
+    d = self.direction[idx]
+    angles = np.degrees(np.arctan2(-d[:, 1], d[:, 0]))
+    is_reimu = np.array([o.name == "霊夢" for o in self.owners])[self.owner[idx]]
+    btype = self.btype[idx]
+    awake = self.awake[idx]
+    buckets = BULLET_SPRITES.bucket(angles)
+    stars = {a: STAR_CACHE.sheet(STAR_BULLET_LAYERS[a][:tier.star_layers]) for a in (False, True)}
+    spins = (STAR_CACHE.bucket(self.timer[idx] * 10) if tier.detail
+             else np.zeros(len(idx), int))   # 星弾は1フレーム10度ずつ回る
+    # 魔理沙の通常弾は線の始点が弾の位置なので、スプライトの中心は向きへ半分ずらす
+    shift = np.where(((btype == BT_N) & ~is_reimu)[:, None], d * 7.5, 0)
+    pts = (self.lerp_pos(alpha)[idx] * CHIP + shift).tolist()
+    out = []
+    for j in range(len(idx)):
+      x, y = pts[j]
+      if btype[j] == BT_STAR:
+        frames, half = stars[bool(awake[j])]
+        out.append((frames[spins[j]], (x - half, y - half)))
+        continue
+      if btype[j] == BT_AMULET: key = "Amulet"
+      elif is_reimu[j]: key = "Reimu"
+      else: key = "MarisaAwake" if awake[j] else "Marisa"
+      surf, ox, oy = BULLET_SPRITES.frames[key][buckets[j]]
+      out.append((surf, (x - ox, y - oy)))
+    return out
 
 # =============================================================================
 # 5. キャラクタークラス
 # =============================================================================
 class Char:
-  def __init__(self, name, pos, img_path, color, hp):
+  def __init__(self, name, pos, img_path, color, hp, bullets=None):
     self.name = name
     self.pos = VEC(pos)
     self.color = color
     self.max_hp = hp
     self.hp = hp
     self.dir = 2
-    self.bullets = []
+    # 弾はキャラ間で共有する BulletPool に入れる (指定がなければ専用プール)
+    self.bullets = bullets if bullets is not None else BulletPool()
+    self.bullets.register(self)
     self.cool_time = 0
     self.move_vec = VEC(0, 0)
     self.move_anim = VEC(0, 0)
+    self.prev_pixel = self.pixel_pos()   # 前のフレームの位置 (描画の補間用)
     self.img = self.load_img(img_path)
     self.invincible_timer = 0
     self.is_awakened = False
+    self.fired = 0      # 撃った弾の数 (集計用)
+    self.volleys = []   # 遅れて撃つ wave の [残りフレーム, 発射器, wave, 向き, 相手, 弾の種類, 覚醒]
+    self.rng = random   # 乱数源 (Match が試合ごとの random.Random に差し替える)
 
     # --- 死亡演出用変数の追加 ---
     self.is_dying = False   # 撃破演出中かどうか
     self.death_timer = 0    # 演出用のタイマー
 
+  def snapshot(self):
+    """ 試合の進行に関わる値の組と、遅れて撃つ wave のコピー (restore で戻せる) """
+    values = (self.pos.x, self.pos.y, self.dir, self.hp, self.cool_time,
+              self.move_vec.x, self.move_vec.y, self.move_anim.x, self.move_anim.y,
+              self.prev_pixel.x, self.prev_pixel.y, self.invincible_timer, self.is_awakened,
+              self.is_dying, self.death_timer, self.fired)
+    return values, [list(v) for v in self.volleys]
+
+  def restore(self, snap):
+    values, volleys = snap
+    (px, py, self.dir, self.hp, self.cool_time, mx, my, ax, ay, qx, qy, self.invincible_timer,
+     self.is_awakened, self.is_dying, self.death_timer, self.fired) = values
+    self.pos = VEC(px, py)
+    self.move_vec = VEC(mx, my)
+    self.move_anim = VEC(ax, ay)
+    self.prev_pixel = VEC(qx, qy)
+    self.volleys = [list(v) for v in volleys]
+
   def load_img(self, path):
-    try:
-      raw = pg.image.load(path)
-      chips = []
-      for i in range(4):
-        row = []
-        for j in range(3):
-          rect = (24 * j, 32 * i, 24, 32)
-          img = raw.subsurface(rect)
-          img = pg.transform.scale(
-              img, (int(24 * SCALE), int(32 * SCALE)))
-          row.append(img)
-        chips.append(row)
-      return chips
-    except:
-      return None
+    """ チップの組 [向き][コマ] (同じシートのキャラとは共有。読めなければ None) """
+    if path is None: return None  # 画像なし (ヘッドレス実行)
+    return ASSETS.chips(path)
+
+  def pixel_pos(self):
+    """ 移動アニメ込みの左上のピクセル座標 """
+    return self.pos * CHIP + self.move_anim
 
   def update(self):
     # 死亡演出中は更新処理（移動など）を行わない
@@ -212,10 +977,7 @@ class Char:
       return
 
     if self.cool_time > 0: self.cool_time -= 1
-
-    for b in self.bullets:
-      b.update()
-    self.bullets = [b for b in self.bullets if b.active]
+    if self.volleys: self.update_volleys()
 
     if self.move_vec.length() > 0:
       self.move_anim += self.move_vec * 8
@@ -230,38 +992,64 @@ class Char:
     ct_mult = 0.7 if self.is_awakened else 1.0
     if self.cool_time > 0: return
 
-    base_ct = 8 if btype == "N" else 45
-    self.cool_time = int(base_ct * ct_mult)
+    if btype != "N":
+      pattern = PATTERNS.get(SP_PATTERNS[self.name])
+      if self.is_awakened: pattern = pattern.awake
+      self.cool_time = int(pattern.cooldown * ct_mult)
+      self.fire(pattern, vec, target)
+      return
 
-    center_pos = self.pos + VEC(0.5, 0.5)
+    self.cool_time = int(8 * ct_mult)
+    before = len(self.bullets)
+    self.bullets.spawn(self.pos + VEC(0.5, 0.5), [(vec.x, vec.y)], self, BT_N,
+                       is_awakened=self.is_awakened)
+    self.fired += len(self.bullets) - before
+
+  def fire(self, pattern, vec, target=None):
+    """ パターン pattern を撃つ (クールタイムは見ない)。遅れのある wave は volleys に積む """
+    btype = BULLET_TYPES[pattern.btype]
+    for delay, emitter, wave in pattern.schedule:
+      if delay == 0:
+        self.emit(emitter, wave, vec, target, btype, self.is_awakened)
+      else:
+        self.volleys.append([delay, emitter, wave, VEC(vec), target, btype, self.is_awakened])
 
-    if btype == "N":
-      self.bullets.append(
-          Bullet(center_pos, vec, self.name, "N", is_awakened=self.is_awakened))
-    else:
-      if self.name == "霊夢":
-        base_angle = math.degrees(math.atan2(vec.y, vec.x))
-        for i in range(-2, 3):
-          rad = math.radians(base_angle + i * 20)
-          d = VEC(math.cos(rad), math.sin(rad))
-          self.bullets.append(
-              Bullet(center_pos, d, self.name, "Amulet", target, self.is_awakened))
+  def update_volleys(self):
+    """ 遅れて撃つ wave の時間を進め、時間が来たものを撃つ """
+    waiting = []
+    for v in self.volleys:
+      if v[0] == 0: self.emit(*v[1:])
       else:
-        count = 8 if self.is_awakened else 5
-        base_angle = math.degrees(math.atan2(vec.y, vec.x))
-        for i in range(count):
-          spread = random.uniform(-70, 70)
-          rad = math.radians(base_angle + spread)
-          d = VEC(math.cos(rad), math.sin(rad))
-          b = Bullet(center_pos, d, self.name,
-                     "Star", target, self.is_awakened)
-          b.speed = random.uniform(0.3, 0.8)
-          self.bullets.append(b)
-
-  def draw(self, screen, frame):
+        v[0] -= 1
+        waiting.append(v)
+    self.volleys = waiting
+
+  def emit(self, emitter, wave, vec, target, btype, is_awakened):
+    """ 発射器 emitter の wave 番目の弾をまとめてプールに追加する """
+    center_pos = self.pos + VEC(0.5, 0.5)
+    if emitter.aim == "fixed":
+      base = emitter.angle
+    elif emitter.aim == "target" and target is not None:
+      diff = target.pos - self.pos
+      base = math.degrees(math.atan2(diff.y, diff.x))
+    else:
+      base = math.degrees(math.atan2(vec.y, vec.x))
+    d, speeds = emitter.directions(wave, base, self.rng)
+    self.bullets.spawn(center_pos, d, self, btype, target, is_awakened, speeds,
+                       emitter.homing, emitter.life)
+    self.fired += len(d)
+
+  def draw(self, screen, frame, alpha=1.0, tier=TIERS[0], with_bullets=True, queue=None):
+    """ キャラと弾を描画し、キャラを描いた範囲の Rect を返す (描かなければ None)
+
+    alpha は前のフレームから今のフレームへの補間率 (1 なら今の位置そのまま)。
+    tier (quality.Tier) でオーラを描くかと弾の描き方を決める。
+    with_bullets=False なら弾は描かない (弾をまとめて描くとき用)。
+    queue (RenderQueue) を渡すと screen へは描かず、オーラ・キャラ・弾をその層に積む。
+    """
     # 完全に死亡（リザルト画面での表示など）している場合は描画しない
     if self.is_dying and self.death_timer <= 0:
-      return
+      return None
 
     # 死亡演出中の点滅処理
     if self.is_dying:
@@ -269,26 +1057,28 @@ class Char:
       if (self.death_timer // 2) % 2 == 0:
         pass  # 描画する
       else:
-        return  # 描画しない（透明）
+        return None  # 描画しない（透明）
 
-    draw_pos = self.pos * CHIP - VEC(0, 12) * SCALE + self.move_anim
+    draw_pos = self.prev_pixel.lerp(self.pixel_pos(), alpha) - VEC(0, 12) * SCALE
+    drawn = pg.Rect(draw_pos.x, draw_pos.y, 24 * SCALE, 32 * SCALE)
 
-    if self.is_awakened and not self.is_dying:
-      aura_radius = 30 + math.sin(frame * 0.2) * 5
-      color = (255, 100, 100) if self.name == "魔理沙" else (255, 200, 200)
-      s = pg.Surface((100, 100), pg.SRCALPHA)
-      pg.draw.circle(s, (*color, 100), (50, 50), int(aura_radius))
-      screen.blit(s, (draw_pos.x + 24 - 50, draw_pos.y + 32 - 50))
+    if self.is_awakened and not self.is_dying and tier.aura:
+      aura = EFFECTS.aura(AURA_COLORS.get(self.name, AURA_DEFAULT_COLOR), frame)
+      pos = (draw_pos.x + 24 - 50, draw_pos.y + 32 - 50)
+      drawn.union_ip(aura.get_rect(topleft=pos))
+      if queue is None: screen.blit(aura, pos)
+      else: queue.add(LAYER_AURA, aura, pos)
 
     if not (self.invincible_timer > 0 and (frame // 2) % 2 == 0):
       if self.img:
-        screen.blit(self.img[self.dir][frame // 6 % 3], draw_pos)
+        surf = self.img[self.dir][frame // 6 % 3]
       else:
-        pg.draw.rect(screen, self.color,
-                     (draw_pos.x, draw_pos.y, 48, 64))
+        surf = EFFECTS.block((48, 64), tuple(self.color))   # 画像が無いときの四角
+      if queue is None: screen.blit(surf, draw_pos)
+      else: queue.add(LAYER_CHARS, surf, tuple(draw_pos))
 
-    for b in self.bullets:
-      b.draw(screen)
+    if with_bullets: self.bullets.draw(screen, self, alpha, tier, queue)
+    return drawn
 
   def get_hitbox(self):
     p = self.pos * CHIP + self.move_anim
@@ -297,16 +1087,43 @@ class Char:
 # =============================================================================
 # 6. AIクラス (覚醒ロジック強化)
 # =============================================================================
+# AI の行動パラメータ (_awake は覚醒中の値)
+AI_PARAMS = {
+    "think_threshold": 10, "think_threshold_awake": 5,   # 何フレームごとに考えるか
+    "sp_prob": 0.15, "sp_prob_awake": 0.30,              # 近距離でSPを撃つ確率
+    "normal_prob": 0.6, "normal_prob_awake": 0.85,       # 射線上で通常弾を撃つ確率
+    "dodge_prob": 0.5, "dodge_prob_awake": 0.7,          # 射線上から外れる確率
+    "awaken_hp": 0.5,                                    # 覚醒するHPの割合
+    "danger_ticks": 8,                                   # 弾が来るまでこのフレーム数以下のマスから逃げる (0 で無効)
+}
+
 class AI(Char):
-  def __init__(self, *args, **kwargs):
+  def __init__(self, *args, params=None, **kwargs):
     super().__init__(*args, **kwargs)
     self.wait_timer = 0
+    self.params = {**AI_PARAMS, **(params or {})}
+    self.danger = DangerField(int(MAP_SIZE.x), int(MAP_SIZE.y))
+
+  def snapshot(self):
+    values, volleys = super().snapshot()
+    return values + (self.wait_timer,), volleys
+
+  def restore(self, snap):
+    values, volleys = snap
+    super().restore((values[:-1], volleys))
+    self.wait_timer = values[-1]
+
+  def param(self, key):
+    """ 覚醒状態に応じたパラメータ """
+    if self.is_awakened and key + "_awake" in self.params:
+      return self.params[key + "_awake"]
+    return self.params[key]
 
   def think(self, target_obj):
     # 死亡中は思考停止
     if self.is_dying: return
 
-    if self.hp <= self.max_hp * 0.5:
+    if self.hp <= self.max_hp * self.params["awaken_hp"]:
       self.is_awakened = True
     else:
       self.is_awakened = False
@@ -314,9 +1131,17 @@ class AI(Char):
     target_pos = target_obj.pos
     if self.move_vec.length() > 0: return
 
+    # 敵の弾がすぐ来るマスにいるなら、考える間隔を待たずに一番安全な隣へ逃げる
+    margin = self.param("danger_ticks")
+    if margin > 0:
+      self.sense_danger()
+      if self.danger.at(self.pos.x, self.pos.y) <= margin and self.evade():
+        self.wait_timer = 0
+        return
+
     self.wait_timer += 1
 
-    think_threshold = 5 if self.is_awakened else 10
+    think_threshold = self.param("think_threshold")
 
     if self.wait_timer < think_threshold: return
     self.wait_timer = 0
@@ -330,9 +1155,9 @@ class AI(Char):
     move_vecs = [VEC(0, -1), VEC(1, 0), VEC(0, 1), VEC(-1, 0)]
 
     dist = self.pos.distance_to(target_pos)
-    sp_prob = 0.30 if self.is_awakened else 0.15
+    sp_prob = self.param("sp_prob")
 
-    if dist < 8 and random.random() < sp_prob:
+    if dist < 8 and self.rng.random() < sp_prob:
       if abs(diff.x) > abs(diff.y): self.dir = 1 if diff.x > 0 else 3
       else: self.dir = 2 if diff.y > 0 else 0
       shoot_dir = move_vecs[self.dir]
@@ -340,8 +1165,8 @@ class AI(Char):
       return
 
     if is_aligned:
-      normal_prob = 0.85 if self.is_awakened else 0.6
-      if random.random() < normal_prob:
+      normal_prob = self.param("normal_prob")
+      if self.rng.random() < normal_prob:
         self.shoot(diff, target_obj, "N")
         if diff.y > 0: self.dir = 2
         elif diff.y < 0: self.dir = 0
@@ -350,121 +1175,774 @@ class AI(Char):
         return
 
     move_idx = -1
-    dodge_prob = 0.7 if self.is_awakened else 0.5
+    dodge_prob = self.param("dodge_prob")
 
-    if is_aligned and random.random() < dodge_prob:
+    if is_aligned and self.rng.random() < dodge_prob:
       if abs(diff.x) < 0.5: move_idx = 2 if self.pos.y < target_pos.y else 0
       else: move_idx = 1 if self.pos.x < target_pos.x else 3
-    elif random.random() < 0.7:
+    elif self.rng.random() < 0.7:
       if abs(diff.x) > abs(diff.y): move_idx = 1 if diff.x > 0 else 3
       else: move_idx = 2 if diff.y > 0 else 0
     else:
-      move_idx = random.randint(0, 3)
+      move_idx = self.rng.randint(0, 3)
 
     next_pos = self.pos + move_vecs[move_idx]
-    if 0 <= next_pos.x < MAP_SIZE.x and 0 <= next_pos.y < MAP_SIZE.y:
+    if margin > 0 and self.danger.at(next_pos.x, next_pos.y) <= margin:
+      return   # 弾が来るマスには自分から入らない
+    if self.can_enter(next_pos):
       self.dir = move_idx
       self.move_vec = move_vecs[move_idx]
 
+  def sense_danger(self):
+    """ 危険度マップ self.danger を今の弾で作り直す """
+    self.danger.update(*self.bullets.incoming(self))
+
+  def can_enter(self, pos):
+    """ マス pos へ動き出してよいか (マップの中なら良い) """
+    return 0 <= pos.x < MAP_SIZE.x and 0 <= pos.y < MAP_SIZE.y
+
+  def evade(self):
+    """ 危険度マップで今より弾の来るのが遅い隣のマスへ動き出す (動けたら True) """
+    here = self.danger.at(self.pos.x, self.pos.y)
+    best, best_eta = -1, here
+    for i, v in enumerate(MOVE_VECS):
+      eta = self.danger.at(self.pos.x + v.x, self.pos.y + v.y)
+      if eta > best_eta and self.can_enter(self.pos + v): best, best_eta = i, eta
+    if best == -1: return False
+    self.dir = best
+    self.move_vec = VEC(MOVE_VECS[best])
+    return True
+
+# --- 先読みする AI (SearchAI) ---
+MACRO_TICKS = int(CHIP / 8)   # 1マス動くのにかかるフレーム数 (先読みの1手の長さ)
+INVINCIBLE_TICKS = 20         # 被弾後の無敵時間
+# 先読みで選ぶ行動: 待つ・上右下左へ1マス・通常弾・SP
+ACT_WAIT, ACT_N, ACT_SP = 0, 5, 6
+SEARCH_ACTIONS = range(7)
+# 難易度ごとの考える量。budget_us は1フレームあたりの持ち時間 (マイクロ秒)、
+# nodes は実行速度によらず同じ結果にしたいとき (リプレイ・ヘッドレス) の1フレームあたりの展開数。
+# 展開1回は弾が少なければ 0.1-0.4 ms、遅いほう (p99) で 0.6 ms ほどかかるので、nodes は
+# 重いフレームでも先読みが 5 ms ほど (1フレーム 25 ms の1/5) に収まる数にしてある。その分 hard / lunatic は
+# 1回の読みを終えるのに数フレーム余計にかかり (lunatic は1手の間に読み切れない)、実時間のときより少し弱い。
+# 弾が SEARCH_NODE_BULLETS 発を超えると展開1回が重くなるので、nodes も弾数に反比例して減らす。
+SEARCH_LEVELS = {
+    "easy":    {"budget_us": 300,  "nodes": 2,  "width": 3, "depth": 2},
+    "normal":  {"budget_us": 1000, "nodes": 4,  "width": 4, "depth": 3},
+    "hard":    {"budget_us": 2500, "nodes": 6,  "width": 6, "depth": 3},
+    "lunatic": {"budget_us": 5000, "nodes": 8,  "width": 8, "depth": 4},
+}
+SEARCH_NODE_BULLETS = 8
+
+
+class SimState:
+  """ 先読み用に縮めた試合の状態 (2人の位置・HP・クールタイムと弾の配列だけ)
+
+  番号 0 が先読みする AI、1 が相手。位置はマス単位で、pos は移動前のマス、
+  step は移動を始めてから進んだフレーム数。2人の値は長さ2のリストで持ち、
+  弾は1発1行の配列 b (列は B_X などの番号、B_SIDE は撃ったキャラの番号) にまとめる。
+  相手は動かず、射線に入ったら通常弾を撃ってくるものとして進める。
+  """
+  B_X, B_Y, B_DX, B_DY, B_SPEED, B_LIFE, B_HOMING, B_HALF, B_SIDE = range(9)
+
+  def copy(self):
+    s = SimState.__new__(SimState)
+    s.names, s.awake = self.names, self.awake
+    s.pos = [list(p) for p in self.pos]
+    s.move = [list(m) for m in self.move]
+    s.step, s.hp, s.cool, s.inv = list(self.step), list(self.hp), list(self.cool), list(self.inv)
+    s.b = self.b.copy()
+    return s
+
+  @classmethod
+  def capture(cls, me, foe, pool):
+    s = cls.__new__(cls)
+    chars = (me, foe)
+    s.names = (me.name, foe.name)
+    s.awake = (me.is_awakened, foe.is_awakened)
+    s.pos = [[c.pos.x, c.pos.y] for c in chars]
+    s.move = [[c.move_vec.x, c.move_vec.y] for c in chars]
+    s.step = [int(c.move_anim.length()) // 8 for c in chars]
+    s.hp = [c.hp for c in chars]
+    s.cool = [c.cool_time for c in chars]
+    s.inv = [c.invincible_timer for c in chars]
+
+    n = pool.count
+    s.b = np.column_stack((
+        pool.pos[:n], pool.direction[:n], pool.speed[:n],
+        pool.life_time[:n] - pool.timer[:n], pool.homing_strength[:n],
+        np.where(pool.btype[:n] == BT_STAR, 10, 6) / CHIP,
+        pool.owner[:n] != pool.register(me)))
+    return s
+
+  def same(self, other):
+    """ 先読みしておいた局面 other が今の局面と同じとみなせるか """
+    return (self.pos == other.pos and self.move == other.move and self.step == other.step
+            and self.hp == other.hp and len(self.b) == len(other.b)
+            and self.b[:, self.B_SIDE].sum() == other.b[:, self.B_SIDE].sum())
+
+  def center(self, side):
+    """ 移動分を含めたキャラの中心 """
+    f = self.step[side] / MACRO_TICKS
+    return (self.pos[side][0] + self.move[side][0] * f + 0.5,
+            self.pos[side][1] + self.move[side][1] * f + 0.5)
+
+  def add_bullets(self, side, d, btype, speeds=None, homing=None, life=None):
+    speed, _, default_life, default_homing = bullet_params(btype, self.names[side], self.awake[side])
+    d = np.asarray(d, dtype=float).reshape(-1, 2)
+    rows = np.empty((len(d), 9))
+    rows[:, 0:2] = (self.pos[side][0] + 0.5, self.pos[side][1] + 0.5)
+    rows[:, 2:4] = d / np.hypot(d[:, 0], d[:, 1])[:, None]
+    rows[:, self.B_SPEED] = speed if speeds is None else speeds
+    rows[:, self.B_LIFE] = default_life if life is None else life
+    rows[:, self.B_HOMING] = default_homing if homing is None else homing
+    rows[:, self.B_HALF] = (10 if btype == BT_STAR else 6) / CHIP
+    rows[:, self.B_SIDE] = side
+    self.b = np.concatenate((self.b, rows))
+
+  def shoot(self, side, action):
+    """ Char.shoot と同じ向き・弾数で撃つ
+
+    SP はパターンのうちすぐに撃つ wave だけを、乱数を使わない代表的な向き・速さ (preview) で撃つ。
+    """
+    if self.cool[side] > 0: return
+    mult = 0.7 if self.awake[side] else 1.0
+    dx = self.pos[1 - side][0] - self.pos[side][0]
+    dy = self.pos[1 - side][1] - self.pos[side][1]
+    if action == ACT_N:
+      self.cool[side] = int(8 * mult)
+      self.add_bullets(side, (dx, dy) if dx or dy else (0, 1), BT_N)
+      return
+    pattern = PATTERNS.get(SP_PATTERNS[self.names[side]])
+    if self.awake[side]: pattern = pattern.awake
+    self.cool[side] = int(pattern.cooldown * mult)
+    if abs(dx) > abs(dy): facing = 0 if dx > 0 else 180
+    else: facing = 90 if dy > 0 else 270
+    for delay, emitter, wave in pattern.schedule:
+      if delay > 0: break
+      if emitter.aim == "fixed": base = emitter.angle
+      elif emitter.aim == "target": base = math.degrees(math.atan2(dy, dx))
+      else: base = facing
+      d, speeds = emitter.preview(wave, base)
+      self.add_bullets(side, d, BULLET_TYPES[pattern.btype], speeds, emitter.homing, emitter.life)
+
+  def act(self, action):
+    """ 番号 0 のキャラが action を始める """
+    if ACT_WAIT < action < ACT_N:
+      v = MOVE_VECS[action - 1]
+      x, y = self.pos[0][0] + v.x, self.pos[0][1] + v.y
+      if 0 <= x < MAP_SIZE.x and 0 <= y < MAP_SIZE.y:
+        self.move[0] = [v.x, v.y]
+    elif action != ACT_WAIT:
+      self.shoot(0, action)
+
+  def advance(self, n, foe_shoots=True):
+    """ n フレームまとめて進める (Match.step と同じく 射撃 -> 移動 -> 弾 -> 当たり判定 の順)
+
+    1手の間は2人とも向きを変えないので、キャラと弾の位置は n フレーム分を配列でまとめて出す。
+    ホーミング弾だけは1フレームずつ曲げる (狙う位置は手の始めの位置のまま)。
+    """
+    if n <= 0 or self.hp[0] <= 0 or self.hp[1] <= 0: return
+    old = len(self.b)
+    born = []   # 相手が撃った弾ごとの撃ったフレーム
+    (x0, y0), (x1, y1) = self.pos
+    if foe_shoots and (abs(x0 - x1) < 0.5 or abs(y0 - y1) < 0.5):
+      i = self.cool[1]
+      while i < n:
+        self.cool[1] = 0
+        self.shoot(1, ACT_N)
+        born.append(i)
+        i += self.cool[1]
+    last = born[-1] if born else 0
+    self.cool = [max(self.cool[0] - n, 0), max(self.cool[1] - (n - last), 0)]
+
+    # 各フレームの更新後のキャラの中心 (弾があるときだけ使う)
+    b = self.b
+    if len(b):
+      ticks = np.arange(1, n + 1)
+      centers = []
+      for i in (0, 1):
+        f = np.minimum(self.step[i] + ticks, MACRO_TICKS) / MACRO_TICKS
+        centers.append((self.pos[i][0] + 0.5 + self.move[i][0] * f,
+                        self.pos[i][1] + 0.5 + self.move[i][1] * f))
+    targets = list(self.pos)   # ホーミングの狙い (移動前のマス)
+    for i in (0, 1):
+      if self.move[i] == [0, 0]: continue
+      if self.step[i] + n >= MACRO_TICKS:
+        self.pos[i] = [self.pos[i][0] + self.move[i][0], self.pos[i][1] + self.move[i][1]]
+        self.move[i] = [0, 0]
+        self.step[i] = 0
+      else:
+        self.step[i] += n
+    inv = list(self.inv)
+    self.inv = [max(v - n, 0) for v in inv]
+
+    if len(b) == 0: return
+    start = np.zeros(len(b))
+    start[old:old + len(born)] = born
+    moves = np.maximum(ticks[:, None] - start, 0)   # (n, 弾) そのフレームまでに進んだ回数
+    side = b[:, self.B_SIDE]
+    pos = b[:, 0:2] + (b[:, 2:4] * b[:, self.B_SPEED, None]) * moves[..., None]
+
+    homing = np.flatnonzero(b[:, self.B_HOMING] > 0)
+    if len(homing):
+      h = b[homing]
+      p, d = h[:, 0:2].copy(), h[:, 2:4].copy()
+      speed, strength = h[:, self.B_SPEED, None], h[:, self.B_HOMING, None]
+      aim = np.array(targets)[1 - h[:, self.B_SIDE].astype(int)]
+      for t in range(n):
+        on = (start[homing] <= t)[:, None]
+        diff = aim - p
+        dist = np.hypot(diff[:, 0], diff[:, 1])[:, None]
+        steer = d + (diff / np.where(dist == 0, 1, dist) - d) * strength
+        norm = np.hypot(steer[:, 0], steer[:, 1])[:, None]
+        d = np.where(on, steer / np.where(norm == 0, 1, norm), d)
+        p = p + d * speed * on
+        pos[t, homing] = p
+      b[homing, 2:4] = d
+
+    # 当たり判定 (キャラの当たり判定は1マスの中央半分)。弾は最初に触れたフレームで消える
+    exists = (ticks[:, None] > start) & (b[:, self.B_LIFE] - moves >= 0)
+    (cx0, cy0), (cx1, cy1) = centers
+    reach = 0.25 + b[:, self.B_HALF]
+    touch = (exists &
+             (np.abs(pos[..., 0] - (cx1[:, None] + (cx0 - cx1)[:, None] * side)) < reach) &
+             (np.abs(pos[..., 1] - (cy1[:, None] + (cy0 - cy1)[:, None] * side)) < reach))
+    hit = touch.any(axis=0)
+    if hit.any():
+      first = touch.argmax(axis=0)
+      for i in (0, 1):
+        t = first[hit & (side != i)]
+        t = t[t + 1 >= inv[i]]   # 無敵時間が切れてから当たった弾
+        if len(t):
+          self.hp[i] -= 1
+          self.inv[i] = INVINCIBLE_TICKS - (n - 1 - int(t.min()))
+
+    b[:, 0:2] = pos[-1]
+    b[:, self.B_LIFE] -= moves[-1]
+    x, y = b[:, self.B_X], b[:, self.B_Y]
+    keep = ~hit & exists[-1] & (np.abs(x - MAP_SIZE.x / 2) <= MAP_SIZE.x / 2 + 2) & \
+           (np.abs(y - MAP_SIZE.y / 2) <= MAP_SIZE.y / 2 + 2)
+    if not keep.all(): self.b = b[keep]
+
+
+def sim_expand(state, action):
+  """ state から action を1手 (MACRO_TICKS フレーム) 行った後の局面 """
+  s = state.copy()
+  s.act(action)
+  s.advance(MACRO_TICKS)
+  return s
+
+
+def sim_evaluate(s, lookahead=12):
+  """ 局面の点数 (AI 側から見て高いほど良い)
+
+  HP 差に加えて、今飛んでいる弾がまっすぐ進んだときに当たりそうかを見る
+  (相手の弾が lookahead フレーム以内に当たりそうなら減点、自分の弾が相手に向かっていれば1発ごとに加点)。
+  """
+  if s.hp[0] <= 0: return -1000.0
+  if s.hp[1] <= 0: return 1000.0
+  score = 12.0 * s.hp[0] - 10.0 * s.hp[1]
+
+  b = s.b
+  if len(b):
+    (cx0, cy0), (cx1, cy1) = s.center(0), s.center(1)
+    side = b[:, s.B_SIDE]
+    rx = cx1 + (cx0 - cx1) * side - b[:, s.B_X]
+    ry = cy1 + (cy0 - cy1) * side - b[:, s.B_Y]
+    vx = b[:, s.B_DX] * b[:, s.B_SPEED]
+    vy = b[:, s.B_DY] * b[:, s.B_SPEED]
+    t = np.minimum(np.maximum((rx * vx + ry * vy) / np.maximum(vx * vx + vy * vy, 1e-9), 0),
+                   b[:, s.B_LIFE])
+    # ホーミング弾は曲がってくるので、まっすぐ進んだときに少し外れるものも当たるとみなす
+    reach = 0.25 + b[:, s.B_HALF] + (b[:, s.B_HOMING] > 0) * 1.0
+    hits = (np.abs(rx - vx * t) < reach) & (np.abs(ry - vy * t) < reach)
+    threat = hits & (side == 1) & (t <= lookahead)
+    if threat.any() and s.inv[0] < t[threat].min(): score -= 6.0
+    score += 2.5 * min(np.count_nonzero(hits & (side == 0)), 4)
+
+  dx = s.pos[1][0] - s.pos[0][0]
+  dy = s.pos[1][1] - s.pos[0][1]
+  score -= 0.1 * abs(math.hypot(dx, dy) - 5)   # 近すぎず遠すぎない距離を好む
+  if (abs(dx) < 0.5 or abs(dy) < 0.5) and s.cool[0] == 0: score += 0.3   # 撃てる射線上
+  return score
+
+
+class SearchAI(AI):
+  """ ビームサーチで数手先まで読んで行動する AI (level は SEARCH_LEVELS の難易度)
+
+  1フレームに考える量は realtime=True なら budget_us マイクロ秒、False なら nodes 個の展開
+  (弾が多いときは減らす) で、後者は実行速度によらず同じ試合になる (リプレイ・ヘッドレス用)。
+  1手 (MACRO_TICKS フレーム) を実行している間も、その手が終わった後の局面を考え続ける。
+  realtime=True の持ち時間には、今の局面を読み取って手の終わりまで進める分も含む
+  (ただし展開は1つ始めたら最後まで行うので、その分だけ超えることがある)。
+  """
+  def __init__(self, *args, level="normal", realtime=False, **kwargs):
+    super().__init__(*args, **kwargs)
+    cfg = SEARCH_LEVELS[level]
+    self.level = level
+    self.realtime = realtime
+    self.budget_us = cfg["budget_us"]
+    self.nodes = cfg["nodes"]
+    self.search = BeamSearch(sim_expand, sim_evaluate, SEARCH_ACTIONS, cfg["width"], cfg["depth"])
+    self.busy = 0   # 今の手の残りフレーム数
+
+  def think(self, target_obj):
+    if self.is_dying: return
+    start = time.perf_counter_ns()
+    self.is_awakened = self.hp <= self.max_hp * self.params["awaken_hp"]
+    if self.busy > 0: self.busy -= 1
+
+    # 今の手が終わる時点の局面 (今の局面を、相手は撃たないものとして残りフレームだけ進める)
+    root = SimState.capture(self, target_obj, self.bullets)
+    root.advance(self.busy, foe_shoots=False)
+    stale = self.search.best()
+    if self.search.root is None or not root.same(self.search.root):
+      # 読みが外れたので読み直す (それまでの読みの手を最初に調べる)
+      self.search.reset(root, first=stale[0] if stale else None)
+    if self.realtime:
+      self.search.run(deadline_ns=start + self.budget_us * 1000)
+    else:
+      bullets = max(len(root.b), SEARCH_NODE_BULLETS)
+      self.search.run(max_nodes=max(self.nodes * SEARCH_NODE_BULLETS // bullets, 1))
+    if self.busy > 0 or self.move_vec.length() > 0: return
+
+    # 読み直しが1手も終わらなければ、外れた読みでも前の手順の続きを使う
+    plan = self.search.best() or stale
+    action = plan[0] if plan else ACT_WAIT
+    self.act(action, target_obj)
+    self.search.advance(action)
+    if self.search.root is None:
+      self.search.reset(sim_expand(root, action))   # 続きの読みが無ければ、この手の後の局面から読む
+    self.busy = MACRO_TICKS
+
+  def act(self, action, target_obj):
+    diff = target_obj.pos - self.pos
+    if ACT_WAIT < action < ACT_N:
+      next_pos = self.pos + MOVE_VECS[action - 1]
+      if 0 <= next_pos.x < MAP_SIZE.x and 0 <= next_pos.y < MAP_SIZE.y:
+        self.dir = action - 1
+        self.move_vec = VEC(MOVE_VECS[action - 1])
+    elif action == ACT_N:
+      self.shoot(diff, target_obj, "N")
+    elif action == ACT_SP:
+      if abs(diff.x) > abs(diff.y): self.dir = 1 if diff.x > 0 else 3
+      else: self.dir = 2 if diff.y > 0 else 0
+      self.shoot(MOVE_VECS[self.dir], target_obj, "S")
+
+# =============================================================================
+# 7. 試合の進行 (Match)
+# =============================================================================
+def read_input(keys):
+  """ pg.key.get_pressed() の結果を入力ビットにする """
+  bits = 0
+  if keys[pg.K_UP]: bits |= IN_UP
+  if keys[pg.K_RIGHT]: bits |= IN_RIGHT
+  if keys[pg.K_DOWN]: bits |= IN_DOWN
+  if keys[pg.K_LEFT]: bits |= IN_LEFT
+  if keys[pg.K_SPACE]: bits |= IN_SHOT
+  if keys[pg.K_v]: bits |= IN_SP
+  return bits
+
+def control(char, opponent, bits):
+  """ 入力ビットでキャラを操作する (移動は1マス単位、相手のマスには入れない) """
+  if char.is_dying: return  # 死亡時は操作不可
+
+  if char.move_vec.length() == 0:
+    mv = -1
+    for i, bit in enumerate(MOVE_BITS):
+      if bits & bit: mv = i   # 同時押しは 上 < 右 < 下 < 左 の順で後ろが優先
+    if mv != -1:
+      char.dir = mv
+      next_p = char.pos + MOVE_VECS[mv]
+      if (0 <= next_p.x < MAP_SIZE.x and 0 <= next_p.y < MAP_SIZE.y and next_p != opponent.pos):
+        char.move_vec = VEC(MOVE_VECS[mv])
+
+  current_dir_vec = MOVE_VECS[char.dir]
+  if bits & IN_SHOT: char.shoot(current_dir_vec, opponent, "N")
+  if bits & IN_SP: char.shoot(current_dir_vec, opponent, "S")
+
+
+def apply_hits(bullets, defenders, hits, events):
+  """ collide の結果 hits でダメージを与え、被弾 (defender, 当たった位置のピクセル座標) を events に足す """
+  for defender, hit in zip(defenders, hits):
+    if len(hit):
+      # 同じフレームに複数当たっても、ダメージは先頭の1発分だけ (以降は無敵時間)
+      first = hit[0]
+      if defender.invincible_timer <= 0:
+        defender.hp -= int(bullets.damage[first])
+        defender.invincible_timer = INVINCIBLE_TICKS
+        events.append((defender, VEC(*bullets.pos[first]) * CHIP))
+
+        # HPが0になったら死亡演出開始
+        if defender.hp <= 0:
+          defender.hp = 0
+          defender.is_dying = True
+          defender.death_timer = 80  # 2秒間 (40FPS * 2)
+
+
+class Match:
+  """ 1試合分のゲーム進行 (画面・キー入力・実時間には依存しない)
+
+  step(inputs) 1回で1フレーム (1/40秒) 進む。乱数は seed から作った専用の
+  random.Random だけを使うので、同じ seed と入力列からは必ず同じ試合になる。
+  reimu_ai=True なら霊夢も AI が操作する (AI 同士の対戦)。
+  marisa_params / reimu_params は AI_PARAMS を上書きする AI の行動パラメータ。
+  marisa_level を指定すると魔理沙はその難易度の SearchAI になる。realtime=True なら
+  SearchAI は実時間で考える量を決める (速いが、同じ seed でも同じ試合になるとは限らない)。
+  versus=True なら魔理沙も人が操作し、step の marisa_inputs で動かす (対戦モード)。
+  snapshot() / restore() で試合の状態をそのフレームに戻せる (ロールバック用)。
+
+  1フレームの順番は 霊夢の判断・移動 -> 魔理沙の判断・移動 -> 両者の弾 -> 当たり判定。
+  弾を BulletPool にまとめる前は霊夢の弾だけ魔理沙が動く前に進んでいたので、それ以前とは
+  霊夢の弾のホーミングの狙いと当たるフレームが1フレーム分ずれることがある (同じ seed でも別の試合になる)。
+  """
+  def __init__(self, seed=None, load_images=True, reimu_ai=False,
+               marisa_params=None, reimu_params=None, marisa_level=None, realtime=False,
+               versus=False):
+    self.seed = seed if seed is not None else random.randrange(2 ** 32)
+    self.rng = random.Random(self.seed)
+    self.bullets = BulletPool()
+    img = (lambda name: f'./data/img/{name}.png') if load_images else (lambda name: None)
+    self.reimu_ai = reimu_ai
+    if reimu_ai:
+      self.reimu = AI('霊夢', (2, 4), img('reimu'), pg.Color('RED'), 20, self.bullets,
+                      params=reimu_params)
+    else:
+      self.reimu = Char('霊夢', (2, 4), img('reimu'), pg.Color('RED'), 20, self.bullets)
+    self.versus = versus
+    if versus:
+      self.marisa = Char('魔理沙', (13, 4), img('marisa'), pg.Color('YELLOW'), 30, self.bullets)
+    elif marisa_level:
+      self.marisa = SearchAI('魔理沙', (13, 4), img('marisa'), pg.Color('YELLOW'), 30, self.bullets,
+                             params=marisa_params, level=marisa_level, realtime=realtime)
+    else:
+      self.marisa = AI('魔理沙', (13, 4), img('marisa'), pg.Color('YELLOW'), 30, self.bullets,
+                       params=marisa_params)
+    for char in (self.reimu, self.marisa):
+      char.rng = self.rng
+    self.tick = 0
+    self.over = False
+    self.events = []   # このフレームの被弾 (defender, 当たった位置のピクセル座標)
+    self.prof = NULL_PROFILER   # フェーズごとの時間計測 (main() が差し替える)
+
+  @property
+  def winner(self):
+    return "霊夢" if self.marisa.hp <= 0 else "魔理沙"
+
+  def snapshot(self):
+    """ 今のフレームの状態 (乱数・両キャラ・弾) のコピー (SearchAI の探索途中の状態は含めない) """
+    return (self.tick, self.over, self.rng.getstate(),
+            self.reimu.snapshot(), self.marisa.snapshot(), self.bullets.snapshot())
+
+  def restore(self, snap):
+    """ snapshot() を取ったフレームに戻す (キャラと弾プールは同じオブジェクトのまま書き戻す) """
+    tick, self.over, rng_state, reimu, marisa, bullets = snap
+    self.tick = tick
+    self.rng.setstate(rng_state)
+    self.reimu.restore(reimu)
+    self.marisa.restore(marisa)
+    self.bullets.restore(bullets)
+    self.events = []
+
+  def run(self, max_ticks=40 * 60 * 5, policy=None):
+    """ 決着か max_ticks まで進める (policy(match) は霊夢の入力ビットを返す関数) """
+    while not self.over and self.tick < max_ticks:
+      self.step(policy(self) if policy else 0)
+    return self
+
+  def step(self, inputs=0, marisa_inputs=0):
+    """ 霊夢の入力ビット inputs (対戦モードでは魔理沙は marisa_inputs) で1フレーム進め、
+    このフレームの被弾イベントを返す """
+    reimu, marisa, prof = self.reimu, self.marisa, self.prof
+    self.events = []
+    self.tick += 1
+    for char in (reimu, marisa): char.prev_pixel = char.pixel_pos()
+
+    if self.reimu_ai:
+      if not reimu.is_dying: reimu.think(marisa)
+    else:
+      control(reimu, marisa, inputs)
+    prof.lap("think")
+    reimu.update()
+    if reimu.invincible_timer > 0: reimu.invincible_timer -= 1
+
+    # プレイヤーの死亡演出更新
+    if reimu.is_dying:
+      reimu.death_timer -= 1
+      if reimu.death_timer <= 0:
+        self.over = True
+
+    # 魔理沙の更新
+    if not marisa.is_dying:
+      prof.lap("update")
+      if self.versus:
+        # 人が操作する魔理沙も AI と同じく HP が減ると覚醒する
+        marisa.is_awakened = marisa.hp <= marisa.max_hp * AI_PARAMS["awaken_hp"]
+        control(marisa, reimu, marisa_inputs)
+      else:
+        marisa.think(reimu)
+      prof.lap("think")
+      marisa.update()
+      if marisa.invincible_timer > 0: marisa.invincible_timer -= 1
+    else:
+      # 死亡演出中の更新
+      marisa.death_timer -= 1
+      if marisa.death_timer <= 0:
+        self.over = True
+
+    prof.lap("update")
+
+    # 弾は両者の分をまとめて1回で更新 (射撃の後なので撃った弾もこのフレームで進む)。
+    # 霊夢の弾も魔理沙が動いた後に進むので、ホーミングは魔理沙の移動後の位置を狙う
+    self.bullets.update()
+    prof.lap("bullets")
+
+    # 当たり判定
+    # 死亡演出中はお互いに当たり判定を処理しない（既に死んでいるので）
+    if not reimu.is_dying and not marisa.is_dying:
+      defenders = (marisa, reimu)
+      hits = self.bullets.collide(defenders)
+      apply_hits(self.bullets, defenders, hits, self.events)
+      self.bullets.remove(np.concatenate(hits))
+    prof.lap("collision")
+
+    return self.events
+
 # =============================================================================
-# 7. メイン処理
+# 8. メイン処理
 # =============================================================================
-def main():
+HIT_COLOR = (255, 255, 0)   # 被弾時の火花の色
+
+def warm_caches():
+  """ 描画キャッシュを起動時にまとめて作っておく (プレイ中に作ると引っかかるため) """
+  BULLET_SPRITES.build()
+  for layers in STAR_BULLET_LAYERS.values():
+    for n in range(1, len(layers) + 1): STAR_CACHE.sheet(layers[:n])   # 品質を落としたときの分も
+  for color in (*AURA_COLORS.values(), AURA_DEFAULT_COLOR): EFFECTS.aura_frames(color)
+
+def new_recorder(record_dir, match):
+  """ record_dir にこの試合のリプレイを書き始める (record_dir が None なら記録しない) """
+  if record_dir is None: return None
+  name = time.strftime("%Y%m%d-%H%M%S") + f"-{match.seed}.rep"
+  level = getattr(match.marisa, "level", None)
+  return ReplayWriter(os.path.join(record_dir, name), match.seed, level)
+
+TICK_MS = 25            # ゲームの1フレーム (40Hz) の長さ
+MAX_CATCHUP_TICKS = 8   # 描画1回の間に追いつきのため進めてよいフレーム数
+MAX_FRAME_SKIP = 4      # 追いつくまでに続けて描画を飛ばしてよい回数
+MAX_LAG_MS = 250        # これ以上の遅れは捨てる (ここまで遅れるとゲームがゆっくりになる)
+
+def main(dirty_rects=False, record_dir=None, replay=None, speed=1,
+         profile=False, profile_csv=None, render_fps=0, vsync=False,
+         profile_startup=False, level=None, net=None, quality="auto"):
+  """ dirty_rects=True で、変化した領域だけを画面に送るモードにする
+
+  record_dir を指定すると試合ごとのリプレイをそこに書く。replay (Replay) を渡すと
+  タイトルを飛ばしてその試合を再生し、1描画フレームあたり speed フレーム進める。
+  profile=True でフェーズごとの処理時間を重ねて表示する (F3 キーで切り替え)。
+  profile_csv を指定するとフレームごとの時間をその CSV に書き出す。
+
+  ゲームの更新は描画と切り離して常に 40Hz (TICK_MS ごと) で進め、描画はその間の位置を
+  補間して render_fps (0 なら上限なし) か vsync=True なら画面のリフレッシュに合わせて行う。
+  処理が追いつかないときは更新を優先し、描画のほうを飛ばす。
+  profile_startup=True で、起動から最初のフレームまでの時間を段階ごとに表示する。
+  level (SEARCH_LEVELS の難易度) を指定すると魔理沙は先読みする SearchAI になる。
+  リプレイを記録しないときは実時間の持ち時間で考え、記録するときは再現できるよう展開数で考える。
+  net = (side, transport, seed, delay) を渡すと、接続済みの相手との対戦 (ロールバック方式) になる。
+  side は自分が操作するキャラ (0 霊夢 / 1 魔理沙)。タイトルを飛ばし、試合が終わったら閉じる (記録はしない)。
+  quality="auto" なら描画が重いときに演出を間引く (QualityGovernor)。TIERS の名前を渡すとその品質に固定する。
+  今の品質と変更の履歴はプロファイラの表示に出る。
+  """
+  startup = StartupProfiler(PROCESS_START)
+  startup.mark("import")
   state = State.TITLE
   menu_cursor = 0
-  pg.init()
-  screen = pg.display.set_mode((SCREEN_W, SCREEN_H))
-  world_screen = pg.Surface((SCREEN_W, SCREEN_H))
+  # 使うのは画面とフォントだけなので、pg.init() で音などまで起動しない
+  pg.display.init()
+  pg.font.init()
+  startup.mark("init")
+  if vsync:
+    screen = pg.display.set_mode((SCREEN_W, SCREEN_H), pg.SCALED, vsync=1)
+  else:
+    screen = pg.display.set_mode((SCREEN_W, SCREEN_H))
+  world_screen = SURFACES.new((SCREEN_W, SCREEN_H))
+  startup.mark("set_mode")
+  arena = ArenaLayer()
+  dirty = DirtyTiles((SCREEN_W, SCREEN_H)) if dirty_rects else None
+  warm_caches()
+  startup.mark("caches")
 
   pg.display.set_caption("東方弾幕バトル")
   clock = pg.time.Clock()
 
-  start_title = pg.font.SysFont("msgothic", 50)
-  font = pg.font.SysFont("msgothic", 30)
-  small_font = pg.font.SysFont("msgothic", 25)
-  huge_font = pg.font.SysFont("msgothic", 80)
-
-  particles = []
-  move_vecs = [VEC(0, -1), VEC(1, 0), VEC(0, 1), VEC(-1, 0)]
-
-  reimu = Char('霊夢', (2, 4), './data/img/reimu.png', pg.Color('RED'), 20)
-  marisa = AI('魔理沙', (13, 4), './data/img/marisa.png', pg.Color('YELLOW'), 30)
-
-  countdown_start_tick = 0
-  countdown_val = 3
+  # フォントは同梱 -> 前回の検索結果 -> システム検索 の順に1回だけ解決する
+  font_path = resolve_font(font_dir=FONT_DIR, cache_path=FONT_CACHE)
+  start_title = pg.font.Font(font_path, 50)
+  font = pg.font.Font(font_path, 30)
+  small_font = pg.font.Font(font_path, 25)
+  huge_font = pg.font.Font(font_path, 80)
+  startup.mark("fonts")
+
+  particles = ParticleSystem()
+  particles.warm(HIT_COLOR)
+  new_match = lambda: Match(marisa_level=level, realtime=record_dir is None)
+  session = None
+  if net:
+    side, transport, seed, delay = net
+    match = Match(seed, versus=True)
+    session = RollbackSession(match, side, transport, delay)
+    record_dir = None
+  else:
+    match = replay.match(load_images=True) if replay else new_match()
+  ASSETS.convert_all()
+  reimu, marisa, bullets = match.reimu, match.marisa, match.bullets
+  startup.mark("sprites")
+  recorder = None
+  if replay: state = State.PLAY
+  if net: state = State.COUNTDOWN
+
+  # 表示も CSV も無いときは何もしない NULL_PROFILER を使う
+  profiler = FrameProfiler(csv_path=profile_csv)
+  prof_overlay = ProfilerOverlay(pg.font.Font(None, 18))
+  queue = RenderQueue()   # ゲーム内世界のスプライトは層ごとにまとめて描く
+  show_prof = profile
+  prof = profiler if show_prof or profile_csv else NULL_PROFILER
+  match.prof = prof
+  governor = QualityGovernor(1000 / render_fps if render_fps else TICK_MS,
+                             enabled=quality == "auto")
+  if quality != "auto": governor.level = [t.name for t in TIERS].index(quality)
+  busy = 0.0           # 前の描画からの処理時間 (待ちを除く、秒)
+
+  countdown_ticks = 0
   shake_timer = 0
+  shake_offset = (0, 0)
+  ui_tick = 0          # 状態によらず進むフレーム数 (アニメ・点滅用)
+  lag = 0              # まだ進めていない時間 (ms)
+  last_ms = pg.time.get_ticks()
+  skipped = 0          # 続けて飛ばした描画の回数
 
   running = True
   while running:
-    screen.fill((0, 0, 0))
-    world_screen.fill((30, 30, 40))
+    frame_start = time.perf_counter()
+    tier = governor.tier
+    update_rects = None  # None なら全画面を flip
+    prof.begin()
+    prof_toggled = False
+
+    now_ms = pg.time.get_ticks()
+    rate = speed if replay else 1   # リプレイの早送りは1msあたりに進める時間を増やす
+    lag = min(lag + (now_ms - last_ms) * rate, MAX_LAG_MS * rate)
+    last_ms = now_ms
 
     for event in pg.event.get():
       if event.type == pg.QUIT:
         running = False
 
+      if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+        show_prof = not show_prof
+        prof_toggled = True
+        prof = profiler if show_prof or profile_csv else NULL_PROFILER
+        match.prof = prof
+
       if state == State.TITLE:
         if event.type == pg.KEYDOWN:
           if event.key == pg.K_UP: menu_cursor = 0
           if event.key == pg.K_DOWN: menu_cursor = 1
           if event.key == pg.K_SPACE:
             if menu_cursor == 0:
-              reimu.hp = reimu.max_hp
-              reimu.pos = VEC(2, 4)
-              reimu.bullets = []
-              reimu.invincible_timer = 0
-              reimu.is_awakened = False
-              reimu.is_dying = False
-
-              marisa.hp = marisa.max_hp
-              marisa.pos = VEC(13, 4)
-              marisa.bullets = []
-              marisa.invincible_timer = 0
-              marisa.is_awakened = False
-              marisa.is_dying = False
-
-              particles = []
+              match = new_match()
+              match.prof = prof
+              reimu, marisa, bullets = match.reimu, match.marisa, match.bullets
+              if recorder: recorder.close()
+              recorder = new_recorder(record_dir, match)
+              particles.clear()
               state = State.COUNTDOWN
-              countdown_val = 3
-              countdown_start_tick = pg.time.get_ticks()
+              countdown_ticks = 0
             else:
               running = False
 
       if state == State.OVER:
         if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
           state = State.TITLE
-
-    # --- 更新と描画 ---
-    shake_offset = (0, 0)
-    if shake_timer > 0:
-      shake_timer -= 1
-      shake_offset = (random.randint(-4, 4), random.randint(-4, 4))
-
+          if replay or session: running = False  # 再生・対戦が終わったら閉じる
+
+    prof.lap("events")
+
+    # --- 更新 (TICK_MS ごとに1回) ---
+    bits = None
+    ticks = 0
+    while lag >= TICK_MS and ticks < MAX_CATCHUP_TICKS * rate:
+      lag -= TICK_MS
+      ticks += 1
+      ui_tick += 1
+
+      shake_offset = (0, 0)
+      if shake_timer > 0:
+        shake_timer -= 1
+        shake_offset = (random.randint(-4, 4), random.randint(-4, 4))
+
+      if state == State.COUNTDOWN:
+        countdown_ticks += 1
+        if countdown_ticks >= 4 * 40: state = State.PLAY
+        if session:   # 待っている間も相手とのやりとりは続ける (挨拶の返事など)
+          session.poll()
+          session.send()
+
+      elif state == State.PLAY and replay and match.tick >= len(replay):
+        state = State.OVER   # 入力が尽きた (途中で終わったリプレイ)
+
+      elif state == State.PLAY:
+        if replay:
+          tick_bits = replay.inputs[match.tick]
+        else:
+          if bits is None: bits = read_input(pg.key.get_pressed())
+          tick_bits = bits
+          if recorder: recorder.write(tick_bits)
+        # 対戦ではロールバックで進め直すことがあるので、被弾の演出は新しく進めたフレームの分だけ
+        events = session.update(tick_bits) if session else match.step(tick_bits)
+        for defender, hit_pos in events:
+          if tier.shake: shake_timer = 15
+          particles.emit(hit_pos, HIT_COLOR, tier.particles)
+        particles.update()
+        prof.lap("particles")
+        if match.over or (replay and match.tick >= len(replay)):
+          state = State.OVER
+          if recorder: recorder.close()
+
+    # 遅れているときは描画を飛ばして更新に回す (続けて飛ばすのは MAX_FRAME_SKIP 回まで)
+    if lag >= TICK_MS and skipped < MAX_FRAME_SKIP:
+      skipped += 1
+      busy += time.perf_counter() - frame_start
+      prof.end(bullets=len(bullets), particles=len(particles), **queue.stats())
+      continue
+    skipped = 0
+    alpha = min(lag / TICK_MS, 1.0)   # 前の更新から次の更新までのどこを描くか
+
+    # --- 描画 ---
     if state == State.TITLE:
+      screen.fill((0, 0, 0))
       draw_neon_text(screen, start_title, "東方弾幕バトル",
-                     pg.Color('red'), (SCREEN_W // 2, 100))
+                     pg.Color('red'), (SCREEN_W // 2, 100), glow=tier.glow)
       opts = ["開始", "終了"]
       for i, opt in enumerate(opts):
         color = ('blue') if i == menu_cursor else ('WHITE')
-        txt = font.render(opt, True, color)
+        txt = TEXT_CACHE.render(font, opt, color)
         pos = (SCREEN_W // 2 - txt.get_width() // 2, 250 + i * 60)
         screen.blit(txt, pos)
         if i == menu_cursor:
           pg.draw.polygon(screen, ('WHITE'), [
                           (pos[0] - 30, pos[1]), (pos[0] - 10, pos[1] + 15), (pos[0] - 30, pos[1] + 30)])
-      info = small_font.render(
-          "矢印キーで移動、SPACEで決定/攻撃、vでスペシャル攻撃", True, ('white'))
+      info = TEXT_CACHE.render(
+          small_font, "矢印キーで移動、SPACEで決定/攻撃、vでスペシャル攻撃", 'white')
       screen.blit(
           info, (SCREEN_W // 2 - info.get_width() // 2, SCREEN_H - 50))
 
     elif state == State.COUNTDOWN:
-      frame = pg.time.get_ticks() // 50
-      for y in range(0, SCREEN_H, CHIP): pg.draw.line(
-          world_screen, (50, 50, 60), (0, y), (SCREEN_W, y))
-      for x in range(0, SCREEN_W, CHIP): pg.draw.line(
-          world_screen, (50, 50, 60), (x, 0), (x, SCREEN_H))
-      reimu.draw(world_screen, frame)
-      marisa.draw(world_screen, frame)
+      frame = ui_tick // 2
+      arena.draw(world_screen)
+      reimu.draw(world_screen, frame, tier=tier, queue=queue)
+      marisa.draw(world_screen, frame, tier=tier, queue=queue)
+      queue.flush(world_screen)
 
       screen.blit(world_screen, (0, 0))
 
@@ -476,100 +1954,45 @@ def main():
       pg.draw.rect(screen, 'WHITE', (SCREEN_W - 10 -
                                      enemy_bar_w, 10, enemy_bar_w, 15), 1)
 
-      elapsed = pg.time.get_ticks() - countdown_start_tick
-      if elapsed < 1000: txt, c = "3", "CYAN"
-      elif elapsed < 2000: txt, c = "2", "YELLOW"
-      elif elapsed < 3000: txt, c = "1", "RED"
-      elif elapsed < 4000: txt, c = "GO!", "WHITE"
-      else: state = State.PLAY
+      txt, c = (("3", "CYAN"), ("2", "YELLOW"), ("1", "RED"),
+                ("GO!", "WHITE"))[min(countdown_ticks // 40, 3)]
 
       draw_neon_text(screen, huge_font, txt, pg.Color(c),
-                     (SCREEN_W // 2, SCREEN_H // 2))
+                     (SCREEN_W // 2, SCREEN_H // 2), glow=tier.glow)
 
     elif state == State.PLAY:
-      keys = pg.key.get_pressed()
-
-      # プレイヤー操作（死亡時は操作不可）
-      if not reimu.is_dying:
-        if reimu.move_vec.length() == 0:
-          mv = -1
-          if keys[pg.K_UP]: mv = 0
-          if keys[pg.K_RIGHT]: mv = 1
-          if keys[pg.K_DOWN]: mv = 2
-          if keys[pg.K_LEFT]: mv = 3
-          if mv != -1:
-            reimu.dir = mv
-            next_p = reimu.pos + move_vecs[mv]
-            if (0 <= next_p.x < MAP_SIZE.x and 0 <= next_p.y < MAP_SIZE.y and next_p != marisa.pos):
-              reimu.move_vec = move_vecs[mv]
-
-        current_dir_vec = move_vecs[reimu.dir]
-        if keys[pg.K_SPACE]: reimu.shoot(current_dir_vec, marisa, "N")
-        if keys[pg.K_v]: reimu.shoot(current_dir_vec, marisa, "S")
-
-      reimu.update()
-      if reimu.invincible_timer > 0: reimu.invincible_timer -= 1
-
-      # プレイヤーの死亡演出更新
-      if reimu.is_dying:
-        reimu.death_timer -= 1
-        if reimu.death_timer <= 0:
-          state = State.OVER
-
-      # 魔理沙の更新
-      if not marisa.is_dying:
-        marisa.think(reimu)
-        marisa.update()
-        if marisa.invincible_timer > 0: marisa.invincible_timer -= 1
-      else:
-        # 死亡演出中の更新
-        marisa.death_timer -= 1
-        if marisa.death_timer <= 0:
-          state = State.OVER
-
       # --- ゲーム内世界の描画 ---
-      for y in range(0, SCREEN_H, CHIP): pg.draw.line(
-          world_screen, (50, 50, 60), (0, y), (SCREEN_W, y))
-      for x in range(0, SCREEN_W, CHIP): pg.draw.line(
-          world_screen, (50, 50, 60), (x, 0), (x, SCREEN_H))
-
-      frame = pg.time.get_ticks() // 50
-      reimu.draw(world_screen, frame)
-      marisa.draw(world_screen, frame)
-
-      # 当たり判定 & シェイク発生
-      # 死亡演出中はお互いに当たり判定を処理しない（既に死んでいるので）
-      if not reimu.is_dying and not marisa.is_dying:
-        for attacker, defender in [(reimu, marisa), (marisa, reimu)]:
-          for bullet in attacker.bullets:
-            if bullet.active and bullet.get_rect().colliderect(defender.get_hitbox()):
-              bullet.active = False
-              if defender.invincible_timer <= 0:
-                defender.hp -= bullet.damage
-                defender.invincible_timer = 20
-                shake_timer = 15
-                hit_color = pg.Color('YELLOW')
-                for _ in range(5): particles.append(
-                    Particle(bullet.pos * CHIP, hit_color))
-
-                # HPが0になったら死亡演出開始
-                if defender.hp <= 0:
-                  defender.hp = 0
-                  defender.is_dying = True
-                  defender.death_timer = 80  # 2秒間 (40FPS * 2)
-
-      for p in particles:
-        p.update()
-        p.draw(world_screen)
-      particles = [p for p in particles if p.life > 0]
-
-      screen.blit(world_screen, shake_offset)
+      # 差分モードでは前フレームに描いたタイルだけ床を塗り戻す
+      # (シェイク中とプロファイラ表示中は全面)
+      use_dirty = (dirty is not None and shake_offset == (0, 0)
+                   and not show_prof and not prof_toggled)
+      if use_dirty: dirty.restore(world_screen, arena.get())
+      else: arena.draw(world_screen)
+
+      frame = match.tick // 2  # 1フレーム25msなので 50ms 単位のアニメ番号
+      for char in (reimu, marisa):
+        drawn = char.draw(world_screen, frame, alpha, tier, queue=queue)
+        if use_dirty and drawn: dirty.mark_rect(drawn)
+      if use_dirty: dirty.mark_points(bullets.lerp_pos(alpha) * CHIP, 18)
+
+      particles.draw(world_screen, queue)
+      if use_dirty: dirty.mark_points(particles.pos[:particles.count], 8)
+      queue.flush(world_screen)
+
+      if use_dirty:
+        # HPバーと名前の帯は毎フレーム書き換える
+        dirty.mark_rect((0, 0, SCREEN_W, 30 + small_font.get_linesize()))
+        update_rects = dirty.flush()
+        for r in update_rects: screen.blit(world_screen, r, r)
+      else:
+        screen.fill((0, 0, 0))
+        screen.blit(world_screen, shake_offset)
 
       # UI描画
       pg.draw.rect(screen, 'RED', (10, 10, reimu.hp * 10, 15))
       pg.draw.rect(screen, 'WHITE', (10, 10, reimu.hp * 10, 15), 1)
-      screen.blit(small_font.render(
-          f"{reimu.name}", True, pg.Color('RED')), (10, 30))
+      screen.blit(TEXT_CACHE.render(
+          small_font, reimu.name, pg.Color('RED')), (10, 30))
 
       enemy_bar_w = marisa.hp * 10
       bar_color = 'yellow' if marisa.is_awakened else 'YELLOW'
@@ -577,44 +2000,121 @@ def main():
                                        enemy_bar_w, 10, enemy_bar_w, 15))
       pg.draw.rect(screen, 'YELLOW', (SCREEN_W - 10 -
                                       enemy_bar_w, 10, enemy_bar_w, 15), 1)
-      m_text = small_font.render(
-          f"{marisa.name}", True, pg.Color(bar_color))
+      m_text = TEXT_CACHE.render(
+          small_font, marisa.name, pg.Color(bar_color))
       m_text_rect = m_text.get_rect(topright=(SCREEN_W - 10, 30))
       screen.blit(m_text, m_text_rect)
 
     elif state == State.OVER:
       # プレイ画面を薄暗く残す
       # 死亡しているキャラは消えた状態で描画される
-      frame = pg.time.get_ticks() // 50
-      for y in range(0, SCREEN_H, CHIP): pg.draw.line(
-          world_screen, (50, 50, 60), (0, y), (SCREEN_W, y))
-      for x in range(0, SCREEN_W, CHIP): pg.draw.line(
-          world_screen, (50, 50, 60), (x, 0), (x, SCREEN_H))
-      reimu.draw(world_screen, frame)
-      marisa.draw(world_screen, frame)
+      frame = ui_tick // 2
+      arena.draw(world_screen)
+      reimu.draw(world_screen, frame, tier=tier, queue=queue)
+      marisa.draw(world_screen, frame, tier=tier, queue=queue)
+      queue.flush(world_screen)
       screen.blit(world_screen, (0, 0))
 
-      overlay = pg.Surface((SCREEN_W, SCREEN_H))
-      overlay.set_alpha(150)  # 少し暗く
-      overlay.fill((0, 0, 0))
-      screen.blit(overlay, (0, 0))
+      screen.blit(EFFECTS.overlay(screen.get_size(), alpha=150), (0, 0))  # 少し暗く
 
-      winner = "霊夢" if marisa.hp <= 0 else "魔理沙"
+      winner = match.winner
       win_color = pg.Color(
           'RED') if winner == "霊夢" else pg.Color('yellow')
 
       draw_neon_text(
-          screen, huge_font, f"{winner} WIN!", win_color, (SCREEN_W // 2, SCREEN_H // 2 - 40))
+          screen, huge_font, f"{winner} WIN!", win_color, (SCREEN_W // 2, SCREEN_H // 2 - 40),
+          glow=tier.glow)
 
-      blink = (pg.time.get_ticks() // 500) % 2 == 0
+      blink = (ui_tick // 20) % 2 == 0
       if blink:
         draw_neon_text(screen, small_font, "スペースキーでタイトルへ戻る", pg.Color(
-            'WHITE'), (SCREEN_W // 2, SCREEN_H // 2 + 60))
+            'WHITE'), (SCREEN_W // 2, SCREEN_H // 2 + 60), glow=tier.glow)
 
-    pg.display.flip()
-    clock.tick(40)
+    if show_prof: prof_overlay.draw(screen, profiler, SURFACES, governor)
+    prof.lap("draw")
 
+    if update_rects is None:
+      if dirty is not None: dirty.full_frame()  # 次の差分フレームは全面を送り直す
+      pg.display.flip()
+    else:
+      pg.display.update(update_rects)
+    if startup:
+      startup.mark("first_frame")
+      if profile_startup: print("\n".join(startup.report()), file=sys.stderr)
+      startup = None
+    prof.lap("present")
+    # 品質の判定は、飛ばした更新の分も含めた前の描画からの処理時間で行う
+    busy += time.perf_counter() - frame_start
+    if governor.update(busy * 1000) and dirty is not None: dirty.full_frame()
+    busy = 0.0
+    clock.tick(render_fps)
+    prof.lap("wait")
+    prof.end(bullets=len(bullets), particles=len(particles), **queue.stats())
+
+  if recorder: recorder.close()
+  if session: session.transport.close()
+  profiler.close()
   pg.quit()
 
 if __name__ == "__main__":
-  main()
+  import argparse
+  parser = argparse.ArgumentParser(description="東方弾幕バトル")
+  parser.add_argument("--dirty-rects", action="store_true",
+                      help="変化した領域だけを画面に送る (低スペック機向け)")
+  parser.add_argument("--record", metavar="DIR",
+                      help="試合ごとのリプレイを DIR に保存する")
+  parser.add_argument("--replay", metavar="FILE", help="リプレイを再生する")
+  parser.add_argument("--speed", type=int, default=1,
+                      help="リプレイ再生の倍速 (1描画フレームあたりに進めるフレーム数)")
+  parser.add_argument("--no-render", action="store_true",
+                      help="リプレイを描画せずに最速で再生して結果だけ表示する")
+  parser.add_argument("--fps", type=int, default=0,
+                      help="描画の上限 FPS (0 なら上限なし。ゲームの更新は常に 40Hz)")
+  parser.add_argument("--vsync", action="store_true",
+                      help="描画を画面のリフレッシュに合わせる")
+  parser.add_argument("--profile", action="store_true",
+                      help="フェーズごとの処理時間を表示する (F3 キーでも切り替え)")
+  parser.add_argument("--level", choices=SEARCH_LEVELS,
+                      help="魔理沙を先読みする AI にしてその難易度にする")
+  parser.add_argument("--profile-startup", action="store_true",
+                      help="起動から最初のフレームまでの時間を段階ごとに表示する")
+  parser.add_argument("--profile-csv", metavar="FILE",
+                      help="フレームごとのフェーズ別処理時間を CSV に書き出す")
+  parser.add_argument("--quality", choices=["auto", *(t.name for t in TIERS)], default="auto",
+                      help="演出の品質 (auto なら重いときに自動で下げる)")
+  parser.add_argument("--host", type=int, metavar="PORT",
+                      help="PORT で対戦相手を待つ (自分は霊夢)")
+  parser.add_argument("--join", metavar="HOST:PORT",
+                      help="HOST:PORT で待っている相手と対戦する (自分は魔理沙)")
+  parser.add_argument("--port", type=int, default=0,
+                      help="--join のときに使う自分のポート (0 なら空いているもの)")
+  parser.add_argument("--delay", type=int, default=2,
+                      help="対戦で自分の入力を遅らせるフレーム数 (大きいほどロールバックが減る)")
+  parser.add_argument("--sim-latency", type=float, default=0,
+                      help="試験用: 送るパケットに足す遅延 (ms)")
+  parser.add_argument("--sim-jitter", type=float, default=0,
+                      help="試験用: 遅延の揺らぎ (ms)")
+  parser.add_argument("--sim-loss", type=float, default=0,
+                      help="試験用: パケットを落とす確率")
+  args = parser.parse_args()
+  replay = Replay.load(args.replay) if args.replay else None
+  net = None
+  if args.host is not None or args.join:
+    if args.join:
+      host, _, port = args.join.rpartition(":")
+      side, transport = 1, UdpTransport(args.port, (host, int(port)))
+    else:
+      side, transport = 0, UdpTransport(args.host)
+    if args.sim_latency or args.sim_jitter or args.sim_loss:
+      transport = LossyTransport(transport, args.sim_latency, args.sim_jitter, args.sim_loss)
+    print("対戦相手を待っています..." if side == 0 else "接続しています...", file=sys.stderr)
+    net = (side, transport, connect(transport, side, timeout=120), args.delay)
+  if replay and args.no_render:
+    import replay as replay_cli
+    replay_cli.report(args.replay)
+  else:
+    main(dirty_rects=args.dirty_rects, record_dir=args.record,
+         replay=replay, speed=max(1, args.speed),
+         profile=args.profile, profile_csv=args.profile_csv,
+         render_fps=args.fps, vsync=args.vsync, profile_startup=args.profile_startup,
+         level=args.level, net=net, quality=args.quality)
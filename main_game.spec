@@ -5,7 +5,7 @@ a = Analysis(
     ['main_game.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('data/patterns.json', 'data')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,348 @@
+""" UDP での2人対戦 (ロールバック方式)
+
+霊夢 (side 0、接続を待つ側) と魔理沙 (side 1、接続する側) をそれぞれのマシンの人が操作する。
+Match は seed と両者の入力列が同じなら必ず同じ試合になるので、送り合うのは入力ビットだけ。
+
+  - 自分の入力は delay フレーム後の分として予約し、まだ相手に届いていない分を毎フレームまとめて送る
+    (パケットが落ちても次のパケットに同じ入力が入っている)。
+  - 相手の入力がまだ届いていないフレームは、最後に届いた入力が続くと予測して先に進める。
+  - 予測と違う入力が届いたら、そのフレームのスナップショット (Match.snapshot) に戻し、
+    正しい入力で今のフレームまで進め直す (ロールバック)。
+  - 予測で進めてよいのは max_rollback フレームまで。それより相手が遅れたら待つ。
+  - 両者のフレームの進み具合をパケットで伝え合い、先に進みすぎている側が1フレーム待って揃える。
+
+LossyTransport で遅延・揺らぎ・パケット落ちを足せるので、1台のマシンで2つのプロセスを
+つないで試せる (harness)。
+
+  python main_game.py --host 7000 --delay 2
+  python main_game.py --join 127.0.0.1:7000 --delay 2 --sim-latency 60 --sim-loss 0.05
+  python netplay.py --ticks 2000 --latency 60 --jitter 15 --loss 0.05   # 画面なしの2プロセス試験
+"""
+import heapq
+import queue
+import random
+import socket
+import struct
+import sys
+import time
+import zlib
+
+# パケット: 種類, フレーム (HELLO では seed), 入力の最初のフレーム, 受け取り済みの相手の最後のフレーム,
+#           相手より進んでいるフレーム数 + 入力ビット列
+PACKET = struct.Struct("<BIIib")
+HELLO, INPUT = 0, 1
+MAX_SEND = 64   # 1パケットに入れる入力の最大数
+
+
+class UdpTransport:
+  """ ノンブロッキングの UDP ソケット (peer を省略すると最初に届いたパケットの送り主に返す) """
+  def __init__(self, port, peer=None, host="0.0.0.0"):
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.sock.bind((host, port))
+    self.sock.setblocking(False)
+    self.peer = peer
+
+  def send(self, data):
+    if self.peer is None: return
+    try:
+      self.sock.sendto(data, self.peer)
+    except OSError:
+      pass   # 相手がまだ居ない (ICMP unreachable など) ときは落ちたのと同じ扱い
+
+  def recv(self):
+    out = []
+    while True:
+      try:
+        data, addr = self.sock.recvfrom(2048)
+      except (BlockingIOError, ConnectionResetError):
+        return out
+      if self.peer is None: self.peer = addr
+      out.append(data)
+
+  def close(self):
+    self.sock.close()
+
+
+class LossyTransport:
+  """ 送るパケットに遅延 (latency_ms ± jitter_ms) とパケット落ち (確率 loss) を足す試験用のラッパー """
+  def __init__(self, inner, latency_ms=0, jitter_ms=0, loss=0.0, seed=None, clock=time.monotonic):
+    self.inner = inner
+    self.latency = latency_ms / 1000
+    self.jitter = jitter_ms / 1000
+    self.loss = loss
+    self.rng = random.Random(seed)
+    self.clock = clock
+    self.queue = []   # (送る時刻, 通し番号, データ)
+    self.sent = 0
+    self.dropped = 0
+
+  def send(self, data):
+    self.sent += 1
+    if self.rng.random() < self.loss:
+      self.dropped += 1
+      return
+    delay = max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0)
+    heapq.heappush(self.queue, (self.clock() + delay, self.sent, data))
+    self.flush()
+
+  def flush(self):
+    now = self.clock()
+    while self.queue and self.queue[0][0] <= now:
+      self.inner.send(heapq.heappop(self.queue)[2])
+
+  def recv(self):
+    self.flush()
+    return self.inner.recv()
+
+  @property
+  def peer(self):
+    return self.inner.peer
+
+  def close(self):
+    self.inner.close()
+
+
+def connect(transport, side, seed=None, timeout=30.0, poll=lambda: None):
+  """ 相手と挨拶を交わして試合の seed を決める (side 0 が seed を決めて送る)
+
+  side 1 は HELLO を送り続け、seed 入りの HELLO が返ってきたら始める。side 0 は相手の HELLO で
+  送り主を覚えて seed を返す (返事が落ちても、試合中に届いた HELLO には RollbackSession が返事をする)。
+  poll は待っている間に呼ぶ関数 (画面のイベント処理など)。つながらなければ TimeoutError。
+  """
+  if side == 0 and seed is None: seed = random.randrange(2 ** 32)
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if side == 1: transport.send(PACKET.pack(HELLO, 0, 0, -1, 0))
+    for data in transport.recv():
+      if len(data) < PACKET.size: continue
+      kind, value = PACKET.unpack_from(data)[:2]
+      if side == 1 and kind == HELLO:
+        return value
+      if side == 0:
+        transport.send(PACKET.pack(HELLO, seed, 0, -1, 0))
+        return seed
+    poll()
+    time.sleep(0.05)
+  raise TimeoutError("対戦相手につながりませんでした")
+
+
+class RollbackSession:
+  """ Match を相手とずれなく進める (side は自分が操作するキャラ 0 霊夢 / 1 魔理沙)
+
+  毎フレーム update(bits) を呼ぶと、届いた入力を反映し (必要ならロールバックして)、
+  進めてよければ1フレーム進めてそのフレームの被弾イベントを返す (待つときは空)。
+  """
+  def __init__(self, match, side, transport, delay=2, max_rollback=8):
+    self.match = match
+    self.side = side
+    self.transport = transport
+    self.delay = delay
+    self.max_rollback = max_rollback
+    self.frame = match.tick      # 次に進めるフレーム
+    self.local = {f: 0 for f in range(self.frame, self.frame + delay)}   # 遅延分は入力なし
+    self.remote = {}             # 届いた相手の入力
+    self.used = {}               # 進めたときに使った相手の入力 (予測を含む)
+    self.saved = {}              # フレーム -> そのフレームを進める前のスナップショット
+    self.remote_last = self.frame - 1   # ここまでの相手の入力はすべて届いている
+    self.peer_ack = self.frame - 1      # 相手がここまでの自分の入力を受け取った
+    self.peer_frame = self.frame
+    self.peer_advantage = 0
+    self.rollback_to = None
+    self.checksums = {}          # 確定したフレーム -> 状態のチェックサム (checksum_every ごと)
+    self.checksum_every = 0
+    # 集計用
+    self.rollbacks = 0
+    self.resimulated = 0
+    self.max_depth = 0
+    self.rollback_ms = []
+    self.stalls = 0
+    self.sync_waits = 0
+
+  # --- 入力のやりとり ---
+  def send(self):
+    start, bits = self.frame, b""
+    if self.local:
+      start = max(self.peer_ack + 1, min(self.local))
+      end = min(max(self.local) + 1, start + MAX_SEND)
+      bits = bytes(self.local[f] for f in range(start, end))
+    advantage = max(min(self.frame - self.peer_frame, 127), -128)
+    self.transport.send(PACKET.pack(INPUT, self.frame, start, self.remote_last, advantage) + bits)
+
+  def poll(self):
+    for data in self.transport.recv():
+      if len(data) < PACKET.size: continue
+      kind, frame, start, ack, advantage = PACKET.unpack_from(data)
+      if kind == HELLO:
+        if self.side == 0:   # 挨拶の返事が落ちていたらもう一度 seed を返す
+          self.transport.send(PACKET.pack(HELLO, self.match.seed, 0, -1, 0))
+        continue
+      self.peer_frame = max(self.peer_frame, frame)
+      self.peer_advantage = advantage
+      self.peer_ack = max(self.peer_ack, ack)
+      for i, bits in enumerate(data[PACKET.size:]):
+        f = start + i
+        if f <= self.remote_last or f in self.remote: continue
+        self.remote[f] = bits
+        if f in self.used and self.used[f] != bits:
+          self.rollback_to = f if self.rollback_to is None else min(self.rollback_to, f)
+      while self.remote_last + 1 in self.remote:
+        self.remote_last += 1
+
+  def predict(self, f):
+    """ フレーム f の相手の入力 (届いていなければ最後に届いた入力が続くとみなす) """
+    if f in self.remote: return self.remote[f]
+    return self.remote.get(self.remote_last, 0)
+
+  # --- 進める ---
+  def step_frame(self):
+    """ フレーム self.frame を進める (進める前のスナップショットを取っておく) """
+    f = self.frame
+    self.saved[f] = self.match.snapshot()
+    remote = self.predict(f)
+    self.used[f] = remote
+    local = self.local[f]
+    inputs = (local, remote) if self.side == 0 else (remote, local)
+    events = self.match.step(*inputs)
+    self.frame += 1
+    return events
+
+  def rollback(self):
+    """ 予測が外れた最初のフレームに戻し、今のフレームまで正しい入力で進め直す """
+    target, self.rollback_to = self.rollback_to, None
+    if target >= self.frame: return
+    t = time.perf_counter()
+    end = self.frame
+    self.match.restore(self.saved[target])
+    self.frame = target
+    while self.frame < end:
+      self.step_frame()
+    depth = end - target
+    self.rollbacks += 1
+    self.resimulated += depth
+    self.max_depth = max(self.max_depth, depth)
+    self.rollback_ms.append((time.perf_counter() - t) * 1000)
+
+  def confirm(self):
+    """ 相手の入力がすべて届いたフレームのスナップショットは、もう戻らないので捨てる """
+    for f in [f for f in self.saved if f <= self.remote_last]:
+      snap = self.saved.pop(f)
+      if self.checksum_every and f % self.checksum_every == 0:
+        self.checksums[f] = checksum(snap)
+      self.used.pop(f, None)
+    for f in [f for f in self.remote if f < min(self.remote_last, self.frame)]:
+      del self.remote[f]
+    # 相手が受け取っていて、もう進め直すこともない自分の入力は捨てる
+    for f in [f for f in self.local if f <= min(self.peer_ack, self.remote_last, self.frame - 1)]:
+      del self.local[f]
+
+  def update(self, bits):
+    """ 自分の入力 bits を delay フレーム後の分として加え、進めてよければ1フレーム進める """
+    self.poll()
+    if self.rollback_to is not None: self.rollback()
+    self.confirm()
+
+    events = []
+    if self.frame - self.remote_last > self.max_rollback:
+      self.stalls += 1   # 相手の入力が遅れすぎているので待つ
+    elif (self.frame - self.peer_frame) - self.peer_advantage >= 2 and self.frame % 4 == 0:
+      self.sync_waits += 1   # 相手より2フレーム以上進んでいるので1フレーム待って揃える
+    elif not self.match.over:
+      self.local.setdefault(self.frame + self.delay, bits)
+      events = self.step_frame()
+    self.send()
+    return events
+
+
+def checksum(snap):
+  """ Match.snapshot() の状態のチェックサム (遅れて撃つ wave は相手キャラへの参照を含むので除く) """
+  tick, over, rng_state, reimu, marisa, bullets = snap
+  # pickle は同じ値でもオブジェクトの共有のされ方で結果が変わるので、repr で文字列にする
+  crc = zlib.crc32(repr((tick, over, rng_state, reimu[0], marisa[0], bullets[0])).encode())
+  for arr in bullets[1]:
+    crc = zlib.crc32(arr.tobytes(), crc)
+  return crc
+
+
+# --- 画面なしの2プロセス試験 ---
+def peer_main(side, ports, args, results):
+  """ 試験の片側 (別プロセス)。ランダムな入力で ticks フレームまで確定させて結果を results に入れる """
+  import os
+  os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+  from main_game import TICK_MS, Match
+
+  udp = UdpTransport(ports[side], ("127.0.0.1", ports[1 - side]), host="127.0.0.1")
+  transport = LossyTransport(udp, args.latency, args.jitter, args.loss, seed=side)
+  seed = connect(transport, side, seed=args.seed)
+  match = Match(seed, load_images=False, versus=True)
+  session = RollbackSession(match, side, transport, args.delay, args.max_rollback)
+  session.checksum_every = 50
+
+  rng = random.Random(100 + side)
+  bits = 0
+  next_tick = time.perf_counter()
+  deadline = next_tick + args.ticks * TICK_MS / 1000 * 4 + 10
+  while session.remote_last < args.ticks and not match.over and time.perf_counter() < deadline:
+    if rng.random() < 0.1: bits = rng.randrange(64)   # 入力はときどき変える (押しっぱなしに近い)
+    session.update(bits)
+    next_tick += TICK_MS / 1000
+    time.sleep(max(next_tick - time.perf_counter(), 0))
+  # 相手が最後まで確定できるよう、しばらく送り続ける
+  end = time.perf_counter() + 1
+  while time.perf_counter() < end:
+    session.poll()
+    session.send()
+    time.sleep(TICK_MS / 1000)
+  transport.close()
+  ms = sorted(session.rollback_ms) or [0]
+  results.put((side, {
+      "frames": session.frame, "confirmed": session.remote_last, "over": match.over,
+      "rollbacks": session.rollbacks, "resimulated": session.resimulated,
+      "max_depth": session.max_depth, "p99_ms": ms[int(len(ms) * 0.99)], "max_ms": ms[-1],
+      "stalls": session.stalls, "sync_waits": session.sync_waits,
+      "sent": transport.sent, "dropped": transport.dropped, "checksums": session.checksums}))
+
+
+def harness():
+  """ localhost の2プロセスで対戦させ、確定したフレームの状態が一致するかとロールバックの時間を調べる """
+  import argparse
+  import multiprocessing as mp
+  parser = argparse.ArgumentParser(description="ロールバック対戦の localhost 試験")
+  parser.add_argument("--ticks", type=int, default=2000, help="確定させるフレーム数")
+  parser.add_argument("--delay", type=int, default=2, help="自分の入力を遅らせるフレーム数")
+  parser.add_argument("--max-rollback", type=int, default=8)
+  parser.add_argument("--latency", type=float, default=60, help="片道の遅延 (ms)")
+  parser.add_argument("--jitter", type=float, default=10, help="遅延の揺らぎ (ms)")
+  parser.add_argument("--loss", type=float, default=0.05, help="パケットが落ちる確率")
+  parser.add_argument("--port", type=int, default=47000)
+  parser.add_argument("--seed", type=int, default=1)
+  args = parser.parse_args()
+
+  ctx = mp.get_context("spawn")
+  results = ctx.Queue()
+  ports = (args.port, args.port + 1)
+  procs = [ctx.Process(target=peer_main, args=(side, ports, args, results)) for side in (0, 1)]
+  for p in procs: p.start()
+  out = {}
+  while len(out) < len(procs):
+    try:
+      side, result = results.get(timeout=1)
+      out[side] = result
+    except queue.Empty:
+      if any(p.exitcode for p in procs): sys.exit("試験のプロセスが異常終了しました")
+  for p in procs: p.join()
+
+  for side, r in sorted(out.items()):
+    print(f"side {side}: frames {r['frames']} confirmed {r['confirmed']} over={r['over']}  "
+          f"rollbacks {r['rollbacks']} (resim {r['resimulated']} ticks, max depth {r['max_depth']}, "
+          f"p99 {r['p99_ms']:.2f} ms, max {r['max_ms']:.2f} ms)  stalls {r['stalls']} "
+          f"sync waits {r['sync_waits']}  packets {r['sent']} ({r['dropped']} dropped)")
+  a, b = out[0]["checksums"], out[1]["checksums"]
+  common = sorted(set(a) & set(b))
+  bad = [f for f in common if a[f] != b[f]]
+  print(f"checksums: {len(common)} frames compared, {len(bad)} mismatched"
+        + (f" (first at frame {bad[0]})" if bad else ""))
+  if bad or not common: sys.exit(1)
+
+
+if __name__ == "__main__":
+  harness()
@@ -0,0 +1,166 @@
+""" 弾幕パターン (データで書いた撃ち方) の読み込みと展開
+
+パターンは JSON ファイル (data/patterns.json) に名前ごとに書き、弾の種類 btype と
+発射器 emitters の並びを持つ。"awake" を書くと覚醒中はその値で上書きしたパターンになる。
+発射器の書き方 (省略したものは既定値):
+
+  shape     "fan" (扇) / "ring" (全周) / "spiral" (全周を wave ごとに turn 度回す) / "random" (乱数で散らす)
+  count     1回 (1 wave) の弾数
+  step      fan の隣り合う弾の角度 (省略時は spread から決める)
+  spread    fan は両端までの角度、random は ±spread 度の範囲で散らす
+  offset    ring / spiral の最初の弾の角度
+  aim       "facing" (撃った向き) / "target" (相手のほう) / "fixed" (angle の向き)
+  waves, interval, delay   delay フレーム後から interval フレームおきに waves 回撃つ
+  turn      wave ごとに回す角度
+  speed     弾の速さ (数値、[最小, 最大] なら1発ずつ乱数、省略時は弾の種類の既定値)
+  homing, life   ホーミング強度・寿命 (フレーム) の上書き
+
+乱数を使わない発射器は、読み込み時に wave ごとの向きの表 (角度 0 基準の単位ベクトル) を作っておき、
+撃つときは基準の向きへ回転するだけで全弾の向きが配列で出る。
+"""
+import json
+import math
+import sys
+
+import numpy as np
+
+SHAPES = ("fan", "ring", "spiral", "random")
+AIMS = ("facing", "target", "fixed")
+
+
+class Emitter:
+  """ 1つの発射器 """
+  def __init__(self, spec, where):
+    self.shape = spec.get("shape", "fan")
+    if self.shape not in SHAPES:
+      raise ValueError(f"{where}: shape は {'/'.join(SHAPES)} のどれかです ({self.shape})")
+    self.aim = spec.get("aim", "facing")
+    if self.aim not in AIMS:
+      raise ValueError(f"{where}: aim は {'/'.join(AIMS)} のどれかです ({self.aim})")
+    self.count = int(spec.get("count", 1))
+    if self.count < 1:
+      raise ValueError(f"{where}: count は1以上です ({self.count})")
+    self.angle = float(spec.get("angle", 0))
+    self.spread = float(spec.get("spread", 0))
+    self.waves = max(int(spec.get("waves", 1)), 1)
+    self.interval = int(spec.get("interval", 0))
+    self.delay = int(spec.get("delay", 0))
+    self.turn = float(spec.get("turn", 10 if self.shape == "spiral" else 0))
+    speed = spec.get("speed")
+    self.speed_range = tuple(map(float, speed)) if isinstance(speed, list) else None
+    self.speed = None if speed is None or self.speed_range else float(speed)
+    self.homing = spec.get("homing")
+    self.life = spec.get("life")
+
+    self.offsets = self._offsets(spec)
+    self.table = None   # random は撃つたびに向きを決める
+    if self.offsets is not None:
+      rad = np.radians(self.offsets[None, :] + np.arange(self.waves)[:, None] * self.turn)
+      self.table = np.stack((np.cos(rad), np.sin(rad)), axis=-1)   # (waves, count, 2)
+
+  def _offsets(self, spec):
+    """ 基準の向きからの各弾の角度 (random は None) """
+    n = self.count
+    if self.shape == "fan":
+      step = spec.get("step")
+      if step is None: step = 2 * self.spread / (n - 1) if n > 1 else 0
+      return (np.arange(n) - (n - 1) / 2) * float(step)
+    if self.shape in ("ring", "spiral"):
+      return np.arange(n) * (360 / n) + float(spec.get("offset", 0))
+    return None
+
+  def directions(self, wave, base, rng):
+    """ wave 番目の弾の向き (count, 2) と速さ (count,) (速さが既定値なら None)
+
+    base は基準の向き (度)。random の向き・速さと speed の範囲は rng (random.Random) から
+    向き -> 速さ の順に引く。
+    """
+    if self.table is None:
+      spread = [rng.uniform(-self.spread, self.spread) for _ in range(self.count)]
+      rad = np.radians(base + wave * self.turn + np.array(spread))
+      d = np.column_stack((np.cos(rad), np.sin(rad)))
+    else:
+      c, s = math.cos(math.radians(base)), math.sin(math.radians(base))
+      d = self.table[wave] @ np.array(((c, s), (-s, c)))
+    if self.speed_range:
+      speeds = np.array([rng.uniform(*self.speed_range) for _ in range(self.count)])
+    elif self.speed is not None:
+      speeds = np.full(self.count, self.speed)
+    else:
+      speeds = None
+    return d, speeds
+
+  def preview(self, wave, base):
+    """ 乱数を使わずに代表的な向きと速さを返す (AI の先読み用)
+
+    random は範囲に均等に並べ、speed の範囲は真ん中の値にする。
+    """
+    if self.table is None:
+      spread = np.linspace(-self.spread, self.spread, self.count + 2)[1:-1]
+      rad = np.radians(base + wave * self.turn + spread)
+      d = np.column_stack((np.cos(rad), np.sin(rad)))
+    else:
+      c, s = math.cos(math.radians(base)), math.sin(math.radians(base))
+      d = self.table[wave] @ np.array(((c, s), (-s, c)))
+    if self.speed_range:
+      return d, np.full(self.count, sum(self.speed_range) / 2)
+    return d, None if self.speed is None else np.full(self.count, self.speed)
+
+
+class Pattern:
+  """ 名前つきの撃ち方 (弾の種類と発射器の並び)。schedule は (遅れ, 発射器, wave) の時刻順 """
+  def __init__(self, name, spec):
+    self.name = name
+    self.btype = spec.get("btype", "N")
+    self.cooldown = int(spec.get("cooldown", 45))
+    emitters = spec.get("emitters")
+    if not emitters:
+      raise ValueError(f"{name}: emitters がありません")
+    self.emitters = [Emitter(e, f"{name}.emitters[{i}]") for i, e in enumerate(emitters)]
+    self.schedule = sorted(((e.delay + w * e.interval, i, w)
+                            for i, e in enumerate(self.emitters) for w in range(e.waves)))
+    self.schedule = [(t, self.emitters[i], w) for t, i, w in self.schedule]
+    self.bullets = sum(e.count * e.waves for e in self.emitters)   # 1回で撃つ弾の総数
+    awake = spec.get("awake")
+    base = {k: v for k, v in spec.items() if k != "awake"}
+    self.awake = Pattern(f"{name}.awake", {**base, **awake}) if awake else self
+
+
+class PatternBook:
+  """ パターンファイル。初めて使うときに読み込んで、名前で引けるようにする
+
+  defaults ({名前: spec}) を渡すと、ファイルが読めないとき (配布物に入っていないなど) は
+  警告を出してそれを使い、ファイルに無い名前もそこから引く。
+  """
+  def __init__(self, path, defaults=None):
+    self.path = path
+    self.defaults = defaults or {}
+    self.patterns = None
+
+  def load(self):
+    try:
+      with open(self.path, encoding="utf-8") as f:
+        specs = json.load(f)
+    except (OSError, ValueError) as e:
+      if not self.defaults:
+        raise ValueError(f"{self.path}: パターンファイルを読めません ({e})") from e
+      print(f"パターンファイルを読めません: {self.path} ({e})。組み込みの既定値を使います",
+            file=sys.stderr)
+      specs = {}
+    try:
+      self.patterns = {name: Pattern(name, spec) for name, spec in {**self.defaults, **specs}.items()
+                       if not name.startswith("_")}
+    except (ValueError, TypeError, AttributeError) as e:
+      raise ValueError(f"{self.path}: {e}") from e
+    return self
+
+  def get(self, name):
+    if self.patterns is None: self.load()
+    try:
+      return self.patterns[name]
+    except KeyError:
+      raise ValueError(f"{self.path}: パターン {name} がありません") from None
+
+  def names(self):
+    if self.patterns is None: self.load()
+    return list(self.patterns)
@@ -0,0 +1,144 @@
+""" フレームの処理時間をフェーズごとに計る簡易プロファイラ
+
+各フェーズの時間を perf_counter_ns で計って固定長のリングバッファに入れ、
+直近のフレームの p50 / p95 / p99 を出す。CSV にフレームごとの時間を書き出すこともできる。
+計測しないときは NULL_PROFILER (何もしない同じ API) を使うので、常に組み込んでおける。
+"""
+import csv
+import time
+
+import numpy as np
+import pygame as pg
+
+PHASES = ("events", "think", "update", "bullets", "collision", "particles",
+          "draw", "present", "wait")
+COUNTERS = ("bullets", "particles", "draw_calls", "drawn", "culled")
+
+
+class NullProfiler:
+  """ 何もしないプロファイラ (無効時に差し替える) """
+  enabled = False
+
+  def begin(self): pass
+  def lap(self, phase): pass
+  def end(self, **counts): pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class FrameProfiler:
+  """ フレーム内の時間を lap(phase) ごとに phase へ足し込み、end() で1フレーム分を記録する """
+  enabled = True
+
+  def __init__(self, capacity=240, csv_path=None, phases=PHASES, counters=COUNTERS):
+    self.phases = phases
+    self.counters = counters
+    self.slot = {p: i for i, p in enumerate(phases)}
+    self.capacity = capacity
+    self.times = np.zeros((capacity, len(phases)), np.int64)   # ナノ秒
+    self.counts = np.zeros((capacity, len(counters)), np.int64)
+    self.frames = 0
+    self.cur = [0] * len(phases)
+    self.last = 0
+    self.csv_file = None
+    if csv_path:
+      self.csv_file = open(csv_path, "w", newline="")
+      self.csv = csv.writer(self.csv_file)
+      self.csv.writerow(("frame", *(f"{p}_ns" for p in phases), *counters))
+
+  def begin(self):
+    self.cur = [0] * len(self.phases)
+    self.last = time.perf_counter_ns()
+
+  def lap(self, phase):
+    """ 前回の lap から今までの時間を phase に足す """
+    now = time.perf_counter_ns()
+    self.cur[self.slot[phase]] += now - self.last
+    self.last = now
+
+  def end(self, **counts):
+    row = self.frames % self.capacity
+    self.times[row] = self.cur
+    self.counts[row] = [counts.get(c, 0) for c in self.counters]
+    if self.csv_file:
+      self.csv.writerow((self.frames, *self.cur, *self.counts[row]))
+    self.frames += 1
+
+  def filled(self):
+    return min(self.frames, self.capacity)
+
+  def percentiles(self, qs=(50, 95, 99)):
+    """ 直近のフレームでの各フェーズの時間 (ミリ秒)。行が qs、列がフェーズ """
+    n = self.filled()
+    if n == 0: return np.zeros((len(qs), len(self.phases)))
+    return np.percentile(self.times[:n], qs, axis=0) / 1e6
+
+  def latest_counts(self):
+    if self.frames == 0: return dict.fromkeys(self.counters, 0)
+    row = self.counts[(self.frames - 1) % self.capacity]
+    return dict(zip(self.counters, row.tolist()))
+
+  def report(self):
+    """ 表示用の行のリスト """
+    p = self.percentiles()
+    lines = [f"{'phase':<10}{'p50':>7}{'p95':>7}{'p99':>7}  ms"]
+    for i, phase in enumerate(self.phases):
+      lines.append(f"{phase:<10}{p[0, i]:>7.2f}{p[1, i]:>7.2f}{p[2, i]:>7.2f}")
+    busy = self.times[:self.filled(), [self.slot[ph] for ph in self.phases if ph != "wait"]].sum(axis=1)
+    if len(busy):
+      lines.append(f"{'total':<10}" + "".join(f"{v / 1e6:>7.2f}" for v in np.percentile(busy, (50, 95, 99))))
+    lines.append("  ".join(f"{k} {v}" for k, v in self.latest_counts().items()))
+    return lines
+
+  def close(self):
+    if self.csv_file:
+      self.csv_file.close()
+      self.csv_file = None
+
+
+class ProfilerOverlay:
+  """ プロファイラの結果を画面左下に重ねて表示する (文字は every フレームごとに描き直す)
+
+  draw に report() を持つものを続けて渡すと、その行も下に足して表示する。
+  """
+  def __init__(self, font, every=10):
+    self.font = font
+    self.every = every
+    self.surfs = []
+    self.age = every
+
+  def draw(self, screen, prof, surfaces, *extra):
+    self.age += 1
+    if self.age >= self.every:
+      self.age = 0
+      lines = prof.report()
+      for source in extra: lines += source.report()
+      self.surfs = [surfaces.track(self.font.render(line, True, (255, 255, 255), (0, 0, 0)))
+                    for line in lines]
+    if not self.surfs: return None
+    h = self.font.get_linesize()
+    y = screen.get_height() - h * len(self.surfs) - 4
+    rect = pg.Rect(4, y, max(s.get_width() for s in self.surfs), h * len(self.surfs))
+    for i, s in enumerate(self.surfs):
+      screen.blit(s, (4, y + i * h))
+    return rect
+
+
+class StartupProfiler:
+  """ 起動から最初のフレームまでの時間を段階ごとに記録する """
+  def __init__(self, start=None):
+    self.start = time.perf_counter() if start is None else start
+    self.last = self.start
+    self.marks = []
+
+  def mark(self, phase):
+    """ 前回の mark から今までを phase の時間として記録 """
+    now = time.perf_counter()
+    self.marks.append((phase, now - self.last))
+    self.last = now
+
+  def report(self):
+    lines = [f"{phase:<12}{sec * 1000:>9.1f} ms" for phase, sec in self.marks]
+    lines.append(f"{'total':<12}{(self.last - self.start) * 1000:>9.1f} ms")
+    return lines
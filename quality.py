@@ -0,0 +1,107 @@
+""" 描画の重さに合わせて演出を間引く品質ガバナー
+
+1フレームの処理時間 (待ち時間を除く) の移動平均を見て、予算を超えそうなら品質の段を1つ下げ、
+十分に余裕がある状態がしばらく続いたら1つ上げる。下げる閾値と上げる閾値を離し、上げるときは
+長めに待つ (ヒステリシス) ので、境目で段が行ったり来たりしない。
+
+段が変えるのは見た目だけで、試合の進行 (Match) には触れないので、どの段でも同じ試合になる。
+"""
+from collections import deque
+
+
+class Tier:
+  """ 品質の1段
+
+  particles  被弾1回で出す火花の数
+  glow       ネオン文字の光彩を描くか
+  star_layers  星弾を何枚重ねで描くか (2 なら内側の白い星も)
+  aura       覚醒オーラを描くか
+  shake      被弾時に画面を揺らすか (揺れている間は差分描画が効かない)
+  detail     星弾を回して描くか
+  """
+  def __init__(self, name, particles, glow, star_layers, aura, shake, detail):
+    self.name = name
+    self.particles = particles
+    self.glow = glow
+    self.star_layers = star_layers
+    self.aura = aura
+    self.shake = shake
+    self.detail = detail
+
+  def __repr__(self):
+    return f"Tier({self.name})"
+
+
+# 上ほど高品質。軽くて目立たないものから順に削る
+TIERS = (
+    Tier("high", particles=5, glow=True, star_layers=2, aura=True, shake=True, detail=True),
+    Tier("medium", particles=3, glow=False, star_layers=1, aura=True, shake=True, detail=True),
+    Tier("low", particles=2, glow=False, star_layers=1, aura=False, shake=False, detail=True),
+    Tier("minimal", particles=1, glow=False, star_layers=1, aura=False, shake=False, detail=False),
+)
+
+
+class QualityGovernor:
+  """ フレーム時間の移動平均から品質の段 (TIERS の番号) を決める
+
+  update(frame_ms) を描画1回ごとに呼ぶ。移動平均が budget_ms * down を超えた状態が
+  down_frames 続くと1段下げ、budget_ms * up を下回った状態が up_frames 続くと1段上げる。
+  段を変えた直後の settle フレームは移動平均が落ち着くのを待って判定しない。
+  history には直近の段の変更 (フレーム番号, 前の段, 後の段, そのときの移動平均 ms) を残す。
+  """
+  def __init__(self, budget_ms, tiers=TIERS, smoothing=0.1, down=0.9, up=0.5,
+               down_frames=10, up_frames=120, settle=30, history=8, enabled=True):
+    self.budget_ms = budget_ms
+    self.tiers = tiers
+    self.smoothing = smoothing
+    self.down = down
+    self.up = up
+    self.down_frames = down_frames
+    self.up_frames = up_frames
+    self.settle = settle
+    self.enabled = enabled
+    self.level = 0
+    self.avg_ms = 0.0
+    self.frames = 0
+    self.over = 0        # 移動平均が下げる閾値を続けて超えたフレーム数
+    self.under = 0       # 移動平均が上げる閾値を続けて下回ったフレーム数
+    self.wait = 0        # 判定を休むフレーム数
+    self.history = deque(maxlen=history)
+
+  @property
+  def tier(self):
+    return self.tiers[self.level]
+
+  def update(self, frame_ms):
+    """ 描画1回分の処理時間 (ms) を記録して、段を変えたら True """
+    self.frames += 1
+    if self.frames == 1: self.avg_ms = frame_ms
+    else: self.avg_ms += (frame_ms - self.avg_ms) * self.smoothing
+    if not self.enabled: return False
+    if self.wait > 0:
+      self.wait -= 1
+      return False
+    self.over = self.over + 1 if self.avg_ms > self.budget_ms * self.down else 0
+    self.under = self.under + 1 if self.avg_ms < self.budget_ms * self.up else 0
+    if self.over >= self.down_frames and self.level < len(self.tiers) - 1:
+      return self._set(self.level + 1)
+    if self.under >= self.up_frames and self.level > 0:
+      return self._set(self.level - 1)
+    return False
+
+  def _set(self, level):
+    self.history.append((self.frames, self.level, level, self.avg_ms))
+    self.level = level
+    self.over = self.under = 0
+    self.wait = self.settle
+    return True
+
+  def report(self):
+    """ デバッグ表示用の行のリスト """
+    lines = [f"quality {self.tier.name} ({self.level}/{len(self.tiers) - 1})"
+             f"  avg {self.avg_ms:.2f} / {self.budget_ms:.1f} ms"
+             + ("" if self.enabled else "  (fixed)")]
+    for frame, before, after, avg in reversed(self.history):
+      lines.append(f"  #{frame}: {self.tiers[before].name} -> {self.tiers[after].name}"
+                   f" ({avg:.2f} ms)")
+    return lines
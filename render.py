@@ -0,0 +1,51 @@
+""" 描画キュー (1フレーム分のスプライトを層ごとにまとめて描く)
+
+キャラ・オーラ・弾・パーティクルはその場で blit せず、(Surface, 左上の位置) を層ごとにキューへ積む。
+flush(screen) で層の順に、画面 (クリップ範囲) の外に出ているものを除き、同じ Surface が
+続くように並べ替えて、層ごとに1回の Surface.fblits (無い版では blits) で描く。
+描画の呼び出し回数・描いた数・除いた数は stats() で取れる (FrameProfiler のカウンタ用)。
+"""
+
+LAYERS = ("aura", "chars", "bullets", "particles")   # 下から描く順
+LAYER_AURA, LAYER_CHARS, LAYER_BULLETS, LAYER_PARTICLES = range(len(LAYERS))
+
+
+class RenderQueue:
+  """ 層ごとの (Surface, (x, y)) の列。flush で描いて空にする """
+  def __init__(self, layers=len(LAYERS)):
+    self.items = [[] for _ in range(layers)]
+    self.calls = 0     # 直前の flush での fblits の回数
+    self.drawn = 0     # 直前の flush で描いた数
+    self.culled = 0    # 直前の flush で画面の外として除いた数
+
+  def add(self, layer, surf, pos):
+    self.items[layer].append((surf, pos))
+
+  def extend(self, layer, pairs):
+    self.items[layer].extend(pairs)
+
+  def __len__(self):
+    return sum(map(len, self.items))
+
+  def flush(self, screen):
+    """ 溜めたものを層の順に screen へ描き、描いた範囲 (クリップ範囲) と重ならないものは除く """
+    view = screen.get_clip()
+    blit = getattr(screen, "fblits", None)
+    self.calls = self.drawn = self.culled = 0
+    for items in self.items:
+      if not items: continue
+      visible = [item for item in items if view.colliderect(item[1], item[0].get_size())]
+      self.culled += len(items) - len(visible)
+      items.clear()
+      if not visible: continue
+      visible.sort(key=lambda item: id(item[0]))   # 同じ Surface を続けて描く (安定ソートなので順は保つ)
+      if blit: blit(visible)
+      else: screen.blits(visible, doreturn=False)
+      self.calls += 1
+      self.drawn += len(visible)
+
+  def clear(self):
+    for items in self.items: items.clear()
+
+  def stats(self):
+    return {"draw_calls": self.calls, "drawn": self.drawn, "culled": self.culled}
@@ -0,0 +1,111 @@
+""" リプレイの記録と再生
+
+リプレイは乱数の seed と魔理沙の難易度、霊夢の入力ビット (1フレーム1バイト) の列だけを持つ。
+Match は seed と入力列が同じなら必ず同じ試合になるので、これだけで試合を再現できる。
+5分の試合でも 12KB 程度。
+
+ファイル形式: ヘッダ (MAGIC 4バイト, バージョン 1バイト, seed 8バイト)
+            + 難易度 (長さ 1バイト + ASCII、従来の AI なら長さ 0。バージョン 1 には無い) + 入力バイト列
+
+  python replay.py replays/xxx.rep            # 画面なしで最速再生して結果と速度を表示
+  python main_game.py --replay replays/xxx.rep --speed 4
+"""
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"THRP"
+VERSION = 2
+HEADER = struct.Struct("<4sBQ")
+
+
+class ReplayWriter:
+  """ 入力を1フレームずつ追記していく (flush_every フレームごとにファイルへ書き出す) """
+  def __init__(self, path, seed, level=None, flush_every=40):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    self.path = path
+    self.file = open(path, "wb")
+    name = (level or "").encode("ascii")
+    self.file.write(HEADER.pack(MAGIC, VERSION, seed) + bytes((len(name),)) + name)
+    self.buf = bytearray()
+    self.flush_every = flush_every
+
+  def write(self, bits):
+    self.buf.append(bits)
+    if len(self.buf) >= self.flush_every: self.flush()
+
+  def flush(self):
+    self.file.write(self.buf)
+    self.file.flush()
+    self.buf.clear()
+
+  def close(self):
+    if self.file.closed: return
+    self.flush()
+    self.file.close()
+
+
+class Replay:
+  """ 読み込んだリプレイ (seed と入力バイト列、level は魔理沙の難易度) """
+  def __init__(self, seed, inputs, level=None):
+    self.seed = seed
+    self.inputs = inputs
+    self.level = level
+
+  @classmethod
+  def load(cls, path):
+    with open(path, "rb") as f:
+      data = f.read()
+    if len(data) < HEADER.size:
+      raise ValueError(f"{path}: リプレイファイルではありません")
+    magic, version, seed = HEADER.unpack_from(data)
+    if magic != MAGIC:
+      raise ValueError(f"{path}: リプレイファイルではありません")
+    if version not in (1, VERSION):
+      raise ValueError(f"{path}: 対応していないバージョンです ({version})")
+    start, level = HEADER.size, None
+    if version >= 2:
+      n = data[start] if len(data) > start else 0
+      level = data[start + 1:start + 1 + n].decode("ascii") or None
+      start += 1 + n
+    return cls(seed, data[start:], level)
+
+  def __len__(self):
+    return len(self.inputs)
+
+  def match(self, load_images=False):
+    """ このリプレイ用の Match (まだ進めていない状態) """
+    from main_game import Match
+    return Match(self.seed, load_images=load_images, marisa_level=self.level)
+
+  def run(self):
+    """ 描画なしで最後まで再生した Match を返す """
+    m = self.match()
+    for bits in self.inputs:
+      if m.over: break
+      m.step(bits)
+    return m
+
+
+def report(path):
+  """ 描画なしで最速再生して、結果と再生速度を表示する """
+  rep = Replay.load(path)
+  t = time.perf_counter()
+  m = rep.run()
+  elapsed = time.perf_counter() - t
+  result = f"{m.winner} WIN" if m.over else "未決着"
+  print(f"{path}: seed={rep.seed} level={rep.level or '-'} ticks={m.tick} {result} "
+        f"(霊夢 HP {m.reimu.hp}, 魔理沙 HP {m.marisa.hp}) "
+        f"{elapsed * 1000:.0f} ms, {m.tick / max(elapsed, 1e-9):,.0f} ticks/s")
+  return m
+
+
+def main():
+  os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+  for path in sys.argv[1:]:
+    report(path)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,96 @@
+""" 時間制限つきのビームサーチ (AI の先読み用)
+
+状態の中身は知らず、expand(state, action) -> 次の状態 と evaluate(state) -> 点数 だけを使う。
+深さ1から1段ずつ広げ、各段は点数の高い width 個だけを残す。run() は締め切り (または展開数)
+が来たところで止まり、続きは次の run() で再開する (何フレームかに分けて考えられる)。
+行動を決めたら advance(action) でその行動から始まる手順だけを残して根を1手進めるので、
+それまでの探索結果は次の判断にもそのまま使える。
+"""
+import time
+
+
+class Node:
+  __slots__ = ("score", "plan", "state")
+
+  def __init__(self, score, plan, state):
+    self.score = score
+    self.plan = plan     # 根からの行動の列 (tuple)
+    self.state = state   # plan をすべて行った後の状態
+
+
+class BeamSearch:
+  def __init__(self, expand, evaluate, actions, width=4, depth=3):
+    self.expand = expand
+    self.evaluate = evaluate
+    self.actions = tuple(actions)
+    self.width = width
+    self.depth = depth
+    self.expanded = 0   # これまでに展開した節点の数 (集計用)
+    self.clear()
+
+  def clear(self):
+    self.root = None
+    self.layers = []    # 深さごとの残した節点 (点数の高い順)。layers[0] は根だけ
+    self.pending = []   # 作りかけの段でまだ展開していない (親, 行動)
+    self.children = []  # 作りかけの段でできた節点
+
+  def reset(self, state, first=None):
+    """ state を根にして探索をやり直す (first の行動を最初に調べる) """
+    self.clear()
+    self.root = state
+    self.layers = [[Node(self.evaluate(state), (), state)]]
+    self._next_layer(first)
+
+  def _next_layer(self, first=None):
+    self.children = []
+    if len(self.layers) > self.depth:
+      self.pending = []
+      return
+    actions = self.actions
+    if first in actions:
+      actions = (first,) + tuple(a for a in actions if a != first)
+    self.pending = [(parent, a) for parent in self.layers[-1] for a in actions]
+    self.pending.reverse()   # 末尾から pop するので逆順にしておく
+
+  def done(self):
+    return self.root is None or not self.pending
+
+  def run(self, deadline_ns=None, max_nodes=None):
+    """ 締め切り (perf_counter_ns) か max_nodes 個の展開まで探索を進める """
+    n = 0
+    while self.pending:
+      if max_nodes is not None and n >= max_nodes: break
+      if deadline_ns is not None and time.perf_counter_ns() >= deadline_ns: break
+      parent, action = self.pending.pop()
+      state = self.expand(parent.state, action)
+      self.children.append(Node(self.evaluate(state), parent.plan + (action,), state))
+      n += 1
+      if not self.pending:
+        self.children.sort(key=lambda node: -node.score)
+        self.layers.append(self.children[:self.width])
+        self._next_layer()
+    self.expanded += n
+    return n
+
+  def best(self):
+    """ 調べ終わった一番深い段で最も点数の高い手順
+
+    深さ1の段も終わっていなければ、それまでに調べた手のうち最も良いもの (何も無ければ None)。
+    """
+    if len(self.layers) >= 2: return self.layers[-1][0].plan
+    if self.children: return max(self.children, key=lambda node: node.score).plan
+    return None
+
+  def advance(self, action):
+    """ 根で action を選んだことにして、その続きの探索結果だけを残す """
+    kept = []
+    for layer in self.layers[1:]:
+      nodes = [Node(node.score, node.plan[1:], node.state) for node in layer if node.plan[0] == action]
+      if not nodes: break   # ここから先の段には続きが残っていない
+      kept.append(nodes)
+    if not kept:
+      self.clear()
+      return
+    self.root = kept[0][0].state
+    self.layers = kept
+    self._next_layer()
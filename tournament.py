@@ -0,0 +1,210 @@
+""" AI パラメータのトーナメント (並列の総当たり / ランダムサンプル)
+
+魔理沙の AI パラメータ (AI_PARAMS) の組み合わせごとに、seed を変えた AI 同士の試合を
+画面なしで N 回ずつ回し、終わった試合から1行ずつ CSV に書き出す。
+試合は ProcessPoolExecutor でコア数だけ並列に回す。ワーカーが落ちても書き終えた行は残り、
+落ちたときに実行中だった試合だけを1つずつやり直して原因の試合を特定する。同じ出力ファイルを指定すると書き終えた試合は飛ばす。
+ただし再開できるのは設定の一覧 (出力名.configs) が前回と同じときだけで、違うときは上書きせずに止める。
+エラーで終わった試合は書き終えた扱いにせず、再開時にもう一度回す (CSV には両方の行が残る)。
+
+  python tournament.py --grid sp_prob=0.1,0.2,0.3 --grid dodge_prob=0.5,0.7 -n 50
+  python tournament.py --range normal_prob=0.4:0.9 --samples 20 -n 50 -o sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+import random
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+FIELDS = ("config", "seed", "winner", "ticks", "marisa_damage", "reimu_damage",
+          "marisa_fired", "reimu_fired")
+MAX_ATTEMPTS = 3   # プールごと落ちた試合をやり直す回数
+
+
+def play(config, params, seed, max_ticks):
+  """ 1試合を回して結果の1行を返す (ワーカープロセスで実行) """
+  from main_game import Match
+  m = Match(seed, load_images=False, reimu_ai=True, marisa_params=params).run(max_ticks)
+  winner = m.winner if m.over else "draw"
+  return {"config": config, "seed": seed, "winner": winner, "ticks": m.tick,
+          "marisa_damage": m.reimu.max_hp - m.reimu.hp,
+          "reimu_damage": m.marisa.max_hp - m.marisa.hp,
+          "marisa_fired": m.marisa.fired, "reimu_fired": m.reimu.fired}
+
+
+def parse_value(text):
+  return int(text) if text.lstrip("-").isdigit() else float(text)
+
+
+def parse_pairs(specs, known):
+  out = {}
+  for spec in specs:
+    key, sep, values = spec.partition("=")
+    if not sep or key not in known:
+      sys.exit(f"不明なパラメータ指定: {spec} (使えるキー: {', '.join(known)})")
+    out[key] = values
+  return out
+
+
+def make_configs(grid, ranges, samples, rng):
+  """ --grid の直積と、--range からの一様サンプルを組み合わせたパラメータのリスト """
+  keys = list(grid)
+  product = [dict(zip(keys, vals)) for vals in itertools.product(
+      *([parse_value(v) for v in grid[k].split(",")] for k in keys))]
+  if not ranges: return product
+
+  configs = []
+  for base in product:
+    for _ in range(samples):
+      params = dict(base)
+      for key, span in ranges.items():
+        lo, hi = (parse_value(v) for v in span.split(":"))
+        params[key] = rng.randint(lo, hi) if isinstance(lo, int) and isinstance(hi, int) \
+            else round(rng.uniform(lo, hi), 4)
+      configs.append(params)
+  return configs
+
+
+def load_done(path):
+  """ 既存の出力ファイルから、書き終えた (config, seed) と、エラーのまま終わっている (config, seed) を読む """
+  done, errors = set(), set()
+  if not os.path.exists(path): return done, errors
+  with open(path, newline="", encoding="utf-8") as f:
+    for r in csv.DictReader(f):
+      if not r.get("seed"): continue
+      key = (int(r["config"]), int(r["seed"]))
+      (errors if r["winner"].startswith("error:") else done).add(key)
+  return done, errors - done
+
+
+def save_configs(path, configs, resume):
+  """ 設定の一覧 (config 番号 -> パラメータ) を書く。resume なら前回の一覧と同じか確かめる
+
+  config 番号は一覧の中の位置でしかないので、違う一覧のまま再開すると別の設定の結果を混ぜてしまう。
+  """
+  text = "".join(f"{i}\t{params}\n" for i, params in enumerate(configs))
+  if resume:
+    old = None
+    if os.path.exists(path):
+      with open(path, encoding="utf-8") as f: old = f.read()
+    if old != text:
+      sys.exit(f"{path} が今回の設定と違う (または無い) ので再開できない。"
+               "別の出力ファイル (-o) を指定する")
+    return
+  with open(path, "w", encoding="utf-8") as f:
+    f.write(text)
+
+
+def main():
+  from main_game import AI_PARAMS
+
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2,..",
+                      help="総当たりで試す値")
+  parser.add_argument("--range", action="append", default=[], metavar="KEY=LO:HI",
+                      help="一様分布から --samples 回サンプルする範囲")
+  parser.add_argument("--samples", type=int, default=10)
+  parser.add_argument("-n", "--matches", type=int, default=20, help="設定ごとの試合数")
+  parser.add_argument("--max-ticks", type=int, default=40 * 60 * 5)
+  parser.add_argument("--seed", type=int, default=0, help="試合 seed の開始値")
+  parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+  parser.add_argument("-o", "--out", default="tournament.csv")
+  args = parser.parse_args()
+
+  grid = parse_pairs(args.grid, AI_PARAMS)
+  ranges = parse_pairs(args.range, AI_PARAMS)
+  configs = make_configs(grid, ranges, args.samples, random.Random(args.seed))
+
+  # 設定の一覧は出力の横に置く。書き終えた行があれば、同じ一覧のときだけ続きから回す
+  done, errors = load_done(args.out)
+  save_configs(args.out + ".configs", configs, resume=bool(done or errors))
+
+  # 全設定で同じ seed 列を使うので、設定間の差が乱数の差に埋もれにくい
+  pending = {(c, s): 0 for c in range(len(configs))
+             for s in range(args.seed, args.seed + args.matches) if (c, s) not in done}
+  total = len(configs) * args.matches
+  retry = len(errors.intersection(pending))
+  if retry: print(f"retrying {retry} matches that ended with an error")
+  print(f"{len(configs)} configs x {args.matches} matches, {len(pending)} to run "
+        f"on {args.workers} workers -> {args.out}")
+
+  new_file = not os.path.exists(args.out) or os.path.getsize(args.out) == 0
+  with open(args.out, "a", newline="", encoding="utf-8") as f:
+    writer = csv.DictWriter(f, FIELDS)
+    if new_file: writer.writeheader()
+    progress = [total - len(pending)]
+
+    def record(row):
+      writer.writerow(row)
+      f.flush()
+      del pending[(row["config"], row["seed"])]
+      progress[0] += 1
+      if progress[0] % 100 == 0 or progress[0] == total:
+        print(f"  {progress[0]}/{total}", flush=True)
+
+    def run(keys, workers):
+      """ keys を並列に回す。プールが落ちたら、そのとき投入済みだった試合を返す
+
+      投入するのは常にワーカー数の2倍までなので、落ちたときに疑う試合も少なくて済む。
+      """
+      queue = list(keys)
+      with ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        while queue or futures:
+          while queue and len(futures) < workers * 2:
+            c, s = queue.pop()
+            futures[pool.submit(play, c, configs[c], s, args.max_ticks)] = (c, s)
+          done, _ = wait(futures, return_when=FIRST_COMPLETED)
+          for fut in done:
+            c, s = futures[fut]
+            try:
+              row = fut.result()
+            except BrokenProcessPool:
+              return list(futures.values())
+            except Exception as e:   # 試合中の例外はその試合だけ記録して続ける
+              row = {"config": c, "seed": s, "winner": f"error: {e!r}"}
+            del futures[fut]
+            record(row)
+      return []
+
+    while pending:
+      fresh = [k for k, n in pending.items() if n == 0]
+      if fresh:
+        suspects = run(fresh, args.workers)
+        for key in suspects: pending[key] += 1
+        if suspects: print(f"  worker crashed, isolating {len(suspects)} matches", flush=True)
+        continue
+
+      # 落ちたときに投入済みだった試合は1つずつ別プロセスで回して、原因の試合だけを外す
+      for key in list(pending):
+        if run([key], 1):
+          pending[key] += 1
+          if pending[key] >= MAX_ATTEMPTS:
+            record({"config": key[0], "seed": key[1], "winner": "error: worker crashed"})
+
+  summarize(args.out, configs)
+
+
+def summarize(path, configs):
+  """ 設定ごとの魔理沙の勝率と平均試合時間を表示 """
+  stats = {}
+  with open(path, newline="", encoding="utf-8") as f:
+    for r in csv.DictReader(f):
+      if not r["ticks"]: continue
+      s = stats.setdefault(int(r["config"]), [0, 0, 0])
+      s[0] += 1
+      s[1] += r["winner"] == "魔理沙"
+      s[2] += int(r["ticks"])
+  print(f"{'config':>6} {'matches':>7} {'marisa win':>10} {'avg ticks':>9}  params")
+  for c, (n, wins, ticks) in sorted(stats.items(), key=lambda kv: -kv[1][1] / kv[1][0]):
+    params = configs[c] if c < len(configs) else "?"
+    print(f"{c:>6} {n:>7} {wins / n:>10.2%} {ticks / n:>9.0f}  {params}")
+
+
+if __name__ == "__main__":
+  main()
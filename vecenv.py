@@ -0,0 +1,475 @@
+""" K 試合をまとめて1回の配列演算で進める学習・評価用の環境 (画面なし)
+
+霊夢をプレイヤーのボット、魔理沙を組み込みの AI (AI.think と同じ判断) として、
+K 個の独立した試合の状態 (位置・移動・向き・HP・クールタイム・無敵時間・覚醒・弾) を
+共有の配列に持つ。step(actions) は K 試合を1フレームずつ進め、観測・報酬・終了フラグを返す。
+終わった試合はその場で初めからやり直す (auto-reset)。
+
+Match との違い:
+  - 乱数は numpy の Generator を使うので、同じ seed でも Match と同じ試合にはならない
+    (判断の規則と確率は同じ)。
+  - 決着したらすぐ終了にする (撃破演出の 80 フレームは回さない)。
+  - SP のパターンはすぐに撃つ wave だけのもの (delay 0) に限る。
+
+  env = VecMatch(1024, seed=0)
+  grid, scalars = env.reset()
+  (grid, scalars), reward, done = env.step(actions)   # actions は霊夢の入力ビット (k,)
+"""
+import numpy as np
+
+from main_game import (AI_PARAMS, BT_N, BT_STAR, BULLET_TYPES, CHIP, IN_SHOT, IN_SP,
+                       INVINCIBLE_TICKS, MACRO_TICKS, MAP_SIZE, MOVE_BITS, MOVE_VECS, PATTERNS,
+                       SP_PATTERNS, Match, bullet_params)
+
+REIMU, MARISA = 0, 1
+MOVES = np.array([(v.x, v.y) for v in MOVE_VECS], np.int32)   # 上・右・下・左
+NEIGHBORS = np.concatenate(([(0, 0)], MOVES))                     # その場と上・右・下・左
+COLS, ROWS = int(MAP_SIZE.x), int(MAP_SIZE.y)
+HORIZON = 16   # 危険度を見るフレーム数 (DangerField の既定値と同じ)
+
+# 観測: grid は (k, 4, ROWS, COLS) の uint8 (霊夢・魔理沙のいるマス、魔理沙・霊夢の弾の数)、
+# scalars は (k, len(OBS_SCALARS)) の float32 (0..1 に正規化した値)
+OBS_CHANNELS = ("reimu", "marisa", "marisa_bullets", "reimu_bullets")
+OBS_SCALARS = ("reimu_hp", "marisa_hp", "reimu_cool", "marisa_cool", "reimu_inv", "marisa_inv",
+               "reimu_step", "marisa_step", "marisa_awake",
+               "reimu_up", "reimu_right", "reimu_down", "reimu_left", "time")
+
+
+class VecMatch:
+  """ K 試合分の状態。キャラの値は (k, 2) (番号 0 が霊夢、1 が魔理沙)、弾は全試合で1つの構造体配列 """
+  FIELDS = ("pos", "direction", "speed", "timer", "life_time", "homing", "damage", "btype",
+            "owner", "match")
+
+  def __init__(self, k, seed=None, marisa_params=None, max_ticks=40 * 60 * 5, capacity=1024):
+    self.k = k
+    self.rng = np.random.default_rng(seed)
+    self.params = {**AI_PARAMS, **(marisa_params or {})}
+    self.max_ticks = max_ticks
+
+    # 初期配置・HP・向きは Match と同じものを使う
+    proto = Match(0, load_images=False)
+    chars = (proto.reimu, proto.marisa)
+    self.names = tuple(c.name for c in chars)
+    self.start_pos = np.array([(c.pos.x, c.pos.y) for c in chars], np.int32)
+    self.start_dir = np.array([c.dir for c in chars], np.int8)
+    self.max_hp = np.array([c.max_hp for c in chars], np.int32)
+
+    self.sp = []   # キャラごとの SP のパターン (通常, 覚醒)
+    for name in self.names:
+      pattern = PATTERNS.get(SP_PATTERNS[name])
+      for p in (pattern, pattern.awake):
+        if any(delay > 0 for delay, _, _ in p.schedule):
+          raise ValueError(f"{p.name}: 遅れて撃つ wave のあるパターンは VecMatch では使えません")
+      self.sp.append((pattern, pattern.awake))
+
+    self.pos = np.zeros((k, 2, 2), np.int32)    # マス (移動中は移動前のマス)
+    self.move = np.zeros((k, 2, 2), np.int32)   # 移動中の向き (止まっていれば 0)
+    self.step_count = np.zeros((k, 2), np.int32)   # 移動を始めてから進んだフレーム数
+    self.dir = np.zeros((k, 2), np.int8)
+    self.hp = np.zeros((k, 2), np.int32)
+    self.cool = np.zeros((k, 2), np.int32)
+    self.inv = np.zeros((k, 2), np.int32)
+    self.awake = np.zeros((k, 2), bool)
+    self.wait = np.zeros(k, np.int32)      # 魔理沙の考える間隔のタイマー (AI.wait_timer)
+    self.tick = np.zeros(k, np.int32)
+    self.winner = np.full(k, -1, np.int8)  # 最後に終わった試合の勝者 (0 霊夢 / 1 魔理沙 / -1 時間切れ)
+    self.lost = np.zeros((k, 2), np.int32)  # 直前の step で減った HP
+    self.eta = np.zeros((k, 5), np.int32)   # 魔理沙のマスと上下左右の危険度 (_danger)
+    self.count = 0
+    self._alloc(capacity)
+    self._restart(np.arange(k))
+
+  # --- 弾の配列 (BulletPool と同じく生きている弾を先頭に詰めて持つ) ---
+  def _alloc(self, capacity):
+    self.capacity = capacity
+    self.b_pos = np.zeros((capacity, 2))
+    self.b_direction = np.zeros((capacity, 2))
+    self.b_speed = np.zeros(capacity)
+    self.b_timer = np.zeros(capacity, np.int32)
+    self.b_life_time = np.zeros(capacity, np.int32)
+    self.b_homing = np.zeros(capacity)
+    self.b_damage = np.zeros(capacity, np.int32)
+    self.b_btype = np.zeros(capacity, np.int8)
+    self.b_owner = np.zeros(capacity, np.intp)
+    self.b_match = np.zeros(capacity, np.intp)
+
+  def _grow(self, need):
+    capacity = self.capacity
+    while capacity < need: capacity *= 2
+    old = {f: getattr(self, "b_" + f)[:self.count] for f in self.FIELDS}
+    self._alloc(capacity)
+    for f, arr in old.items():
+      getattr(self, "b_" + f)[:self.count] = arr
+
+  def _remove(self, dead):
+    """ 消える弾 (bool マスク) を末尾の弾と入れ替えて詰める """
+    n_dead = int(np.count_nonzero(dead))
+    if n_dead == 0: return
+    k = self.count - n_dead
+    holes = np.flatnonzero(dead[:k])
+    movers = k + np.flatnonzero(~dead[k:])
+    for f in self.FIELDS:
+      arr = getattr(self, "b_" + f)
+      arr[holes] = arr[movers]
+    self.count = k
+
+  def _spawn(self, m, side, btype, d, speeds, awake, life_time=None, homing=None):
+    """ 試合 m (j,) のキャラ side から、向き d (j, c, 2) の弾を c 発ずつ追加する
+
+    speeds は (j, c) の配列か None (弾の種類の既定値)。life_time / homing は上書きする値
+    (通常弾は相手を狙わないので homing=0 で呼ぶ)。
+    """
+    j, c = d.shape[:2]
+    n = j * c
+    if n == 0: return
+    if self.count + n > self.capacity: self._grow(self.count + n)
+    d = d.reshape(n, 2).astype(float)
+    length = np.hypot(d[:, 0], d[:, 1])
+    zero = length == 0
+    d[zero] = (0, 1)
+    length[zero] = 1
+
+    speed, damage, life, h = bullet_params(btype, self.names[side], awake)
+    s = slice(self.count, self.count + n)
+    self.b_pos[s] = np.repeat(self.pos[m, side] + 0.5, c, axis=0)
+    self.b_direction[s] = d / length[:, None]
+    self.b_speed[s] = speed if speeds is None else speeds.reshape(n)
+    self.b_timer[s] = 0
+    self.b_life_time[s] = life if life_time is None else life_time
+    self.b_homing[s] = h if homing is None else homing
+    self.b_damage[s] = damage
+    self.b_btype[s] = btype
+    self.b_owner[s] = side
+    self.b_match[s] = np.repeat(m, c)
+    self.count += n
+
+  # --- 試合の開始 ---
+  def reset(self, mask=None):
+    """ mask の試合 (省略時は全部) を初めからにして観測を返す """
+    self._restart(np.arange(self.k) if mask is None else np.flatnonzero(mask))
+    return self.observe()
+
+  def _restart(self, m):
+    if len(m):
+      self.pos[m] = self.start_pos
+      self.move[m] = 0
+      self.step_count[m] = 0
+      self.dir[m] = self.start_dir
+      self.hp[m] = self.max_hp
+      self.cool[m] = 0
+      self.inv[m] = 0
+      self.awake[m] = False
+      self.wait[m] = 0
+      self.tick[m] = 0
+      if self.count:
+        gone = np.zeros(self.k, bool)
+        gone[m] = True
+        self._remove(gone[self.b_match[:self.count]])
+
+  # --- 1フレーム ---
+  def step(self, actions):
+    """ 霊夢の入力ビット actions (k,) で全試合を1フレーム進める
+
+    (観測, 報酬, 終了フラグ) を返す。報酬は霊夢から見た (与えたダメージ - 受けたダメージ)。
+    終わった試合は winner に勝者を入れてから初めに戻すので、観測は次の試合の最初のものになる。
+    """
+    actions = np.asarray(actions)
+    self.tick += 1
+    self._control(actions)
+    self._update_char(REIMU)
+    self._think()
+    self._update_char(MARISA)
+    self._update_bullets()
+    hp = self.hp.copy()
+    self._collide()
+
+    self.lost = lost = hp - self.hp
+    reward = (lost[:, MARISA] - lost[:, REIMU]).astype(np.float32)
+    dead = self.hp <= 0
+    done = dead.any(axis=1) | (self.tick >= self.max_ticks)
+    if done.any():
+      self.winner[done] = np.where(dead[done, MARISA], REIMU,
+                                   np.where(dead[done, REIMU], MARISA, -1))
+      self._restart(np.flatnonzero(done))
+    return self.observe(), reward, done
+
+  def _control(self, bits):
+    """ control() と同じ入力処理 (移動は1マス単位、相手のマスには入れない) """
+    idle = ~self.move[:, REIMU].any(axis=1)
+    mv = np.full(self.k, -1)
+    for i, bit in enumerate(MOVE_BITS):
+      mv[(bits & bit) != 0] = i   # 同時押しは後ろが優先
+    m = np.flatnonzero(idle & (mv >= 0))
+    if len(m):
+      self.dir[m, REIMU] = mv[m]
+      nxt = self.pos[m, REIMU] + MOVES[mv[m]]
+      ok = (self._inside(nxt) & (nxt != self.pos[m, MARISA]).any(axis=1))
+      self.move[m[ok], REIMU] = MOVES[mv[m[ok]]]
+
+    facing = MOVES[self.dir[:, REIMU]]
+    self._shoot(REIMU, (bits & IN_SHOT) != 0, facing)
+    self._shoot(REIMU, (bits & IN_SP) != 0, facing, sp=True)
+
+  def _update_char(self, side):
+    """ Char.update と無敵時間の経過 (クールタイムを減らし、移動を1フレーム進める) """
+    cool = self.cool[:, side]
+    cool[cool > 0] -= 1
+    moving = self.move[:, side].any(axis=1)
+    self.step_count[moving, side] += 1
+    arrived = np.flatnonzero(self.step_count[:, side] >= MACRO_TICKS)
+    self.pos[arrived, side] += self.move[arrived, side]
+    self.move[arrived, side] = 0
+    self.step_count[arrived, side] = 0
+    inv = self.inv[:, side]
+    inv[inv > 0] -= 1
+
+  def _shoot(self, side, mask, vec, sp=False):
+    """ Char.shoot と同じ (クールタイム中の試合は撃たない)。vec は (k, 2) の撃つ向き """
+    m = np.flatnonzero(mask & (self.cool[:, side] == 0))
+    if len(m) == 0: return
+    awake = self.awake[m, side]
+    mult = np.where(awake, 0.7, 1.0)
+    if not sp:
+      self.cool[m, side] = (8 * mult).astype(np.int32)
+      for a in (False, True):
+        g = m[awake == a]
+        self._spawn(g, side, BT_N, vec[g][:, None, :], None, a, homing=0)
+      return
+    for a in (False, True):
+      g = m[awake == a]
+      if len(g) == 0: continue
+      pattern = self.sp[side][a]
+      self.cool[g, side] = int(pattern.cooldown * (0.7 if a else 1.0))
+      self._emit(g, side, pattern, vec[g], a)
+
+  def _emit(self, m, side, pattern, vec, awake):
+    """ パターンのすぐに撃つ wave を試合 m 全部に一度に撃つ (Char.emit と同じ向きの決め方) """
+    btype = BULLET_TYPES[pattern.btype]
+    facing = np.degrees(np.arctan2(vec[:, 1], vec[:, 0]))
+    diff = self.pos[m, 1 - side] - self.pos[m, side]
+    toward = np.degrees(np.arctan2(diff[:, 1], diff[:, 0]))
+    for _, e, wave in pattern.schedule:
+      base = (np.full(len(m), e.angle) if e.aim == "fixed" else
+              toward if e.aim == "target" else facing)
+      if e.table is None:
+        spread = self.rng.uniform(-e.spread, e.spread, (len(m), e.count))
+        rad = np.radians(base[:, None] + wave * e.turn + spread)
+        d = np.stack((np.cos(rad), np.sin(rad)), axis=-1)
+      else:
+        rad = np.radians(base)[:, None]
+        c, s = np.cos(rad), np.sin(rad)
+        t = e.table[wave]
+        d = np.stack((t[:, 0] * c - t[:, 1] * s, t[:, 0] * s + t[:, 1] * c), axis=-1)
+      if e.speed_range:
+        speeds = self.rng.uniform(*e.speed_range, (len(m), e.count))
+      elif e.speed is not None:
+        speeds = np.full((len(m), e.count), e.speed)
+      else:
+        speeds = None
+      self._spawn(m, side, btype, d, speeds, awake, e.life, e.homing)
+
+  # --- 魔理沙の AI ---
+  def _param(self, key):
+    """ 魔理沙の覚醒状態に応じたパラメータ (k,) """
+    p = self.params
+    return np.where(self.awake[:, MARISA], p.get(key + "_awake", p[key]), p[key])
+
+  def _danger(self, mask):
+    """ mask の試合で、魔理沙のマスと上下左右のマスに霊夢の弾があと何フレームで来るか (k, 5)
+
+    DangerField と同じく弾は今の向き・速さのまま進むものとし、horizon 以内に来なければ
+    horizon + 1、マップの外は 0 (入れない)。マップ全体の表は作らず、弾ごとに5マスそれぞれへ
+    入る最初のフレームを直線とマスの交差 (軸ごとの入る時刻・出る時刻) で直接求める。
+    """
+    eta = self.eta
+    eta.fill(HORIZON + 1)
+    n = self.count
+    sel = np.flatnonzero(mask[self.b_match[:n]] & (self.b_owner[:n] == REIMU))
+    if len(sel):
+      last = np.minimum(self.b_life_time[sel] - self.b_timer[sel], HORIZON)
+      v = self.b_direction[sel] * self.b_speed[sel, None]
+      # 先に上下左右を囲む3x3マスを通らない弾を除いておく
+      box = self.pos[self.b_match[sel], MARISA] - 1
+      enter, leave = _crossing(box - self.b_pos[sel], v, 3)
+      near = np.flatnonzero((enter < leave + 1e-6) & (enter <= last + 1e-6))
+      sel, last, v = sel[near], last[near], v[near]
+      match = self.b_match[sel]
+      cells = self.pos[match, MARISA][:, None, :] + NEIGHBORS          # (j, 5, 2)
+      enter, leave = _crossing(cells - self.b_pos[sel][:, None, :], v[:, None, :], 1)
+      b, c = np.nonzero((enter < leave + 1e-6) & (enter <= last[:, None] + 1e-6))
+      # 境目ちょうどの丸めで1フレームずれないよう、候補の2フレームを位置から確かめる
+      t = np.maximum(np.ceil(enter[b, c] - 1e-6), 0)
+      p, v, cell = self.b_pos[sel][b], v[b], cells[b, c]
+      for dt in (0, 1):
+        ok = ((np.floor(p + v * (t + dt)[:, None]) == cell).all(axis=1) & (t + dt <= last[b]))
+        np.minimum.at(eta, (match[b[ok]], c[ok]), (t[ok] + dt).astype(np.int32))
+    cells = self.pos[:, MARISA][:, None, :] + NEIGHBORS
+    eta[~self._inside(cells.reshape(-1, 2)).reshape(self.k, 5)] = 0
+    return eta
+
+  def _think(self):
+    """ AI.think を全試合まとめて行う """
+    hp = self.hp[:, MARISA]
+    self.awake[:, MARISA] = hp <= self.max_hp[MARISA] * self.params["awaken_hp"]
+    idle = ~self.move[:, MARISA].any(axis=1)
+    margin = self._param("danger_ticks")
+    watch = idle & (margin > 0)
+
+    # 敵の弾がすぐ来るマスにいるなら、一番安全な隣へ逃げる
+    evading = np.zeros(self.k, bool)
+    if watch.any():
+      self._danger(watch)
+      m = np.flatnonzero(watch)
+      here, near = self.eta[m, 0], self.eta[m, 1:]
+      best = near.argmax(axis=1)   # 同点なら 上・右・下・左 の順で先のもの
+      go = (here <= margin[m]) & (near[np.arange(len(m)), best] > here)
+      g, best = m[go], best[go]
+      self.dir[g, MARISA] = best
+      self.move[g, MARISA] = MOVES[best]
+      self.wait[g] = 0
+      evading[g] = True
+
+    rest = idle & ~evading
+    self.wait[rest] += 1
+    decide = rest & (self.wait >= self._param("think_threshold"))
+    self.wait[decide] = 0
+    m = np.flatnonzero(decide)
+    if len(m): self._decide(m, margin[m])
+
+  def _decide(self, m, margin):
+    """ AI.think の考える間隔が来た試合 m の判断 (SP・通常弾・移動) """
+    me, foe = self.pos[m, MARISA], self.pos[m, REIMU]
+    diff = foe - me
+    dx, dy = diff[:, 0], diff[:, 1]
+    aligned = (np.abs(dx) < 0.5) | (np.abs(dy) < 0.5)
+    toward = np.where(np.abs(dx) > np.abs(dy), np.where(dx > 0, 1, 3), np.where(dy > 0, 2, 0))
+    r = self.rng.random((len(m), 4))
+
+    sp = (np.hypot(dx, dy) < 8) & (r[:, 0] < self._param("sp_prob")[m])
+    self.dir[m[sp], MARISA] = toward[sp]
+    vec = np.zeros((self.k, 2))
+    vec[m[sp]] = MOVES[toward[sp]]
+    mask = np.zeros(self.k, bool)
+    mask[m[sp]] = True
+    self._shoot(MARISA, mask, vec, sp=True)
+
+    normal = ~sp & aligned & (r[:, 1] < self._param("normal_prob")[m])
+    vec[m[normal]] = diff[normal]
+    mask[:] = False
+    mask[m[normal]] = True
+    self._shoot(MARISA, mask, vec)
+    self.dir[m[normal], MARISA] = np.where(dy[normal] > 0, 2, np.where(
+        dy[normal] < 0, 0, np.where(dx[normal] > 0, 1, 3)))
+
+    walk = ~sp & ~normal
+    dodge = aligned & (r[:, 2] < self._param("dodge_prob")[m])
+    idx = np.where(dodge, np.where(np.abs(dx) < 0.5, np.where(me[:, 1] < foe[:, 1], 2, 0),
+                                   np.where(me[:, 0] < foe[:, 0], 1, 3)),
+                   np.where(r[:, 3] < 0.7, toward, self.rng.integers(0, 4, len(m))))
+    nxt = me + MOVES[idx]
+    safe = (margin <= 0) | (self.eta[m, 1 + idx] > margin)   # 弾が来るマスには自分から入らない
+    go = walk & safe & self._inside(nxt)
+    self.dir[m[go], MARISA] = idx[go]
+    self.move[m[go], MARISA] = MOVES[idx[go]]
+
+  # --- 弾 ---
+  def _update_bullets(self):
+    """ BulletPool.update と同じ (ホーミング -> 移動 -> 寿命・画面外の弾を消す) """
+    n = self.count
+    if n == 0: return
+    pos, d = self.b_pos[:n], self.b_direction[:n]
+    h = np.flatnonzero(self.b_homing[:n] > 0)
+    if len(h):
+      target = self.pos[self.b_match[h], 1 - self.b_owner[h]]
+      diff = target - pos[h]
+      dist = np.hypot(diff[:, 0], diff[:, 1])
+      ok = dist > 0
+      h, diff, dist = h[ok], diff[ok], dist[ok]
+      cur = d[h]
+      steer = cur + (diff / dist[:, None] - cur) * self.b_homing[h, None]
+      norm = np.hypot(steer[:, 0], steer[:, 1])
+      norm[norm == 0] = 1
+      d[h] = steer / norm[:, None]
+    pos += d * self.b_speed[:n, None]
+    self.b_timer[:n] += 1
+
+    margin = 2
+    dead = ((self.b_timer[:n] > self.b_life_time[:n]) |
+            (pos[:, 0] < -margin) | (pos[:, 0] > COLS + margin) |
+            (pos[:, 1] < -margin) | (pos[:, 1] > ROWS + margin))
+    self._remove(dead)
+
+  def _collide(self):
+    """ Match.step の当たり判定 (当たった弾は消え、無敵時間外なら HP を減らす) """
+    n = self.count
+    if n == 0: return
+    match, defender = self.b_match[:n], 1 - self.b_owner[:n]
+    px = self.pos * CHIP + self.move * self.step_count[..., None] * 8
+    box = px[match, defender] + 12   # キャラの当たり判定 (左上、一辺 CHIP - 24)
+    side = CHIP - 24
+    size = np.where(self.b_btype[:n] == BT_STAR, 20, 12)
+    corner = np.trunc(self.b_pos[:n] * CHIP - size[:, None] / 2)
+    touch = ((corner < box + side) & (box < corner + size[:, None])).all(axis=1)
+    hit = np.flatnonzero(touch)
+    if len(hit) == 0: return
+    damage = np.zeros((self.k, 2), np.int32)
+    damage[match[hit], defender[hit]] = self.b_damage[hit]
+    damage[self.inv > 0] = 0
+    struck = damage > 0
+    self.hp -= damage
+    np.maximum(self.hp, 0, out=self.hp)
+    self.inv[struck] = INVINCIBLE_TICKS
+    self._remove(touch)
+
+  @staticmethod
+  def _inside(cell):
+    return ((cell[:, 0] >= 0) & (cell[:, 0] < COLS) & (cell[:, 1] >= 0) & (cell[:, 1] < ROWS))
+
+  # --- 観測 ---
+  def observe(self):
+    """ (grid, scalars) を返す (中身は OBS_CHANNELS / OBS_SCALARS の順) """
+    k = self.k
+    cells = ROWS * COLS
+    channels = len(OBS_CHANNELS)
+    grid = np.zeros(k * channels * cells, np.uint8)
+    ar = np.arange(k)
+    for side in (REIMU, MARISA):
+      p = self.pos[:, side]
+      grid[(ar * channels + side) * cells + p[:, 1] * COLS + p[:, 0]] = 1
+    n = self.count
+    if n:
+      cell = np.floor(self.b_pos[:n]).astype(np.intp)
+      inside = self._inside(cell)
+      ch = np.where(self.b_owner[:n] == MARISA, 2, 3)
+      idx = (self.b_match[:n] * channels + ch) * cells + cell[:, 1] * COLS + cell[:, 0]
+      idx, counts = np.unique(idx[inside], return_counts=True)
+      grid[idx] = np.minimum(counts, 255)
+    grid = grid.reshape(k, channels, ROWS, COLS)
+
+    sp_cool = max(p.cooldown for pair in self.sp for p in pair)
+    scalars = np.empty((k, len(OBS_SCALARS)), np.float32)
+    scalars[:, 0:2] = self.hp / self.max_hp
+    scalars[:, 2:4] = np.minimum(self.cool / sp_cool, 1)
+    scalars[:, 4:6] = self.inv / INVINCIBLE_TICKS
+    scalars[:, 6:8] = self.step_count / MACRO_TICKS
+    scalars[:, 8] = self.awake[:, MARISA]
+    scalars[:, 9:13] = self.dir[:, REIMU, None] == np.arange(4)
+    scalars[:, 13] = self.tick / self.max_ticks
+    return grid, scalars
+
+
+def _crossing(rel, v, size):
+  """ 速度 v で直線に進む点が、自分から見て rel を左上とする一辺 size の正方形に入る時刻と出る時刻
+
+  止まっている軸はごく小さい速さとして扱う (範囲の中なら入る時刻が 0 以下・出る時刻がとても先になる)。
+  """
+  v = np.where(v == 0, 1e-12, v)
+  a = rel / v
+  b = (rel + size) / v
+  t0, t1 = np.minimum(a, b), np.maximum(a, b)
+  return np.maximum(t0[..., 0], t0[..., 1]), np.minimum(t1[..., 0], t1[..., 1])
+
+
+def random_policy(rng, k):
+  """ 入力ビットを一様に選ぶだけのボット (ベンチマーク・動作確認用) """
+  return rng.integers(0, 64, k)